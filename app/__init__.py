@@ -1,13 +1,66 @@
 from flask import Flask
 import os
+import tempfile
+import threading
 from firebase_config import get_db
 
-SECRET_KEY = os.urandom(24)
+SECRET_KEY_FILE = os.environ.get('URS_SECRET_KEY_FILE', os.path.join(tempfile.gettempdir(), 'urs-secret-key'))
+
+
+def load_secret_key():
+    # Every worker must sign sessions with the same key, or a session cookie
+    # only works on the worker that issued it. Production sets SECRET_KEY;
+    # otherwise the processes on this host share one generated key file
+    key = os.environ.get('SECRET_KEY')
+    if key:
+        return key
+    print("SECRET_KEY is not set; using a key shared only by processes on this host")
+    try:
+        tmp_path = f"{SECRET_KEY_FILE}.{os.getpid()}"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        try:
+            # link() fails if another process created the file first
+            os.link(tmp_path, SECRET_KEY_FILE)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+        with open(SECRET_KEY_FILE, 'rb') as f:
+            return f.read()
+    except OSError as e:
+        print(f"Could not share the secret key: {e}")
+        return os.urandom(32)
+
+
+SECRET_KEY = load_secret_key()
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 
-# Get database instance
-db = get_db()
+# Repositories connect on first use, so importing the app (e.g. in a
+# gunicorn --preload master) creates no Firestore client; each worker builds
+# its own after fork
+from app.repositories import Repositories
+repos = Repositories(connect=get_db)
 
 # Import routes after app initialization
-from app import routes
\ No newline at end of file
+from app import routes, commands, events, instrumentation, assets
+
+_warmed_pid = None
+_warm_lock = threading.Lock()
+
+@app.before_request
+def warm_worker():
+    # Load vendor policies into this worker's cache in the background on its
+    # first request, rather than at import time before the fork
+    global _warmed_pid
+    if _warmed_pid == os.getpid():
+        return
+    with _warm_lock:
+        if _warmed_pid == os.getpid():
+            return
+        _warmed_pid = os.getpid()
+    threading.Thread(target=repos.policies.warm, name='policy-warm', daemon=True).start()
+    # Join the host's event fan-out so sales from other workers reach this one
+    events.hub.start()
@@ -0,0 +1,101 @@
+"""Vectorized analytics over a window of daily rollups.
+
+The window's rollups are loaded once into per-day numpy columns (sales,
+transaction counts, points, a days x 24 hourly matrix and the union of the
+customer sketches) and every metric is an array operation over those
+columns. The cost grows with the number of days, never with the number of
+transactions, so ``days`` can go up to MAX_DAYS.
+
+numpy and pandas are imported on first use so they stay off worker boot.
+"""
+from app import rollups
+
+MAX_DAYS = 365
+ROLLING_DAYS = 7
+
+
+class DailyFrame:
+    """Columns for one vendor's analytics window, one row per day."""
+
+    def __init__(self, dates, sales, transactions, points_earned, points_redeemed, hourly, customer_buckets):
+        self.dates = dates
+        self.sales = sales
+        self.transactions = transactions
+        self.points_earned = points_earned
+        self.points_redeemed = points_redeemed
+        self.hourly = hourly
+        self.customer_buckets = customer_buckets
+
+    @classmethod
+    def from_rollups(cls, days, daily_rollups):
+        """Build the columns from ``rollups.load_rollups`` output for ``days``."""
+        import numpy as np
+
+        count = len(days)
+        dates = [rollups.day_key(day) for day in days]
+        sales = np.zeros(count)
+        transactions = np.zeros(count, dtype=np.int64)
+        points_earned = np.zeros(count)
+        points_redeemed = np.zeros(count)
+        hourly = np.zeros((count, 24), dtype=np.int64)
+        customer_buckets = np.zeros(rollups.SKETCH_BUCKETS, dtype=bool)
+
+        for i, date_str in enumerate(dates):
+            rollup = daily_rollups.get(date_str)
+            if not rollup:
+                continue
+            sales[i] = rollup.get('sales', 0)
+            transactions[i] = rollup.get('transaction_count', 0)
+            points_earned[i] = rollup.get('points_earned', 0)
+            points_redeemed[i] = rollup.get('points_redeemed', 0)
+            for hour, hour_count in rollup.get('hourly', {}).items():
+                hourly[i, int(hour)] = hour_count
+            customer_buckets[rollup.get('customer_buckets', [])] = True
+
+        return cls(dates, sales, transactions, points_earned, points_redeemed, hourly, customer_buckets)
+
+    def rolling_sales(self, window=ROLLING_DAYS):
+        """Trailing mean of daily sales over ``window`` days."""
+        import pandas as pd
+
+        return pd.Series(self.sales).rolling(window, min_periods=1).mean().to_numpy()
+
+    def summary(self):
+        """The /api/analytics payload."""
+        import numpy as np
+
+        total_amount = float(self.sales.sum())
+        total_transactions = int(self.transactions.sum())
+        total_earned = float(self.points_earned.sum())
+        total_redeemed = float(self.points_redeemed.sum())
+        unique_customers = rollups.estimate_distinct(np.flatnonzero(self.customer_buckets))
+
+        active = self.transactions > 0
+        hourly_totals = self.hourly.sum(axis=0)
+
+        avg_transaction = total_amount / unique_customers if unique_customers else 0
+        # Share of the window's transactions made by a customer who had
+        # already bought in it (the sketch only knows distinct customers)
+        repeat_rate = 1 - unique_customers / total_transactions if total_transactions else 0
+        redemption_ratio = total_redeemed / total_earned if total_earned else 0
+
+        return {
+            'daily_sales': dict(zip(self.dates, self.sales.tolist())),
+            'points_metrics': {
+                'total_earned': round(total_earned, 2),
+                'total_redeemed': round(total_redeemed, 2)
+            },
+            'unique_customers': unique_customers,
+            'customer_activity': dict(zip(np.asarray(self.dates)[active].tolist(),
+                                          self.transactions[active].tolist())),
+            'hourly_distribution': {str(hour).zfill(2): int(count) for hour, count in enumerate(hourly_totals)},
+            'avg_transaction': round(avg_transaction, 2),
+            'transaction_count': total_transactions,
+            'repeat_customer_rate': round(max(repeat_rate, 0), 4),
+            'redemption_ratio': round(redemption_ratio, 4),
+            'rolling_avg_sales': dict(zip(self.dates, np.round(self.rolling_sales(), 2).tolist()))
+        }
+
+
+def summarize(days, daily_rollups):
+    return DailyFrame.from_rollups(days, daily_rollups).summary()
@@ -0,0 +1,128 @@
+"""Fingerprinted, precompressed static assets.
+
+On first use in each process, every file under ``app/static`` is copied to
+ASSET_DIR under a name carrying a hash of its content (``css/style.css`` ->
+``css/style.1f3a9c0b2d4e.css``), next to gzip and, when the ``brotli``
+package is installed, brotli versions of it. Templates link to these with
+``asset_url('css/style.css')``.
+
+``/assets/<name>`` serves them with ``Cache-Control: immutable`` for a year:
+a changed file gets a new name, so browsers never need to revalidate. The
+brotli or gzip file is sent as is when the client accepts it, so nothing is
+compressed per request. Files are written under their hashed names by
+rename, so workers building at the same time, or a deploy replacing the
+code, never see a half-written asset.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+
+from flask import abort, request, send_from_directory, url_for
+
+from app import app
+
+ASSET_DIR = os.environ.get('URS_ASSET_DIR', os.path.join(tempfile.gettempdir(), 'urs-assets'))
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Content-Encoding -> file suffix, in the order we prefer them
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_manifest = None  # source path -> hashed path
+_served = None  # hashed path -> source path
+_lock = threading.Lock()
+
+
+def fingerprint(path, data):
+    digest = hashlib.blake2b(data, digest_size=6).hexdigest()
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def _write(path, data):
+    if os.path.exists(path):
+        # Same name, same content
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _compressed(data):
+    """``{suffix: bytes}`` for each encoding that makes ``data`` smaller."""
+    variants = {'.gz': gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants['.br'] = brotli.compress(data, quality=BROTLI_QUALITY)
+    return {suffix: body for suffix, body in variants.items() if len(body) < len(data)}
+
+
+def build(static_dir=None, out_dir=None):
+    """Write every static file's hashed and compressed copies; returns the manifest."""
+    static_dir = static_dir or app.static_folder
+    out_dir = out_dir or ASSET_DIR
+    manifest = {}
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = fingerprint(path, data)
+            target = os.path.join(out_dir, *hashed.split('/'))
+            _write(target, data)
+            for suffix, body in _compressed(data).items():
+                _write(target + suffix, body)
+            manifest[path] = hashed
+    return manifest
+
+
+def manifest():
+    global _manifest, _served
+    if _manifest is None:
+        with _lock:
+            if _manifest is None:
+                built = build()
+                _served = {hashed: path for path, hashed in built.items()}
+                _manifest = built
+    return _manifest
+
+
+@app.template_global()
+def asset_url(filename):
+    """URL of the fingerprinted copy of static ``filename``."""
+    hashed = manifest().get(filename)
+    if hashed is None:
+        # Not a file we have; let the static handler answer for it
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=hashed)
+
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    manifest()
+    if filename not in _served:
+        abort(404)
+
+    encoding, suffix = None, ''
+    for name, candidate in ENCODINGS:
+        if name in request.accept_encodings and os.path.exists(os.path.join(ASSET_DIR, filename + candidate)):
+            encoding, suffix = name, candidate
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(ASSET_DIR, filename + suffix, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
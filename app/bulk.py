@@ -0,0 +1,109 @@
+"""Chunked, parallel bulk writes.
+
+``BulkLoader`` buffers sets and deletes into batches of up to BATCH_LIMIT
+writes and commits them on a small thread pool. At most ``parallelism``
+commits are in flight, so a loader never holds more than a few batches in
+memory however many documents go through it. Only ``db.batch()`` is used,
+so it works with Cloud Firestore and with the in-memory client.
+
+Batches are independent: a failed commit does not undo earlier ones. The
+first error is raised from the next ``set``/``delete``/``flush`` call.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+BATCH_LIMIT = 500  # Firestore's maximum writes per commit
+
+
+class BulkLoader:
+    def __init__(self, db, batch_size=BATCH_LIMIT, parallelism=8, max_writes_per_second=None):
+        if not 1 <= batch_size <= BATCH_LIMIT:
+            raise ValueError(f'batch_size must be between 1 and {BATCH_LIMIT}')
+        self.db = db
+        self.batch_size = batch_size
+        self.max_writes_per_second = max_writes_per_second
+        self.written = 0
+        self._batch = db.batch()
+        self._pending = 0
+        self._parallelism = parallelism
+        self._pool = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='bulk')
+        self._slots = threading.BoundedSemaphore(parallelism)
+        self._lock = threading.Lock()
+        self._error = None
+        self._started = time.monotonic()
+        self._submitted = 0
+
+    def set(self, reference, data, merge=False):
+        self._batch.set(reference, data, merge=merge)
+        self._added()
+
+    def delete(self, reference):
+        self._batch.delete(reference)
+        self._added()
+
+    def _added(self):
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        self._raise_error()
+        if not self._pending:
+            return
+        batch, count = self._batch, self._pending
+        self._batch, self._pending = self.db.batch(), 0
+
+        if self.max_writes_per_second:
+            # Pace commits so a fresh database can ramp up (Firestore's
+            # 500/50/5 rule) instead of throttling us
+            self._submitted += count
+            ahead = self._submitted / self.max_writes_per_second - (time.monotonic() - self._started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+        self._slots.acquire()
+        future = self._pool.submit(batch.commit)
+        future.add_done_callback(lambda f: self._committed(f, count))
+
+    def _committed(self, future, count):
+        error = future.exception()
+        with self._lock:
+            if error is not None:
+                if self._error is None:
+                    self._error = error
+            else:
+                self.written += count
+        self._slots.release()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def flush(self):
+        """Commit the partial batch and wait until every commit has finished."""
+        self._submit()
+        # Holding every slot means no commit is still running
+        for _ in range(self._parallelism):
+            self._slots.acquire()
+        for _ in range(self._parallelism):
+            self._slots.release()
+        self._raise_error()
+
+    def close(self):
+        """Flush, stop the pool and return the number of writes committed."""
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True)
@@ -0,0 +1,32 @@
+"""Small in-process caches shared by the request threads of one worker."""
+import threading
+
+from cachetools import TTLCache
+
+
+class LocalCache:
+    """A size-bounded cache whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._cache.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+
+    def pop(self, key):
+        with self._lock:
+            return self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
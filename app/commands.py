@@ -0,0 +1,73 @@
+import click
+from app import app, repos
+
+
+@app.cli.command('backfill-rollups')
+@click.option('--vendor-id', default=None, help='Only rebuild rollups for this vendor.')
+def backfill_rollups(vendor_id):
+    """Rebuild daily analytics rollups from raw transactions."""
+    written = repos.rollups.backfill(vendor_id)
+    click.echo(f"Wrote {written} rollup documents.")
+
+
+@app.cli.command('migrate-policy-ids')
+def migrate_policy_ids():
+    """Re-key auto-id vendor policies to vendor_policies/{vendor_id}."""
+    moved = repos.policies.migrate_ids()
+    click.echo(f"Re-keyed {moved} vendor policies.")
+
+
+@app.cli.command('build-phone-index')
+def build_phone_index():
+    """Index every customer by normalized phone number."""
+    written = repos.customers.build_phone_index()
+    click.echo(f"Indexed {written} customer phone numbers.")
+
+
+@app.cli.command('migrate-counters')
+def migrate_counters():
+    """Move wallet balances into wallet shards and tag watermarks for sharding."""
+    moved = repos.customers.migrate_wallets()
+    click.echo(f"Moved {moved} wallet balances into shards.")
+    tagged = repos.watermarks.migrate()
+    click.echo(f"Tagged {tagged} vendor watermarks.")
+
+
+@app.cli.command('build-assets')
+def build_assets():
+    """Write fingerprinted, compressed copies of the static files."""
+    from app import assets
+
+    manifest = assets.build()
+    for path, hashed in sorted(manifest.items()):
+        click.echo(f"{path} -> {hashed}")
+    click.echo(f"Built {len(manifest)} assets in {assets.ASSET_DIR}.")
+
+
+@app.cli.command('seed')
+@click.option('--vendors', default=20, show_default=True)
+@click.option('--customers', 'customer_count', default=5000, show_default=True)
+@click.option('--transactions', default=100000, show_default=True)
+@click.option('--days', default=90, show_default=True, help='Spread transactions over this many days.')
+@click.option('--password', default='test123', show_default=True, help='Password of every generated vendor.')
+@click.option('--seed', 'random_seed', default=1, show_default=True, help='Same seed, same data.')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--parallelism', default=8, show_default=True, help='Batch commits in flight.')
+@click.option('--max-writes-per-second', type=int, default=None,
+              help='Pace writes, e.g. 500 for a fresh production database.')
+@click.option('--clear', is_flag=True, help='Delete the seeded collections first.')
+def seed(vendors, customer_count, transactions, days, password, random_seed, batch_size, parallelism,
+         max_writes_per_second, clear):
+    """Generate synthetic vendors, customers and transactions."""
+    from app import seeding
+
+    loader_options = {'batch_size': batch_size, 'parallelism': parallelism,
+                      'max_writes_per_second': max_writes_per_second}
+    if clear:
+        deleted = seeding.clear(repos.db, **loader_options)
+        click.echo(f"Deleted {deleted} documents.")
+    summary = seeding.seed(repos.db, vendors, customer_count, transactions, days, password, random_seed,
+                           progress=click.echo, **loader_options)
+    click.echo(f"Wrote {summary['writes']} documents in {summary['seconds']:.1f}s. "
+               f"Vendors log in as {seeding.vendor_email(0)} ... "
+               f"{seeding.vendor_email(vendors - 1)} with password '{password}'.")
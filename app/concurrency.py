@@ -0,0 +1,73 @@
+"""Run a request's independent reads concurrently.
+
+Route handlers often need a few Firestore reads that do not depend on each
+other (the vendor, the policy, the customer). ``gather`` runs them on a
+shared per-worker thread pool so the request waits about one round trip
+instead of the sum. Each call must not touch Flask's request globals:
+read ``session``/``request`` first and pass values in.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import contextvars
+import os
+import threading
+
+FANOUT_WORKERS = int(os.environ.get('URS_FANOUT_WORKERS', 16))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+        return _pool
+
+
+def _reset_pool():
+    # Threads do not survive fork; a child starts with no pool
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+def gather(*calls):
+    """Call each zero-argument function concurrently; return results in order.
+
+    The first call runs on the calling thread and the rest on the pool. If
+    any call raises, the first exception (in argument order) is re-raised
+    after all calls have finished. ``URS_FANOUT_WORKERS=0`` runs the calls
+    one after another instead.
+    """
+    if len(calls) < 2 or FANOUT_WORKERS < 1:
+        return [call() for call in calls]
+
+    # Each call runs in a copy of the caller's context, so its Firestore reads
+    # are still counted against the request in app.metrics
+    futures = [_get_pool().submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    results = []
+    error = None
+    try:
+        results.append(calls[0]())
+    except Exception as e:
+        error = e
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+    return results
+
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+atexit.register(_shutdown_pool)
@@ -0,0 +1,69 @@
+"""Sharded counters for values that take more writes than one document can.
+
+Firestore sustains about one write per second on a single document. A
+sharded counter spreads one value over up to ``shards`` documents: each
+writer adds to a randomly chosen shard with an Increment, so concurrent
+writers rarely touch the same document, and readers add the shards up.
+Shard documents are created on first write, so a quiet counter usually has a
+single shard and costs a single read.
+
+Two layouts are used. Counters that are found with a query (daily rollups,
+watermarks) keep their shards next to the original document: shard 0 keeps
+the original id and shard ``i`` is ``{id}_{i}``, so data written before
+sharding is simply shard 0. Wallets keep theirs in a subcollection of the
+customer (``app/wallets.py``).
+
+Subtracting is the exception. A wallet must never go below zero, so a debit
+reads the shards and takes what it needs from the fullest ones
+(``plan_debit``). It must then commit with those shards unchanged, inside a
+transaction or with update-time preconditions.
+"""
+import os
+import random
+
+WALLET_SHARDS = int(os.environ.get('URS_WALLET_SHARDS', 4))
+VENDOR_SHARDS = int(os.environ.get('URS_VENDOR_SHARDS', 4))
+
+# Shard values are float sums; smaller differences are rounding
+EPSILON = 1e-9
+
+
+def random_shard(shards):
+    return random.randrange(shards)
+
+
+def shard_id(base_id, index):
+    """Id of shard ``index`` of a counter stored next to ``base_id``."""
+    return base_id if index == 0 else f"{base_id}_{index}"
+
+
+def shard_ids(base_id, shards):
+    return [shard_id(base_id, index) for index in range(shards)]
+
+
+def increment(writer, ref, fields):
+    """Add ``fields`` (name -> amount) to one shard document."""
+    from firebase_admin import firestore
+
+    writer.set(ref, {name: firestore.Increment(amount) for name, amount in fields.items()}, merge=True)
+
+
+def plan_debit(values, amount):
+    """Split ``amount`` over shards without taking any of them below zero.
+
+    ``values`` maps each shard's key to its current value. Returns
+    ``[(key, take), ...]``, fullest shards first, so a debit touches as few
+    documents as it can. Raises ValueError if the shards hold less than
+    ``amount``.
+    """
+    plan = []
+    remaining = amount
+    for key, value in sorted(values.items(), key=lambda item: item[1], reverse=True):
+        if remaining <= EPSILON or value <= 0:
+            break
+        take = min(value, remaining)
+        plan.append((key, take))
+        remaining -= take
+    if remaining > EPSILON:
+        raise ValueError(f'Shards hold {amount - remaining}, cannot take {amount}')
+    return plan
@@ -0,0 +1,153 @@
+"""Customer lookup by phone number.
+
+``customer_phones/{normalized phone}`` maps a phone number to its customer
+id, so a lookup is two round trips instead of a query: the index entry, then
+the customer document and its wallet shards (``app/wallets.py``) in one
+batched get. The customer shown on the check screen is kept in a
+short-lived per-worker cache, so the checkout that follows seconds later can
+reuse the snapshot. The wallet's update times are used as write
+preconditions, which makes any change in between fail the commit instead of
+being overwritten.
+"""
+import re
+
+from app import wallets
+from app.cache import LocalCache
+
+CUSTOMERS_COLLECTION = 'customers'
+PHONE_INDEX_COLLECTION = 'customer_phones'
+
+CUSTOMER_CACHE_SIZE = 4096
+CUSTOMER_CACHE_TTL = 30  # seconds
+
+INDEX_BATCH_SIZE = 500
+
+_cache = LocalCache(maxsize=CUSTOMER_CACHE_SIZE, ttl=CUSTOMER_CACHE_TTL)
+
+
+class CustomerSnapshot:
+    """A customer document as read at ``update_time``, with its wallet."""
+
+    def __init__(self, id, data, update_time, wallet=None):
+        self.id = id
+        self.data = data
+        self.update_time = update_time
+        self.wallet = wallet
+
+    @property
+    def balance(self):
+        if self.wallet is None:
+            return float(self.data.get('wallet_balance') or 0)
+        return self.wallet.balance
+
+    def reference(self, db):
+        return db.collection(CUSTOMERS_COLLECTION).document(self.id)
+
+
+def normalize_phone(phone):
+    # Keep the 10-digit subscriber number, dropping spaces, dashes and any
+    # country or trunk prefix
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:]
+
+
+def phone_index_ref(db, phone):
+    return db.collection(PHONE_INDEX_COLLECTION).document(normalize_phone(phone))
+
+
+def find_customer(db, phone, use_cache=True):
+    """Return a CustomerSnapshot for ``phone``, or None if no customer has it."""
+    key = normalize_phone(phone)
+    if not key:
+        return None
+
+    if use_cache:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+
+    customer = None
+    index_entry = phone_index_ref(db, key).get()
+    if index_entry.exists:
+        customer_ref = db.collection(CUSTOMERS_COLLECTION).document(index_entry.to_dict()['customer_id'])
+        doc, wallet = wallets.read(db, customer_ref)
+        data = doc.to_dict() if doc.exists else None
+        if data and normalize_phone(data.get('phone')) == key:
+            customer = CustomerSnapshot(doc.id, data, doc.update_time, wallet)
+
+    if customer is None:
+        # Not indexed yet (or the index is stale): fall back to the query once
+        # and repair the index entry for next time
+        docs = db.collection(CUSTOMERS_COLLECTION).where('phone', '==', phone).limit(1).get()
+        if not docs and phone != key:
+            docs = db.collection(CUSTOMERS_COLLECTION).where('phone', '==', key).limit(1).get()
+        if not docs:
+            return None
+        doc, wallet = wallets.read(db, docs[0].reference)
+        customer = CustomerSnapshot(doc.id, doc.to_dict(), doc.update_time, wallet)
+        phone_index_ref(db, key).set({'customer_id': doc.id})
+
+    _cache.set(key, customer)
+    return customer
+
+
+def find_customer_ids(db, phones, max_fallbacks=None):
+    """Map each normalized phone in ``phones`` to its customer id, or None.
+
+    Cached snapshots cost nothing; the other index entries are fetched in one
+    batched read, and phones missing from the index fall back to
+    find_customer, which costs a query or two each. Past ``max_fallbacks`` of
+    those, the remaining phones are left out of the result.
+    """
+    ids = {}
+    missing = []
+    for key in {normalize_phone(phone) for phone in phones} - {''}:
+        cached = _cache.get(key)
+        if cached is not None:
+            ids[key] = cached.id
+        else:
+            missing.append(key)
+
+    if missing:
+        for snapshot in db.get_all([phone_index_ref(db, key) for key in missing]):
+            if snapshot.exists:
+                ids[snapshot.id] = snapshot.to_dict()['customer_id']
+        fallbacks = 0
+        for key in missing:
+            if key not in ids:
+                if max_fallbacks is not None and fallbacks >= max_fallbacks:
+                    continue
+                fallbacks += 1
+                customer = find_customer(db, key, use_cache=False)
+                ids[key] = customer.id if customer else None
+    return ids
+
+
+def remember(phone, customer):
+    """Replace the cached snapshot for ``phone`` after a write we made."""
+    _cache.set(normalize_phone(phone), customer)
+
+
+def invalidate(phone):
+    _cache.pop(normalize_phone(phone))
+
+
+def build_phone_index(db):
+    """Write a phone index entry for every customer; returns entries written."""
+    batch = db.batch()
+    pending = 0
+    written = 0
+    for doc in db.collection(CUSTOMERS_COLLECTION).stream():
+        phone = normalize_phone(doc.to_dict().get('phone'))
+        if not phone:
+            continue
+        batch.set(db.collection(PHONE_INDEX_COLLECTION).document(phone), {'customer_id': doc.id})
+        pending += 1
+        written += 1
+        if pending == INDEX_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    return written
@@ -0,0 +1,265 @@
+"""Per-vendor event hub for live dashboard updates.
+
+``apply_discount`` publishes a ``sale`` event and open dashboards receive it
+over Server-Sent Events (``/api/events``) or long polling
+(``/api/events/poll``). Idle dashboards therefore make no Firestore reads.
+
+Each worker process keeps its own hub: a short per-vendor backlog plus a
+condition variable that stream and poll handlers wait on. To reach
+dashboards connected to other gunicorn workers on the same host, every hub
+binds a Unix datagram socket in ``EVENTS_DIR`` and a publish is also sent to
+every peer socket found there. The directory is created private (0700) and
+must belong to this user, so other local users cannot send events. Workers
+on other hosts are not reached; their dashboards see a ``resync`` when they
+reconnect and reload instead.
+
+An open stream or poll holds a request thread for its whole life, so each
+worker serves at most MAX_LISTENERS of them at once. The rest are refused
+with a 503 and ``Retry-After``; those dashboards wait and ask again, reloading
+their data no more than every five minutes meanwhile. Checkouts and logins
+always find a free thread.
+"""
+from collections import deque
+import atexit
+import glob
+import json
+import os
+import socket
+import stat
+import tempfile
+import threading
+import time
+import uuid
+
+EVENTS_DIR = os.environ.get('URS_EVENTS_DIR', os.path.join(tempfile.gettempdir(), 'urs-events'))
+BACKLOG_SIZE = 100  # events kept per vendor for reconnecting clients
+HEARTBEAT_INTERVAL = 15  # seconds between SSE keep-alive comments
+STREAM_MAX_SECONDS = 300  # streams are closed and re-opened by the browser
+LONG_POLL_TIMEOUT = 25  # seconds
+# Streams and polls per worker; keep well below gunicorn's --threads (24 in
+# render.yaml) so the rest of the app always has threads to run on
+MAX_LISTENERS = int(os.environ.get('URS_EVENTS_MAX_LISTENERS', 8))
+LISTENER_RETRY_AFTER = 60  # seconds a refused dashboard waits before asking again
+
+MAX_DATAGRAM = 8192
+# Cursor meaning "before the first event in the backlog". It is the same in
+# every worker so a poll that lands on another worker does not force a resync.
+ORIGIN_ID = '0'
+
+
+def _private_dir(path):
+    """Create ``path`` for this user only; raises OSError if someone else owns it."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise OSError(f"{path} is not a directory owned by this user")
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+class EventHub:
+    def __init__(self, events_dir=EVENTS_DIR):
+        self.events_dir = events_dir
+        self._lock = threading.Lock()
+        self._conditions = {}
+        self._backlogs = {}
+        self._evicted = set()
+        self._socket = None
+        self._socket_path = None
+
+    def _condition(self, vendor_id):
+        condition = self._conditions.get(vendor_id)
+        if condition is None:
+            condition = self._conditions[vendor_id] = threading.Condition(self._lock)
+            self._backlogs[vendor_id] = deque(maxlen=BACKLOG_SIZE)
+        return condition
+
+    def publish(self, vendor_id, type, data):
+        """Deliver an event to this worker's listeners and to peer workers."""
+        event = {'id': uuid.uuid4().hex, 'vendor_id': vendor_id, 'type': type,
+                 'data': data, 'time': time.time()}
+        self._ensure_socket()
+        self._deliver(event)
+        self._broadcast(event)
+        return event
+
+    def _deliver(self, event):
+        with self._lock:
+            vendor_id = event['vendor_id']
+            condition = self._condition(vendor_id)
+            backlog = self._backlogs[vendor_id]
+            if len(backlog) == backlog.maxlen:
+                self._evicted.add(vendor_id)
+            backlog.append(event)
+            condition.notify_all()
+
+    def events_after(self, vendor_id, last_id, timeout):
+        """Wait up to ``timeout`` for events newer than ``last_id``.
+
+        Returns ``(events, resync)``. ``resync`` is True when ``last_id`` is no
+        longer in this worker's backlog, so the client may have missed events
+        and should reload its data.
+        """
+        self._ensure_socket()
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            condition = self._condition(vendor_id)
+            backlog = self._backlogs[vendor_id]
+            while True:
+                ids = [event['id'] for event in backlog]
+                if last_id == ORIGIN_ID:
+                    if vendor_id in self._evicted:
+                        return list(backlog), True
+                    start = 0
+                elif last_id and last_id not in ids:
+                    return list(backlog), True
+                else:
+                    start = ids.index(last_id) + 1 if last_id else len(ids)
+                if start < len(ids):
+                    return list(backlog)[start:], False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], False
+                condition.wait(remaining)
+
+    def latest_id(self, vendor_id):
+        """Cursor for "everything after now" (never None)."""
+        with self._lock:
+            self._condition(vendor_id)
+            backlog = self._backlogs[vendor_id]
+            return backlog[-1]['id'] if backlog else ORIGIN_ID
+
+    # Cross-worker delivery over Unix datagram sockets
+
+    def start(self):
+        self._ensure_socket()
+
+    def _ensure_socket(self):
+        if self._socket is not None or not hasattr(socket, 'AF_UNIX'):
+            return
+        with self._lock:
+            if self._socket is not None:
+                return
+            try:
+                _private_dir(self.events_dir)
+                path = os.path.join(self.events_dir, f"{os.getpid()}.sock")
+                if os.path.exists(path):
+                    os.remove(path)
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                sock.bind(path)
+            except OSError as e:
+                print(f"Event hub running without peer delivery: {e}")
+                self._socket = False
+                return
+            self._socket, self._socket_path = sock, path
+        threading.Thread(target=self._receive, args=(sock,), name='event-hub', daemon=True).start()
+
+    def _receive(self, sock):
+        while True:
+            try:
+                payload = sock.recv(MAX_DATAGRAM)
+                self._deliver(json.loads(payload))
+            except OSError:
+                return
+            except ValueError:
+                continue
+
+    def _broadcast(self, event):
+        if not self._socket:
+            return
+        payload = json.dumps(event).encode('utf-8')
+        if len(payload) > MAX_DATAGRAM:
+            return
+        for path in glob.glob(os.path.join(self.events_dir, '*.sock')):
+            if path == self._socket_path:
+                continue
+            try:
+                self._socket.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # A worker that exited without cleaning up its socket
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError:
+                pass
+
+    def close(self):
+        if self._socket:
+            self._socket.close()
+            try:
+                os.remove(self._socket_path)
+            except OSError:
+                pass
+        self._socket = None
+
+
+hub = EventHub()
+_listener_slots = threading.BoundedSemaphore(MAX_LISTENERS)
+
+
+def acquire_listener():
+    """Take a stream or poll slot without waiting; False when all are in use."""
+    return _listener_slots.acquire(blocking=False)
+
+
+def release_listener():
+    _listener_slots.release()
+
+
+def _reset_after_fork():
+    # The parent's socket, listener thread and open streams belong to the parent
+    global hub, _listener_slots
+    hub = EventHub(hub.events_dir)
+    _listener_slots = threading.BoundedSemaphore(MAX_LISTENERS)
+
+
+def _close_hub():
+    hub.close()
+
+
+def publish_sale(vendor_id, result):
+    """Publish the ``sale`` event for a checkout result from redemption.redeem."""
+    transaction = result['transaction']
+    return hub.publish(vendor_id, 'sale', {
+        'id': result['transaction_id'],
+        'amount': transaction['amount'],
+        'points_earned': transaction['points_earned'],
+        'points_redeemed': transaction['points_redeemed'],
+        'timestamp': transaction['timestamp'].isoformat() + '+00:00',
+    })
+
+
+def publish_resync(vendor_id):
+    """Tell the vendor's dashboards to reload, e.g. after a batch of sales."""
+    return hub.publish(vendor_id, 'resync', {})
+
+
+def sse_format(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def sse_stream(vendor_id, last_id=None):
+    """Yield an SSE body for ``vendor_id``, ending after STREAM_MAX_SECONDS."""
+    # Tell the browser how soon to reconnect once the stream closes
+    yield 'retry: 3000\n\n'
+    if last_id is None:
+        last_id = hub.latest_id(vendor_id)
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    while time.monotonic() < deadline:
+        events, resync = hub.events_after(vendor_id, last_id, HEARTBEAT_INTERVAL)
+        if resync:
+            # The client reloads everything, so carry on from the newest event
+            yield 'event: resync\ndata: {}\n\n'
+            last_id = events[-1]['id'] if events else hub.latest_id(vendor_id)
+            continue
+        for event in events:
+            yield sse_format(event)
+        if events:
+            last_id = events[-1]['id']
+        else:
+            yield ': keep-alive\n\n'
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_close_hub)
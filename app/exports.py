@@ -0,0 +1,304 @@
+"""Background export jobs.
+
+``/api/export`` queues a job and returns its id straight away. A bounded
+process pool builds the CSV or PDF into ``EXPORT_DIR``, and job metadata is
+kept next to the artifacts as JSON so the status and download endpoints work
+from any worker on the host. Finished artifacts are reused while the vendor's
+data watermark (its latest transaction) is unchanged, and swept after
+``ARTIFACT_TTL`` seconds.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from io import StringIO
+import atexit
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from app import metrics
+from app.models import Transaction
+from app.pagination import paginate
+
+EXPORT_DIR = os.environ.get('URS_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'urs-exports'))
+EXPORT_WORKERS = int(os.environ.get('URS_EXPORT_WORKERS', 2))
+MAX_PENDING_JOBS = int(os.environ.get('URS_EXPORT_MAX_PENDING', 16))
+ARTIFACT_TTL = int(os.environ.get('URS_EXPORT_TTL', 3600))  # seconds
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+CSV_HEADER = ['Transaction ID', 'Amount (INR)', 'Points Earned', 'Points Redeemed', 'Timestamp']
+
+# Rows per chunk written to a CSV export
+CSV_CHUNK_ROWS = 200
+
+
+class ExportQueueFull(Exception):
+    """Raised when this worker already has MAX_PENDING_JOBS exports in flight."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = set()
+
+
+def transactions_query(repos, vendor_id, start=None, end=None):
+    """Vendor transactions query; ``end`` is inclusive of the whole day."""
+    return repos.transactions.query(vendor_id, start, end + timedelta(days=1) if end else None)
+
+
+def transaction_records(query):
+    """Page through ``query`` yielding each document as a Transaction record."""
+    for snapshot in paginate(query):
+        yield Transaction.from_snapshot(snapshot)
+
+
+def csv_chunks(query):
+    """Yield the CSV export as encoded chunks of CSV_CHUNK_ROWS rows."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+
+    for i, t in enumerate(transaction_records(query), start=1):
+        writer.writerow([
+            t.id,
+            f"{t.amount:.2f}",
+            t.points_earned,
+            t.points_redeemed,
+            t.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        ])
+        if i % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def data_watermark(repos, vendor_id):
+    """Identify the newest transaction so cached artifacts go stale on new sales."""
+    latest = repos.transactions.latest(vendor_id)
+    if not latest:
+        return 'empty'
+    return f"{latest.id}@{latest.timestamp.isoformat()}"
+
+
+def _jobs_dir():
+    return os.path.join(EXPORT_DIR, 'jobs')
+
+
+def _artifacts_dir():
+    return os.path.join(EXPORT_DIR, 'artifacts')
+
+
+def _job_path(job_id):
+    return os.path.join(_jobs_dir(), f"{job_id}.json")
+
+
+def artifact_path(job):
+    return os.path.join(_artifacts_dir(), f"{job['cache_key']}.{job['format']}")
+
+
+def _write_job(job):
+    # Write-then-rename so readers in other workers never see a partial file
+    path = _job_path(job['id'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+
+def get_job(job_id):
+    # Job ids are generated hex strings; anything else cannot be a job file
+    if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+        return None
+    try:
+        with open(_job_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def cache_key(vendor_id, format, start, end, watermark):
+    raw = '|'.join([vendor_id, format, start or '', end or '', watermark])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if os.environ.get('URS_BACKEND') == 'memory':
+                # The in-memory store only exists in this process
+                _pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS)
+            else:
+                # Spawned children build their own Firestore client instead of
+                # inheriting the parent's gRPC channel across fork
+                _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _replace_broken_pool(pool):
+    """Drop ``pool`` after a child died in it, so the next submit starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(job_id):
+    pool = _get_pool()
+    try:
+        future = pool.submit(build_artifact, job_id, EXPORT_DIR)
+    except BrokenProcessPool:
+        # A child died (OOM, a signal) since the last export; the pool
+        # refuses all work from then on
+        _replace_broken_pool(pool)
+        pool = _get_pool()
+        future = pool.submit(build_artifact, job_id, EXPORT_DIR)
+    future.add_done_callback(lambda f: _job_finished(job_id, f, pool))
+    return future
+
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown_pool)
+
+
+def submit_export(repos, vendor_id, format, start=None, end=None, watermark=None):
+    """Create an export job, reusing a finished artifact when one is current.
+
+    ``watermark`` may be passed in when the caller already fetched it.
+    """
+    os.makedirs(_jobs_dir(), exist_ok=True)
+    os.makedirs(_artifacts_dir(), exist_ok=True)
+    sweep_expired()
+
+    start_str = start.strftime('%Y-%m-%d') if start else None
+    end_str = end.strftime('%Y-%m-%d') if end else None
+    job = {
+        'id': uuid.uuid4().hex,
+        'vendor_id': vendor_id,
+        'format': format,
+        'start': start_str,
+        'end': end_str,
+        'cache_key': cache_key(vendor_id, format, start_str, end_str, watermark or data_watermark(repos, vendor_id)),
+        'status': 'queued',
+        'error': None,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+    }
+
+    if os.path.exists(artifact_path(job)):
+        job['status'] = 'done'
+        job['finished_at'] = job['created_at']
+        _write_job(job)
+        return job
+
+    with _pool_lock:
+        if len(_pending) >= MAX_PENDING_JOBS:
+            raise ExportQueueFull()
+        _pending.add(job['id'])
+
+    _write_job(job)
+    try:
+        _submit(job['id'])
+    except Exception as e:
+        with _pool_lock:
+            _pending.discard(job['id'])
+        job.update(status='failed', error=str(e), finished_at=time.time())
+        _write_job(job)
+        raise
+    return job
+
+
+def _job_finished(job_id, future, pool):
+    with _pool_lock:
+        _pending.discard(job_id)
+    # A crashed child never got to record its own failure
+    exc = future.exception() if not future.cancelled() else None
+    if isinstance(exc, BrokenProcessPool):
+        _replace_broken_pool(pool)
+    job = get_job(job_id)
+    if exc is not None:
+        if job and job['status'] not in ('done', 'failed'):
+            job.update(status='failed', error=str(exc), finished_at=time.time())
+            _write_job(job)
+    if job and job.get('started_at') and job['finished_at']:
+        metrics.export_wait.observe(job['started_at'] - job['created_at'], format=job['format'])
+        metrics.export_latency.observe(job['finished_at'] - job['started_at'],
+                                       format=job['format'], status=job['status'])
+
+
+def build_artifact(job_id, export_dir):
+    """Pool entry point: build one job's file and record the outcome."""
+    global EXPORT_DIR
+    EXPORT_DIR = export_dir
+    job = get_job(job_id)
+    job.update(status='running', started_at=time.time())
+    _write_job(job)
+
+    path = artifact_path(job)
+    tmp_path = f"{path}.{job_id}.tmp"
+    try:
+        from firebase_config import get_db
+        from app.repositories import Repositories
+        repos = Repositories(get_db())
+        start = datetime.strptime(job['start'], '%Y-%m-%d') if job['start'] else None
+        end = datetime.strptime(job['end'], '%Y-%m-%d') if job['end'] else None
+        query = transactions_query(repos, job['vendor_id'], start, end)
+
+        if job['format'] == 'csv':
+            with open(tmp_path, 'wb') as f:
+                for chunk in csv_chunks(query):
+                    f.write(chunk)
+        else:
+            _write_pdf(repos, job, query, tmp_path)
+
+        os.replace(tmp_path, path)
+        job.update(status='done', finished_at=time.time())
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        job.update(status='failed', error=str(e), finished_at=time.time())
+    _write_job(job)
+    return job['status']
+
+
+def _write_pdf(repos, job, query, path):
+    from app.pdf import write_transactions_pdf
+
+    vendor = repos.vendors.get(job['vendor_id'])
+    with open(path, 'wb') as f:
+        # Pages are written as rows arrive from each Firestore page
+        write_transactions_pdf(f.write, vendor, transaction_records(query))
+
+
+def sweep_expired():
+    """Delete artifacts and job records older than ARTIFACT_TTL."""
+    cutoff = time.time() - ARTIFACT_TTL
+    for directory in (_artifacts_dir(), _jobs_dir()):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,545 @@
+"""In-memory stand-in for the Firestore client.
+
+Implements the subset of the ``google.cloud.firestore`` client API this app
+uses (collections, documents, queries with cursors, batches, transactions
+and field transforms) so the app, scripts and benchmarks can run without
+network access or credentials. Transactions use optimistic concurrency like
+the real service: a commit aborts if a document read inside it has changed.
+"""
+from datetime import datetime, timezone
+import copy
+import itertools
+import random
+import string
+import threading
+import time
+
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+
+_AUTO_ID_CHARS = string.ascii_letters + string.digits
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    'array_contains_any': lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+
+def _auto_id():
+    return ''.join(random.choice(_AUTO_ID_CHARS) for _ in range(20))
+
+
+def _normalize(value):
+    # Firestore stores timestamps in UTC and hands back aware datetimes
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _get_path(data, field_path):
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _apply_value(target, key, value):
+    if value is transforms.DELETE_FIELD:
+        target.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[key] = datetime.now(timezone.utc)
+    elif isinstance(value, transforms.Increment):
+        current = target.get(key)
+        if not isinstance(current, (int, float)) or isinstance(current, bool):
+            current = 0
+        target[key] = current + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        current = target.get(key)
+        current = list(current) if isinstance(current, list) else []
+        for item in _normalize(list(value.values)):
+            if item not in current:
+                current.append(item)
+        target[key] = current
+    elif isinstance(value, transforms.ArrayRemove):
+        current = target.get(key)
+        current = list(current) if isinstance(current, list) else []
+        removed = _normalize(list(value.values))
+        target[key] = [item for item in current if item not in removed]
+    else:
+        target[key] = _normalize(copy.deepcopy(value))
+
+
+def _merge_into(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            child = target.get(key)
+            if not isinstance(child, dict):
+                child = target[key] = {}
+            _merge_into(child, value)
+        else:
+            _apply_value(target, key, value)
+
+
+def _update_paths(target, data):
+    for field_path, value in data.items():
+        parts = field_path.split('.')
+        node = target
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        _apply_value(node, parts[-1], value)
+
+
+def _fresh(data):
+    # Resolve transforms against an empty document
+    target = {}
+    _merge_into(target, data)
+    return target
+
+
+class _Store:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.versions = {}
+        self.clock = itertools.count(1)
+
+    def read(self, path):
+        with self.lock:
+            data = self.docs.get(path)
+            return copy.deepcopy(data) if data is not None else None, self.versions.get(path, 0)
+
+    def apply(self, writes, expected_versions=None):
+        with self.lock:
+            for path, version in (expected_versions or {}).items():
+                if self.versions.get(path, 0) != version:
+                    raise exceptions.Aborted(f'Transaction contention on {path}')
+            for kind, path, data, merge, option in writes:
+                if kind == 'update' and path not in self.docs:
+                    raise exceptions.NotFound(f'No document to update: {path}')
+                if kind == 'create' and path in self.docs:
+                    raise exceptions.Conflict(f'Document already exists: {path}')
+                if option is not None and not option.holds(path in self.docs, self.versions.get(path)):
+                    raise exceptions.FailedPrecondition(f'Write precondition failed on {path}')
+            results = []
+            for kind, path, data, merge, option in writes:
+                if kind == 'delete':
+                    self.docs.pop(path, None)
+                elif kind == 'update':
+                    _update_paths(self.docs[path], data)
+                elif merge and path in self.docs:
+                    _merge_into(self.docs[path], data)
+                else:
+                    self.docs[path] = _fresh(data)
+                self.versions[path] = next(self.clock)
+                results.append(MemoryWriteResult(self.versions[path]))
+            return results
+
+    def children(self, collection_path):
+        prefix = collection_path + '/'
+        with self.lock:
+            return [
+                (path, copy.deepcopy(data), self.versions[path])
+                for path, data in self.docs.items()
+                if path.startswith(prefix) and '/' not in path[len(prefix):]
+            ]
+
+
+class MemoryWriteOption:
+    """Write precondition, as returned by ``client.write_option``."""
+
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+    def holds(self, exists, version):
+        if self.exists is not None and self.exists != exists:
+            return False
+        if self.last_update_time is not None and self.last_update_time != version:
+            return False
+        return True
+
+
+class MemoryWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class MemoryDocumentSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _get_path(self._data or {}, field_path)
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return MemoryCollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def collection(self, name):
+        return MemoryCollectionReference(self._client, f'{self.path}/{name}')
+
+    def get(self, field_paths=None, transaction=None):
+        if transaction is not None:
+            return transaction._get_document(self)
+        self._client._round_trip('batch_get_documents', reads=1)
+        data, version = self._client._store.read(self.path)
+        return MemoryDocumentSnapshot(self, data, version or None)
+
+    def set(self, document_data, merge=False):
+        self._client._round_trip('commit', writes=1)
+        return self._client._store.apply([('set', self.path, document_data, merge, None)])[0]
+
+    def create(self, document_data):
+        self._client._round_trip('commit', writes=1)
+        return self._client._store.apply([('create', self.path, document_data, False, None)])[0]
+
+    def update(self, field_updates, option=None):
+        self._client._round_trip('commit', writes=1)
+        return self._client._store.apply([('update', self.path, field_updates, False, option)])[0]
+
+    def delete(self, option=None):
+        self._client._round_trip('commit', writes=1)
+        self._client._store.apply([('delete', self.path, None, False, option)])
+
+
+class MemoryQuery:
+    def __init__(self, client, collection_path, filters=(), orders=(),
+                 limit=None, cursor=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        values = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'cursor': self._cursor,
+        }
+        values.update(changes)
+        return MemoryQuery(self._client, self._collection_path, **values)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERATORS:
+            raise ValueError(f'Unsupported operator: {op_string}')
+        return self._copy(filters=self._filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def _order_key(self, path, data):
+        return tuple(_get_path(data, field) for field, _ in self._orders) + (path,)
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if not _OPERATORS[op](_get_path(data, field), value):
+                return False
+        return True
+
+    def _results(self):
+        started = time.perf_counter()
+        rows = [(path, data, version)
+                for path, data, version in self._client._store.children(self._collection_path)
+                if self._matches(data)]
+        for field, direction in reversed(self._orders):
+            rows = [row for row in rows if _get_path(row[1], field) is not None]
+            rows.sort(key=lambda row: _get_path(row[1], field),
+                      reverse=direction in ('DESCENDING', 'desc'))
+        if not self._orders:
+            rows.sort(key=lambda row: row[0])
+        if self._cursor is not None:
+            rows = self._after_cursor(rows)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        # Firestore bills a query for at least one read even when it is empty
+        self._client._round_trip('run_query', reads=max(1, len(rows)))
+        if self._client.query_observer is not None:
+            self._client.query_observer(self._collection_path, [(field, op) for field, op, _ in self._filters],
+                                        self._orders, self._limit, self._cursor is not None,
+                                        len(rows), time.perf_counter() - started)
+        return [
+            MemoryDocumentSnapshot(MemoryDocumentReference(self._client, path), data, version)
+            for path, data, version in rows
+        ]
+
+    def _after_cursor(self, rows):
+        cursor = self._cursor
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            for index, (path, _, _) in enumerate(rows):
+                if path == cursor.reference.path:
+                    return rows[index + 1:]
+            cursor = cursor.to_dict() or {}
+        values = tuple(_normalize(cursor.get(field)) for field, _ in self._orders)
+        remaining = []
+        for path, data, version in rows:
+            key = tuple(_get_path(data, field) for field, _ in self._orders)
+            passed = False
+            for (field, direction), got, want in zip(self._orders, key, values):
+                if got == want:
+                    continue
+                descending = direction in ('DESCENDING', 'desc')
+                passed = got < want if descending else got > want
+                break
+            if passed:
+                remaining.append((path, data, version))
+        return remaining
+
+    def stream(self, transaction=None):
+        if transaction is not None:
+            return transaction.get(self)
+        return iter(self._results())
+
+    def get(self, transaction=None):
+        if transaction is not None:
+            return list(transaction.get(self))
+        return self._results()
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.path = path
+
+    @property
+    def id(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, f'{self.path}/{document_id or _auto_id()}')
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self):
+        return [MemoryDocumentReference(self._client, path)
+                for path, _, _ in self._client._store.children(self.path)]
+
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference.path, document_data, merge, None))
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference.path, document_data, False, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference.path, field_updates, False, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference.path, None, False, option))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise exceptions.InvalidArgument('A batch may contain at most 500 writes')
+        self._client._round_trip('commit', writes=len(self._writes))
+        try:
+            return self._client._store.apply(self._writes)
+        finally:
+            self._writes = []
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    """Optimistic transaction compatible with ``firestore.transactional``."""
+
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._reads = {}
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = _auto_id().encode('ascii')
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        self._client._round_trip('commit', writes=len(self._writes))
+        try:
+            return self._client._store.apply(self._writes, self._reads)
+        finally:
+            self._clean_up()
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, MemoryDocumentReference):
+            return iter([self._get_document(ref_or_query)])
+        self._check_reads_first()
+        snapshots = ref_or_query._results()
+        for snapshot in snapshots:
+            self._reads.setdefault(snapshot.reference.path, snapshot.update_time)
+        return iter(snapshots)
+
+    def get_all(self, references):
+        # One BatchGetDocuments call, however many documents
+        references = list(references)
+        self._check_reads_first()
+        self._client._round_trip('batch_get_documents', reads=len(references))
+        snapshots = []
+        for ref in references:
+            data, version = self._client._store.read(ref.path)
+            self._reads.setdefault(ref.path, version)
+            snapshots.append(MemoryDocumentSnapshot(ref, data, version or None))
+        return snapshots
+
+    def _check_reads_first(self):
+        if self._writes:
+            raise exceptions.InvalidArgument('Transactions require all reads before writes')
+
+    def _get_document(self, reference):
+        self._check_reads_first()
+        self._client._round_trip('batch_get_documents', reads=1)
+        data, version = self._client._store.read(reference.path)
+        self._reads.setdefault(reference.path, version)
+        return MemoryDocumentSnapshot(reference, data, version or None)
+
+
+class MemoryClient:
+    """Drop-in replacement for ``firestore.Client`` backed by a dict.
+
+    ``latency`` (seconds) is slept on every simulated round trip, which lets
+    benchmarks model network cost without a network. ``stats`` counts round
+    trips and billed document reads and writes. ``observer``, if set, is called
+    as ``observer(op, reads=, writes=, seconds=)`` for every round trip, with
+    ``op`` named after the Firestore RPC it stands for. ``query_observer``, if
+    set, is called after every query with its collection path, ``(field, op)``
+    filters, orders, limit, whether it has a cursor, the documents it returned
+    and the seconds it took.
+    """
+
+    def __init__(self, latency=0.0):
+        self._store = _Store()
+        self.latency = latency
+        self.observer = None
+        self.query_observer = None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zero the round trip, document read and document write counters."""
+        with self._stats_lock:
+            self.stats = {'round_trips': 0, 'reads': 0, 'writes': 0}
+
+    def _count(self, round_trips=0, reads=0, writes=0):
+        with self._stats_lock:
+            self.stats['round_trips'] += round_trips
+            self.stats['reads'] += reads
+            self.stats['writes'] += writes
+
+    def _round_trip(self, op, reads=0, writes=0):
+        self._count(round_trips=1, reads=reads, writes=writes)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.observer is not None:
+            self.observer(op, reads=reads, writes=writes, seconds=self.latency)
+
+    def collection(self, name):
+        return MemoryCollectionReference(self, name)
+
+    def document(self, path):
+        return MemoryDocumentReference(self, path)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def write_option(self, **kwargs):
+        return MemoryWriteOption(**kwargs)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return MemoryTransaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        if transaction is not None:
+            return iter(transaction.get_all(list(references)))
+        references = list(references)
+        self._round_trip('batch_get_documents', reads=len(references))
+        snapshots = []
+        for ref in references:
+            data, version = self._store.read(ref.path)
+            snapshots.append(MemoryDocumentSnapshot(ref, data, version or None))
+        return iter(snapshots)
+
+    def collections(self):
+        with self._store.lock:
+            names = {path.split('/', 1)[0] for path in self._store.docs}
+        return [MemoryCollectionReference(self, name) for name in sorted(names)]
+
+    def close(self):
+        pass
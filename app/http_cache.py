@@ -0,0 +1,73 @@
+"""Conditional GETs and response compression for the JSON APIs.
+
+API responses carry a weak ETag built from the vendor's watermark
+(``app/watermarks.py``) and the request's query string. A client that sends
+it back in ``If-None-Match`` gets a 304 before any transactions or rollups
+are read. Responses are sent with ``Cache-Control: private, no-cache`` so
+browsers revalidate on every ``fetch``, and the dashboard script needs no
+changes.
+
+JSON bodies of at least COMPRESS_MIN_SIZE bytes are gzipped for clients that
+accept it.
+"""
+from datetime import datetime
+import gzip
+import hashlib
+
+from flask import request
+
+from app import app
+
+COMPRESS_MIN_SIZE = 1024  # bytes
+COMPRESS_LEVEL = 6
+
+
+def api_etag(vendor_id, version):
+    """ETag for the current request's API response at watermark ``version``."""
+    # The UTC date is part of the tag because "last N days" windows move at
+    # midnight even when no new sale is recorded
+    key = '|'.join([
+        vendor_id,
+        str(version),
+        request.path,
+        '&'.join(f"{name}={value}" for name, value in sorted(request.args.items(multi=True))),
+        datetime.utcnow().strftime('%Y-%m-%d'),
+    ])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def is_fresh(etag):
+    """True when the client's If-None-Match already names ``etag``."""
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag):
+    return tag(app.response_class(status=304), etag)
+
+
+def tag(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    if (response.mimetype != 'application/json'
+            or response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
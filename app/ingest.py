@@ -0,0 +1,210 @@
+"""Batch sale ingestion for tills that sync offline.
+
+A till buffers its sales and posts them to ``/api/sales/batch``, each with an
+``idempotency_key`` of its own choosing. The ledger row for a sale lives at
+``transactions/{hash(vendor id, key)}``, so posting the same batch again
+(say after a timeout) records nothing twice: sales already stored are
+reported as duplicates with their original results.
+
+The vendor policy is read once per batch and customers are resolved through
+the phone index in one batched read. Phones missing from the index are
+looked up by query, at most MAX_PHONE_FALLBACKS per batch; sales for the
+rest fail and resolve on a later attempt, since each lookup repairs the
+index. Sales are then committed CHUNK_SIZE at
+a time. Each chunk is one Firestore transaction that reads its ledger rows
+and wallets, then writes the wallet updates, ledger rows, daily rollups and
+watermark together, so a chunk lands completely or not at all. Points follow
+the same rules as apply_discount (``redemption.compute_redemption``), applied
+to each customer's sales in the order they were posted.
+
+Every sale gets a result, in request order, with a ``status`` of:
+
+* ``created``: recorded by this request;
+* ``duplicate``: its key was already recorded;
+* ``rejected``: invalid or unknown customer; sending it again will not help;
+* ``failed``: its chunk could not be committed; it is safe to retry.
+"""
+from datetime import datetime, timedelta
+import hashlib
+import math
+
+from app import counters, customers, redemption, rollups, wallets, watermarks
+from app.models import Transaction, normalize_timestamp
+
+MAX_SALES = 1000  # per request
+# A sale writes its ledger row, a rollup and at worst every part of its
+# customer's wallet (the shards and the legacy field); with the watermark a
+# chunk stays under Firestore's 500 writes per commit
+CHUNK_SIZE = 499 // (counters.WALLET_SHARDS + 3)
+MAX_KEY_LENGTH = 128
+# Per batch; each phone missing from the index costs one or two queries
+MAX_PHONE_FALLBACKS = 25
+MAX_CLOCK_SKEW = timedelta(minutes=5)  # how far ahead of us a till's clock may be
+
+
+class InvalidSale(ValueError):
+    """A sale in the batch cannot be recorded as sent."""
+
+
+def ledger_ref(db, vendor_id, key):
+    digest = hashlib.blake2b(f'{vendor_id}:{key}'.encode('utf-8'), digest_size=16).hexdigest()
+    return db.collection('transactions').document(digest)
+
+
+def parse_sale(item, now):
+    """Validate one posted sale; returns ``(key, phone, amount, timestamp)``."""
+    if not isinstance(item, dict):
+        raise InvalidSale('Each sale must be an object')
+    key = item.get('idempotency_key')
+    if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise InvalidSale(f'idempotency_key must be a string of 1 to {MAX_KEY_LENGTH} characters')
+
+    phone = customers.normalize_phone(str(item.get('phone') or ''))
+    if not phone:
+        raise InvalidSale('phone is required')
+
+    try:
+        amount = float(item.get('bill_amount'))
+    except (TypeError, ValueError):
+        raise InvalidSale('bill_amount must be a number') from None
+    if not math.isfinite(amount) or amount <= 0:
+        raise InvalidSale('bill_amount must be greater than 0')
+
+    timestamp = now
+    if item.get('timestamp') is not None:
+        try:
+            timestamp = normalize_timestamp(item['timestamp'])
+        except (TypeError, ValueError, OverflowError):
+            raise InvalidSale('timestamp must be ISO 8601 or epoch seconds') from None
+        if timestamp > now + MAX_CLOCK_SKEW:
+            raise InvalidSale('timestamp is in the future')
+    return key, phone, amount, timestamp
+
+
+def _sale_result(index, key, status, **fields):
+    return dict(index=index, idempotency_key=key, status=status, **fields)
+
+
+def _recorded(sale, transaction_id, data, status, **fields):
+    return _sale_result(sale['index'], sale['key'], status,
+                        transaction_id=transaction_id,
+                        customer_id=data['customer_id'],
+                        amount=data['amount'],
+                        discount=data['points_redeemed'],
+                        final_bill=data['amount'] - data['points_redeemed'],
+                        points_earned=data['points_earned'],
+                        timestamp=normalize_timestamp(data['timestamp']).isoformat() + '+00:00',
+                        **fields)
+
+
+def _record_chunk(transaction, db, vendor_id, policy, chunk):
+    ledger_refs = [ledger_ref(db, vendor_id, sale['key']) for sale in chunk]
+    customer_refs = {}
+    for sale in chunk:
+        customer_id = sale['customer_id']
+        if customer_id not in customer_refs:
+            customer_refs[customer_id] = db.collection(customers.CUSTOMERS_COLLECTION).document(customer_id)
+
+    # One batched read for every ledger row, customer and wallet shard;
+    # results may come back in any order
+    refs = list(ledger_refs)
+    for ref in customer_refs.values():
+        refs.extend(wallets.refs_for(ref))
+    snapshots = {snapshot.reference.path: snapshot for snapshot in transaction.get_all(refs)}
+    opening = {}
+    for customer_id, ref in customer_refs.items():
+        customer_snapshot, wallet = wallets.from_results(snapshots, ref)
+        if customer_snapshot.exists:
+            opening[customer_id] = wallet
+    balances = {customer_id: wallet.balance for customer_id, wallet in opening.items()}
+
+    results = []
+    written = []
+    for sale, ref in zip(chunk, ledger_refs):
+        existing = snapshots[ref.path]
+        if existing.exists:
+            results.append(_recorded(sale, ref.id, existing.to_dict(), 'duplicate'))
+            continue
+        customer_id = sale['customer_id']
+        if customer_id not in balances:
+            results.append(_sale_result(sale['index'], sale['key'], 'rejected', error='Customer not found'))
+            continue
+
+        discount, final_bill, points_earned = redemption.compute_redemption(
+            balances[customer_id], sale['amount'], policy)
+        balances[customer_id] += points_earned - discount
+        data = Transaction(None, vendor_id, customer_id, sale['amount'], points_earned, discount,
+                           sale['timestamp']).to_firestore()
+        transaction.set(ref, data)
+        written.append(data)
+        results.append(_recorded(sale, ref.id, data, 'created', wallet_balance=balances[customer_id]))
+
+    # One net wallet change per customer, however many of their sales are here
+    for customer_id, wallet in opening.items():
+        change = balances[customer_id] - wallet.balance
+        wallets.apply(transaction, db, customer_refs[customer_id], wallet, change)
+    if written:
+        rollups.record_transactions(db, written, transaction)
+        watermarks.bump(db, vendor_id, writer=transaction)
+    return results
+
+
+def record_sales(db, vendor_id, items, policy, now=None):
+    """Record the posted ``items`` for ``vendor_id``; returns one result per item."""
+    now = now or datetime.utcnow()
+    results = [None] * len(items)
+    sales = []
+    first_by_key = {}
+    repeats = []
+    for index, item in enumerate(items):
+        try:
+            key, phone, amount, timestamp = parse_sale(item, now)
+        except InvalidSale as e:
+            key = item.get('idempotency_key') if isinstance(item, dict) else None
+            results[index] = _sale_result(index, key, 'rejected', error=str(e))
+            continue
+        if key in first_by_key:
+            # The same sale twice in one request
+            repeats.append((index, first_by_key[key]))
+            continue
+        first_by_key[key] = index
+        sales.append({'index': index, 'key': key, 'phone': phone, 'amount': amount, 'timestamp': timestamp})
+
+    customer_ids = customers.find_customer_ids(db, [sale['phone'] for sale in sales],
+                                               max_fallbacks=MAX_PHONE_FALLBACKS)
+    ready = []
+    for sale in sales:
+        if sale['phone'] not in customer_ids:
+            results[sale['index']] = _sale_result(sale['index'], sale['key'], 'failed',
+                                                  error='Too many customers to look up; retry this sale')
+            continue
+        sale['customer_id'] = customer_ids[sale['phone']]
+        if sale['customer_id']:
+            ready.append(sale)
+        else:
+            results[sale['index']] = _sale_result(sale['index'], sale['key'], 'rejected',
+                                                  error='Customer not found')
+
+    for start in range(0, len(ready), CHUNK_SIZE):
+        chunk = ready[start:start + CHUNK_SIZE]
+        try:
+            chunk_results = redemption.run_transaction(db, _record_chunk, db, vendor_id, policy, chunk)
+        except redemption.RedemptionContention:
+            chunk_results = [_sale_result(sale['index'], sale['key'], 'failed',
+                                          error='Wallets were busy; retry these sales')
+                             for sale in chunk]
+        else:
+            # Cached snapshots of these customers now hold old balances
+            for sale, result in zip(chunk, chunk_results):
+                if result['status'] == 'created':
+                    customers.invalidate(sale['phone'])
+        for sale, result in zip(chunk, chunk_results):
+            results[sale['index']] = result
+
+    for index, first in repeats:
+        result = dict(results[first], index=index)
+        if result['status'] == 'created':
+            result['status'] = 'duplicate'
+            result.pop('wallet_balance', None)
+        results[index] = result
+    return results
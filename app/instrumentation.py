@@ -0,0 +1,80 @@
+"""Flask hooks feeding app.metrics, plus opt-in per-request profiling.
+
+Every request is timed from ``before_request`` until its body has been sent
+(``call_on_close``), so streamed exports are measured in full. Template
+renders are timed through Flask's template signals.
+
+With ``URS_PROFILING=1``, a request sent with an ``X-Profile: 1`` header
+runs under cProfile. The stats are written to ``PROFILE_DIR`` and the file
+name is returned in an ``X-Profile`` response header. Only the request
+thread is profiled, not the reads it fans out, and one request per worker
+is profiled at a time.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from flask import before_render_template, g, request, session, template_rendered
+
+from app import app, metrics
+
+PROFILING = os.environ.get('URS_PROFILING') == '1'
+PROFILE_DIR = os.environ.get('URS_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'urs-profiles'))
+PROFILE_TOP = 30  # functions logged per profiled request
+
+_profile_lock = threading.Lock()
+
+
+@app.before_request
+def start_request_metrics():
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    # Reading the session for static files would add Vary: Cookie to them
+    vendor = session.get('vendor_id') if request.endpoint not in ('static', 'asset') else None
+    g.request_stats = metrics.begin_request(route, vendor)
+
+    if PROFILING and request.headers.get('X-Profile') == '1' and _profile_lock.acquire(blocking=False):
+        import cProfile
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+        response.headers['X-Profile'] = _save_profile(profiler)
+
+    stats = g.pop('request_stats', None)
+    if stats is not None:
+        method, status = request.method, response.status_code
+        size = None if response.is_streamed else response.content_length
+        response.call_on_close(lambda: metrics.end_request(stats, method, status, size))
+    return response
+
+
+def _save_profile(profiler):
+    import pstats
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}.prof"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    stats = pstats.Stats(profiler)
+    app.logger.info("Profiled %s %s -> %s", request.method, request.path, name)
+    stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+    return name
+
+
+@before_render_template.connect_via(app)
+def _render_started(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _render_finished(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        metrics.render_latency.observe(time.perf_counter() - started.pop(), template=template.name)
@@ -0,0 +1,476 @@
+"""Request and Firestore metrics in Prometheus text format.
+
+Each process keeps counters and histograms in memory. Route latency, status
+codes and response sizes are recorded by the hooks in
+``app/instrumentation.py``. Firestore round trips, document reads and writes
+come from ``instrument_client``, which ``firebase_config.get_db`` applies to
+every client it creates. Reads and writes are labelled with the route and
+vendor of the request that made them. Work outside a request, such as export
+jobs, is labelled ``background``.
+
+Several gunicorn workers (and export processes) share one view: every
+process writes a JSON snapshot to ``METRICS_DIR`` every SNAPSHOT_INTERVAL
+seconds, and ``/metrics`` adds up all the snapshots on the host. Snapshot
+files are named by pid and a random suffix, so a new process that reuses a
+pid never overwrites an old one's counts. A process that exits, or is found
+dead, has its snapshot folded into RETIRED_FILE, so counters never go
+backwards and the directory holds one file per live process plus one. Give
+each deployment its own ``URS_METRICS_DIR``.
+"""
+from contextvars import ContextVar
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: no other workers to race with
+    fcntl = None
+
+METRICS_DIR = os.environ.get('URS_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'urs-metrics'))
+SNAPSHOT_INTERVAL = 5  # seconds
+RETIRED_FILE = 'retired.json'  # totals of processes that have exited
+# Vendor labels show who is burning read quota; set to 0 if there are too
+# many vendors for one series each
+VENDOR_LABEL = os.environ.get('URS_METRICS_VENDOR_LABEL', '1') != '0'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DOCUMENT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+BACKGROUND = 'background'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with _lock:
+            # Per-bucket (not cumulative) counts, then sum and count
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        return [[list(key), list(state)] for key, state in self.values.items()]
+
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+http_requests = _register(Counter(
+    'urs_http_requests_total', 'HTTP requests by route, method and status.',
+    ('route', 'method', 'status')))
+http_latency = _register(Histogram(
+    'urs_http_request_duration_seconds', 'Time to produce and send the response.', ('route',)))
+http_response_bytes = _register(Histogram(
+    'urs_http_response_bytes', 'Serialized response body size (buffered responses).',
+    ('route',), BYTES_BUCKETS))
+request_reads = _register(Histogram(
+    'urs_request_firestore_reads', 'Firestore documents read per request.', ('route',), DOCUMENT_BUCKETS))
+firestore_calls = _register(Counter(
+    'urs_firestore_calls_total', 'Firestore RPCs by method.', ('op',)))
+firestore_latency = _register(Histogram(
+    'urs_firestore_call_duration_seconds', 'Firestore RPC latency.', ('op',)))
+firestore_reads = _register(Counter(
+    'urs_firestore_documents_read_total', 'Billed Firestore document reads.', ('route', 'vendor')))
+firestore_writes = _register(Counter(
+    'urs_firestore_documents_written_total', 'Firestore document writes.', ('route', 'vendor')))
+render_latency = _register(Histogram(
+    'urs_template_render_duration_seconds', 'Jinja template render time.', ('template',)))
+export_latency = _register(Histogram(
+    'urs_export_duration_seconds', 'Export job build time.', ('format', 'status')))
+export_wait = _register(Histogram(
+    'urs_export_queue_seconds', 'Time export jobs wait for a pool slot.', ('format',)))
+
+
+class RequestStats:
+    """Firestore usage of one request, shared with the threads it fans out to."""
+
+    def __init__(self, route, vendor):
+        self.route = route
+        self.vendor = vendor if VENDOR_LABEL else ''
+        self.reads = 0
+        self.writes = 0
+        self.started = time.perf_counter()
+
+
+_current = ContextVar('urs_request_stats', default=None)
+
+
+def begin_request(route, vendor):
+    stats = RequestStats(route, vendor or '')
+    _current.set(stats)
+    return stats
+
+
+def end_request(stats, method, status, response_bytes=None):
+    """Record a finished request; call once its body has been sent."""
+    _current.set(None)
+    http_requests.inc(route=stats.route, method=method, status=status)
+    http_latency.observe(time.perf_counter() - stats.started, route=stats.route)
+    request_reads.observe(stats.reads, route=stats.route)
+    if response_bytes is not None:
+        http_response_bytes.observe(response_bytes, route=stats.route)
+    maybe_write_snapshot()
+
+
+def current_route():
+    """Route of the request this thread is serving, or ``background``."""
+    stats = _current.get()
+    return stats.route if stats else BACKGROUND
+
+
+def record_firestore(op, reads=0, writes=0, seconds=0.0, calls=1):
+    """Account for Firestore work against the current request, if any."""
+    if calls:
+        firestore_calls.inc(calls, op=op)
+        firestore_latency.observe(seconds, op=op)
+    stats = _current.get()
+    route, vendor = (stats.route, stats.vendor) if stats else (BACKGROUND, '')
+    if reads:
+        firestore_reads.inc(reads, route=route, vendor=vendor)
+    if writes:
+        firestore_writes.inc(writes, route=route, vendor=vendor)
+    if stats is not None:
+        with _lock:
+            stats.reads += reads
+            stats.writes += writes
+    elif calls:
+        maybe_write_snapshot()
+
+
+# Firestore client hooks
+
+_STREAMING_CALLS = ('batch_get_documents', 'run_query')
+_UNARY_CALLS = ('commit', 'begin_transaction', 'rollback', 'run_aggregation_query',
+                'list_documents', 'list_collection_ids', 'partition_query')
+
+
+class _CountedStream:
+    """Wrap a streaming RPC and count billed documents as responses arrive."""
+
+    def __init__(self, op, responses, started):
+        self.op = op
+        self.responses = iter(responses)
+        self.started = started
+        self.recorded = False
+        self.documents = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            response = next(self.responses)
+        except StopIteration:
+            if not self.recorded:
+                self._record(0)
+            if self.op == 'run_query' and not self.documents:
+                # An empty query still bills one read
+                record_firestore(self.op, reads=1, calls=0)
+            raise
+        pb = getattr(response, '_pb', response)
+        if self.op == 'run_query':
+            reads = 1 if pb.HasField('document') else 0
+        else:
+            reads = 1 if pb.WhichOneof('result') else 0
+        self.documents += reads
+        self._record(reads)
+        return response
+
+    def _record(self, reads):
+        if self.recorded:
+            record_firestore(self.op, reads=reads, calls=0)
+            return
+        self.recorded = True
+        record_firestore(self.op, reads=reads, seconds=time.perf_counter() - self.started)
+
+
+def _instrument(op, method):
+    def call(*args, **kwargs):
+        started = time.perf_counter()
+        result = method(*args, **kwargs)
+        if op in _STREAMING_CALLS:
+            return _CountedStream(op, result, started)
+        writes = 0
+        if op == 'commit':
+            request = kwargs.get('request')
+            writes = len(request.get('writes', ()) if isinstance(request, dict) else getattr(request, 'writes', ()))
+        record_firestore(op, reads=1 if op == 'run_aggregation_query' else 0, writes=writes,
+                         seconds=time.perf_counter() - started)
+        return result
+    return call
+
+
+def instrument_client(client):
+    """Record every RPC ``client`` makes; returns the client."""
+    if hasattr(client, 'observer'):
+        # The in-memory client reports its simulated round trips itself
+        client.observer = record_firestore
+        return client
+    api = client._firestore_api
+    for op in _STREAMING_CALLS + _UNARY_CALLS:
+        method = getattr(api, op, None)
+        if method is not None:
+            setattr(api, op, _instrument(op, method))
+    return client
+
+
+# Snapshots and exposition
+
+_last_snapshot = 0.0
+# Held while this process writes its snapshot, so request threads do not
+# race each other (or the exit hook) to replace the file
+_write_lock = threading.Lock()
+_retired = False
+
+
+def _new_process_key():
+    return f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+
+_process_key = _new_process_key()
+
+
+def _snapshot_path():
+    return os.path.join(METRICS_DIR, f"{_process_key}.json")
+
+
+def _snapshot():
+    with _lock:
+        return {metric.name: metric.snapshot() for metric in _registry}
+
+
+def _write_json(path, content):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(content, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class _DirectoryLock:
+    """Exclusive lock on METRICS_DIR while snapshots are folded or summed."""
+
+    def __enter__(self):
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        self.file = open(os.path.join(METRICS_DIR, 'lock'), 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        # Closing the file releases the lock
+        self.file.close()
+
+
+def _write_snapshot():
+    # Call with _write_lock held
+    global _last_snapshot
+    if _retired:
+        # Already folded into RETIRED_FILE; a new file would count twice
+        return
+    _last_snapshot = time.monotonic()
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(_snapshot_path(), _snapshot())
+    except OSError as e:
+        print(f"Could not write metrics snapshot: {e}")
+
+
+def write_snapshot():
+    with _write_lock:
+        _write_snapshot()
+
+
+def maybe_write_snapshot():
+    # Skip if another thread is writing; it is recent enough
+    if time.monotonic() - _last_snapshot >= SNAPSHOT_INTERVAL and _write_lock.acquire(blocking=False):
+        try:
+            _write_snapshot()
+        finally:
+            _write_lock.release()
+
+
+def _add(totals, snapshot):
+    for name, samples in snapshot.items():
+        merged = totals.setdefault(name, {})
+        for labels, value in samples:
+            key = tuple(labels)
+            if isinstance(value, list):
+                current = merged.get(key)
+                merged[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Running under another user, or no way to tell
+        return True
+    return True
+
+
+def _retire(paths):
+    """Fold the snapshots at ``paths`` into RETIRED_FILE and delete them.
+
+    Call with the directory lock held.
+    """
+    retired_path = os.path.join(METRICS_DIR, RETIRED_FILE)
+    totals = {}
+    _add(totals, _read_json(retired_path) or {})
+    for path in paths:
+        _add(totals, _read_json(path) or {})
+    _write_json(retired_path, {name: [[list(key), value] for key, value in samples.items()]
+                               for name, samples in totals.items()})
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _merged():
+    write_snapshot()
+    totals = {metric.name: {} for metric in _registry}
+    try:
+        with _DirectoryLock():
+            dead = []
+            for path in glob.glob(os.path.join(METRICS_DIR, '*-*.json')):
+                pid = os.path.basename(path).split('-', 1)[0]
+                # Killed before its atexit hook could retire it
+                if pid.isdigit() and not _is_running(int(pid)):
+                    dead.append(path)
+            if dead:
+                _retire(dead)
+            for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+                snapshot = _read_json(path)
+                if snapshot:
+                    _add(totals, {name: samples for name, samples in snapshot.items() if name in totals})
+    except OSError as e:
+        print(f"Could not read metrics snapshots: {e}")
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All processes' metrics on this host in Prometheus text format 0.0.4."""
+    totals = _merged()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for key, value in sorted(totals[metric.name].items()):
+            if metric.type == 'counter':
+                lines.append(f"{metric.name}{_label_text(metric.labels, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, value):
+                cumulative += count
+                labels = _label_text(metric.labels, key, [('le', _number(float(bound)))])
+                lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+            labels = _label_text(metric.labels, key, [('le', '+Inf')])
+            lines.append(f"{metric.name}_bucket{labels} {value[-1]}")
+            lines.append(f"{metric.name}_sum{_label_text(metric.labels, key)} {_number(value[-2])}")
+            lines.append(f"{metric.name}_count{_label_text(metric.labels, key)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+def _write_at_exit():
+    global _retired
+    if not any(metric.values for metric in _registry):
+        return
+    with _write_lock:
+        _write_snapshot()
+        try:
+            with _DirectoryLock():
+                _retire([_snapshot_path()])
+        except OSError as e:
+            print(f"Could not retire metrics snapshot: {e}")
+        _retired = True
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero under its own key; the parent's counts
+    # stay in the parent's snapshot
+    global _lock, _write_lock, _last_snapshot, _process_key
+    _lock = threading.Lock()
+    _write_lock = threading.Lock()
+    _last_snapshot = 0.0
+    _process_key = _new_process_key()
+    for metric in _registry:
+        metric.values = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_write_at_exit)
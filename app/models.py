@@ -1,28 +1,106 @@
-from datetime import datetime
+"""Compact records for the app's Firestore documents.
+
+Each record uses ``__slots__`` and is built once per document with
+``from_snapshot``; ``to_firestore`` gives back the dict to write. Timestamps
+are normalized to naive UTC ``datetime`` on the way in, whether Firestore
+returns them timezone-aware (with nanoseconds) or they come from older
+documents as ISO strings or epoch seconds.
+"""
+from datetime import datetime, timezone
+
+
+def normalize_timestamp(value):
+    """Return ``value`` as a plain naive UTC datetime (None stays None)."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        # Also drops Firestore's DatetimeWithNanoseconds subclass
+        return datetime(value.year, value.month, value.day, value.hour,
+                        value.minute, value.second, value.microsecond)
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    if isinstance(value, str):
+        return normalize_timestamp(datetime.fromisoformat(value.replace('Z', '+00:00')))
+    raise TypeError(f"Unsupported timestamp value: {value!r}")
+
 
 class FirestoreModel:
+    __slots__ = ('id',)
+
+    # Document fields in constructor order, and their defaults
+    fields = ()
+    defaults = {}
+    timestamp_fields = ()
+
+    @classmethod
+    def from_dict(cls, id, data):
+        record = cls.__new__(cls)
+        record.id = id
+        defaults = cls.defaults
+        for name in cls.fields:
+            setattr(record, name, data.get(name, defaults.get(name)))
+        for name in cls.timestamp_fields:
+            setattr(record, name, normalize_timestamp(getattr(record, name)))
+        return record
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Deserialize a document snapshot once; None if it does not exist."""
+        if not snapshot.exists:
+            return None
+        return cls.from_dict(snapshot.id, snapshot.to_dict())
+
+    def to_firestore(self):
+        """The document body to write (the id is the document's key)."""
+        return {name: getattr(self, name) for name in self.fields}
+
     def to_dict(self):
-        return self.__dict__
+        data = self.to_firestore()
+        data['id'] = self.id
+        return data
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.id!r})"
+
 
 class Vendor(FirestoreModel):
-    def __init__(self, id, name, email, vendor_type, subscription_status=True):
+    __slots__ = ('name', 'email', 'password', 'vendor_type', 'subscription_status')
+    fields = __slots__
+    defaults = {'subscription_status': True}
+
+    def __init__(self, id, name, email, vendor_type, subscription_status=True, password=None):
         self.id = id
         self.name = name
         self.email = email
+        self.password = password
         self.vendor_type = vendor_type
         self.subscription_status = subscription_status
 
+
 class Transaction(FirestoreModel):
-    def __init__(self, id, vendor_id, customer_id, amount, points_earned, points_redeemed=0):
+    __slots__ = ('vendor_id', 'customer_id', 'amount', 'points_earned', 'points_redeemed', 'timestamp')
+    fields = __slots__
+    defaults = {'amount': 0, 'points_earned': 0, 'points_redeemed': 0}
+    timestamp_fields = ('timestamp',)
+
+    def __init__(self, id, vendor_id, customer_id, amount, points_earned, points_redeemed=0, timestamp=None):
         self.id = id
         self.vendor_id = vendor_id
         self.customer_id = customer_id
         self.amount = amount
         self.points_earned = points_earned
         self.points_redeemed = points_redeemed
-        self.timestamp = datetime.utcnow()
+        self.timestamp = normalize_timestamp(timestamp) if timestamp else datetime.utcnow()
+
 
 class Customer(FirestoreModel):
+    __slots__ = ('name', 'email', 'phone', 'wallet_balance', 'created_at', 'updated_at')
+    fields = __slots__
+    defaults = {'wallet_balance': 0.0}
+    timestamp_fields = ('created_at', 'updated_at')
+
     def __init__(self, id, name, email, phone, wallet_balance=0.0):
         self.id = id
         self.name = name
@@ -32,12 +110,19 @@ class Customer(FirestoreModel):
         self.created_at = datetime.utcnow()
         self.updated_at = datetime.utcnow()
 
+
 class VendorType(FirestoreModel):
-    def __init__(self, vendor_id, threshold_amount, earn_percentage_min, 
+    __slots__ = ('vendor_id', 'threshold_amount', 'earn_percentage_min',
+                 'earn_percentage_max', 'redeem_percentage', 'can_redeem')
+    fields = __slots__
+    defaults = {'can_redeem': False}
+
+    def __init__(self, vendor_id, threshold_amount, earn_percentage_min,
                  earn_percentage_max, redeem_percentage, can_redeem=False):
+        self.id = vendor_id  # Policies are keyed by vendor id
         self.vendor_id = vendor_id
         self.threshold_amount = threshold_amount
         self.earn_percentage_min = earn_percentage_min
         self.earn_percentage_max = earn_percentage_max
         self.redeem_percentage = redeem_percentage
-        self.can_redeem = can_redeem
\ No newline at end of file
+        self.can_redeem = can_redeem
@@ -0,0 +1,33 @@
+"""Cursor-based paging over Firestore queries."""
+
+PAGE_SIZE = 500
+
+
+def paginate(query, order_field='timestamp', page_size=PAGE_SIZE, direction='ASCENDING'):
+    """Yield every document matched by ``query``, one page at a time.
+
+    Each page is a separate ``limit`` query resumed with ``start_after`` from
+    the last document of the previous page, so at most ``page_size``
+    snapshots are held in memory however large the result set is.
+    """
+    last_doc = None
+    while True:
+        docs, last_doc = fetch_page(query, order_field, page_size, last_doc, direction)
+        yield from docs
+        if last_doc is None:
+            return
+
+
+def fetch_page(query, order_field='timestamp', page_size=PAGE_SIZE, cursor=None, direction='ASCENDING'):
+    """Fetch one page of ``query`` after the ``cursor`` snapshot.
+
+    Returns ``(docs, last_doc)``; ``last_doc`` is the cursor for the next page,
+    or None once a short page shows there is nothing more.
+    """
+    page = query.order_by(order_field, direction=direction).limit(page_size)
+    if cursor is not None:
+        page = page.start_after(cursor)
+    docs = page.get()
+    if len(docs) < page_size:
+        return docs, None
+    return docs, docs[-1]
@@ -0,0 +1,173 @@
+"""Vendor password hashing.
+
+Passwords are stored as bcrypt hashes. The cost factor is calibrated on the
+machine the worker runs on: it is the highest cost (from MIN_ROUNDS to
+MAX_ROUNDS) whose hash takes at most TARGET_SECONDS. Set
+``URS_BCRYPT_ROUNDS`` to pin it instead.
+
+Hashing and checking run on a small per-worker pool of HASH_WORKERS threads.
+bcrypt releases the GIL, so a burst of logins keeps at most that many cores
+busy and the rest of the worker's threads keep serving other routes. At most
+MAX_PENDING operations may wait for the pool; beyond that ``PasswordBusy``
+is raised and the login is refused rather than queued.
+
+A successful login returns a fresh hash when the stored one should be
+replaced: legacy plaintext passwords, and hashes whose cost is below the
+calibrated cost or more than one round above it. The one-round margin keeps
+workers whose calibration lands on either side of a boundary from rehashing
+each other's hashes on every login.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import hmac
+import os
+import threading
+import time
+
+TARGET_SECONDS = float(os.environ.get('URS_BCRYPT_TARGET_MS', 250)) / 1000
+MIN_ROUNDS = 10
+MAX_ROUNDS = 15
+ROUNDS = int(os.environ['URS_BCRYPT_ROUNDS']) if os.environ.get('URS_BCRYPT_ROUNDS') else None
+
+HASH_WORKERS = int(os.environ.get('URS_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Waiting logins hold a request thread, so keep this plus
+# events.MAX_LISTENERS well under the gunicorn --threads set in render.yaml
+MAX_PENDING = int(os.environ.get('URS_HASH_MAX_PENDING', 8))
+
+# Cost at which calibration measures; each extra round doubles the time
+CALIBRATION_ROUNDS = 8
+CALIBRATION_SAMPLES = 3
+
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+
+class PasswordBusy(Exception):
+    """Too many password operations are already waiting in this worker."""
+
+
+_pool = None
+_pending = None
+_lock = threading.Lock()
+_calibrated = None
+_dummy_hash = None
+
+
+def calibrate(target=TARGET_SECONDS):
+    """Highest cost whose hash should take at most ``target`` seconds here."""
+    import bcrypt
+
+    samples = []
+    for _ in range(CALIBRATION_SAMPLES):
+        salt = bcrypt.gensalt(CALIBRATION_ROUNDS)
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        samples.append(time.perf_counter() - started)
+    base = sorted(samples)[len(samples) // 2]
+
+    rounds = MIN_ROUNDS
+    while rounds < MAX_ROUNDS and base * 2 ** (rounds + 1 - CALIBRATION_ROUNDS) <= target:
+        rounds += 1
+    return rounds
+
+
+def rounds():
+    """The cost new hashes are made with in this worker."""
+    global _calibrated
+    if ROUNDS is not None:
+        return ROUNDS
+    if _calibrated is None:
+        with _lock:
+            if _calibrated is None:
+                _calibrated = calibrate()
+                print(f"bcrypt cost calibrated to {_calibrated} rounds")
+    return _calibrated
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(BCRYPT_PREFIXES)
+
+
+def needs_rehash(stored):
+    if not is_hashed(stored):
+        return True
+    cost = int(stored.split('$')[2])
+    return cost < rounds() or cost > rounds() + 1
+
+
+def _hash(password):
+    import bcrypt
+
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds())).decode('utf-8')
+
+
+def _check(password, stored):
+    import bcrypt
+
+    global _dummy_hash
+    if not stored:
+        # Unknown account: spend the same time as a real check
+        if _dummy_hash is None:
+            _dummy_hash = _hash('dummy password')
+        bcrypt.checkpw(password.encode('utf-8'), _dummy_hash.encode('utf-8'))
+        return False, None
+
+    if is_hashed(stored):
+        ok = bcrypt.checkpw(password.encode('utf-8'), stored.encode('utf-8'))
+    else:
+        # Accounts registered before passwords were hashed
+        ok = hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    if ok and needs_rehash(stored):
+        return True, _hash(password)
+    return ok, None
+
+
+def _get_pool():
+    global _pool, _pending
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='bcrypt')
+            _pending = threading.BoundedSemaphore(MAX_PENDING)
+        return _pool, _pending
+
+
+def _run(function, *args):
+    if HASH_WORKERS < 1:
+        return function(*args)
+    pool, pending = _get_pool()
+    if not pending.acquire(blocking=False):
+        raise PasswordBusy()
+    future = pool.submit(function, *args)
+    future.add_done_callback(lambda f: pending.release())
+    return future.result()
+
+
+def hash_password(password):
+    """bcrypt hash of ``password`` at the calibrated cost."""
+    return _run(_hash, password)
+
+
+def verify(password, stored):
+    """Check ``password`` against a stored hash (or legacy plaintext).
+
+    Returns ``(ok, new_hash)``; ``new_hash`` is set when the caller should
+    save it in place of ``stored``. ``stored`` may be None for an unknown
+    account, which takes as long as a real check and returns False.
+    """
+    return _run(_check, password or '', stored)
+
+
+def _reset_pool():
+    # Threads do not survive fork; a child starts with no pool
+    global _pool, _pending, _lock
+    _pool = None
+    _pending = None
+    _lock = threading.Lock()
+
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+atexit.register(_shutdown_pool)
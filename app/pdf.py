@@ -0,0 +1,195 @@
+"""Streaming PDF writer for the transaction report.
+
+Writes PDF 1.4 directly with the built-in Helvetica fonts, so no external
+renderer is needed. Rows are laid out as they arrive and each page is
+emitted as soon as it fills, so memory depends on the page size, not on how
+many rows the report has.
+"""
+from datetime import datetime
+import zlib
+
+PAGE_WIDTH = 595  # A4 in points
+PAGE_HEIGHT = 842
+MARGIN = 54  # 0.75in
+
+FONT_SIZE = 9
+ROW_HEIGHT = 14
+HEADER_HEIGHT = 78
+
+COLUMNS = [
+    # (title, x offset from the left margin, right-aligned at that offset)
+    ('Transaction ID', 0, False),
+    ('Amount (INR)', 200, True),
+    ('Points Earned', 275, True),
+    ('Points Redeemed', 365, True),
+    ('Timestamp', 385, False),
+]
+
+ROWS_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN - HEADER_HEIGHT) // ROW_HEIGHT
+
+# Fixed object numbers; pages and their content streams are numbered from 5
+CATALOG_OBJ = 1
+PAGES_OBJ = 2
+FONT_OBJ = 3
+BOLD_FONT_OBJ = 4
+
+
+def _escape(text):
+    text = str(text).encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text_width(text, size):
+    # Close enough for right-aligning digits in Helvetica (0.556em each)
+    return len(text) * size * 0.556
+
+
+class TransactionReportPDF:
+    """Incrementally writes a paginated transaction report to ``write``.
+
+    ``write`` is any callable accepting bytes, e.g. ``file.write``.
+    """
+
+    def __init__(self, write, vendor, generated_at=None):
+        self._write_bytes = write
+        self._vendor = vendor
+        self._generated_at = generated_at or datetime.utcnow()
+        self._offset = 0
+        self._offsets = {}
+        self._next_obj = BOLD_FONT_OBJ + 1
+        self._page_objs = []
+        self._ops = []
+        self._rows_on_page = 0
+        self.row_count = 0
+        self.total_amount = 0
+        self.total_points_earned = 0
+        self.total_points_redeemed = 0
+
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._write_object(FONT_OBJ, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                     b'/Encoding /WinAnsiEncoding >>')
+        self._write_object(BOLD_FONT_OBJ, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold '
+                                          b'/Encoding /WinAnsiEncoding >>')
+
+    def _write(self, data):
+        self._write_bytes(data)
+        self._offset += len(data)
+
+    def _write_object(self, number, body):
+        self._offsets[number] = self._offset
+        self._write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def _allocate(self):
+        number = self._next_obj
+        self._next_obj += 1
+        return number
+
+    def _text(self, x, y, text, size=FONT_SIZE, bold=False, align_right=False):
+        if align_right:
+            x -= _text_width(text, size)
+        font = b'/F2' if bold else b'/F1'
+        self._ops.append(b'BT %s %d Tf %.2f %.2f Td (%s) Tj ET' % (
+            font, size, x, y, _escape(text).encode('latin-1')))
+
+    def _line(self, y):
+        self._ops.append(b'%.2f %.2f m %.2f %.2f l S' % (MARGIN, y, PAGE_WIDTH - MARGIN, y))
+
+    def _row_y(self, index):
+        return PAGE_HEIGHT - MARGIN - HEADER_HEIGHT - index * ROW_HEIGHT
+
+    def _start_page(self):
+        top = PAGE_HEIGHT - MARGIN
+        page_number = len(self._page_objs) + 1
+        self._text(MARGIN, top - 16, 'Transaction Report', size=16, bold=True)
+        self._text(MARGIN, top - 32, self._vendor.name or '', size=10, bold=True)
+        self._text(MARGIN, top - 45, self._vendor.email or '', size=9)
+        self._text(PAGE_WIDTH - MARGIN, top - 16, f'Page {page_number}', size=9, align_right=True)
+        self._text(PAGE_WIDTH - MARGIN, top - 32,
+                   f"Generated on: {self._generated_at.strftime('%Y-%m-%d %H:%M:%S UTC')}",
+                   size=9, align_right=True)
+        header_y = top - HEADER_HEIGHT + ROW_HEIGHT
+        for title, x, right in COLUMNS:
+            self._text(MARGIN + x, header_y, title, bold=True, align_right=right)
+        self._line(header_y - 4)
+
+    def _finish_page(self):
+        content = zlib.compress(b'\n'.join(self._ops))
+        content_obj = self._allocate()
+        page_obj = self._allocate()
+        self._write_object(content_obj, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content)
+                           + content + b'\nendstream')
+        self._write_object(page_obj, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+                                     b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> '
+                                     b'/Contents %d 0 R >>' % (
+                                         PAGES_OBJ, PAGE_WIDTH, PAGE_HEIGHT,
+                                         FONT_OBJ, BOLD_FONT_OBJ, content_obj))
+        self._page_objs.append(page_obj)
+        self._ops = []
+        self._rows_on_page = 0
+
+    def add_row(self, transaction_id, amount, points_earned, points_redeemed, timestamp):
+        if self._rows_on_page == 0 and not self._ops:
+            self._start_page()
+
+        y = self._row_y(self._rows_on_page)
+        cells = [
+            transaction_id,
+            f'{amount:.2f}',
+            f'{points_earned:g}' if isinstance(points_earned, float) else str(points_earned),
+            f'{points_redeemed:g}' if isinstance(points_redeemed, float) else str(points_redeemed),
+            timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        ]
+        for (title, x, right), value in zip(COLUMNS, cells):
+            self._text(MARGIN + x, y, value, align_right=right)
+
+        self.row_count += 1
+        self.total_amount += amount
+        self.total_points_earned += points_earned
+        self.total_points_redeemed += points_redeemed
+        self._rows_on_page += 1
+        if self._rows_on_page == ROWS_PER_PAGE:
+            self._finish_page()
+
+    def _summary(self):
+        # Totals are only known once every row is in, so they close the report
+        if self._rows_on_page + 5 > ROWS_PER_PAGE:
+            if self._ops:
+                self._finish_page()
+        if not self._ops:
+            self._start_page()
+        y = self._row_y(self._rows_on_page) - ROW_HEIGHT
+        self._line(y + ROW_HEIGHT - 4)
+        lines = [
+            f'Total Transactions: {self.row_count}',
+            f'Total Amount: INR {self.total_amount:.2f}',
+            f'Total Points Earned: {self.total_points_earned:g}',
+            f'Total Points Redeemed: {self.total_points_redeemed:g}',
+        ]
+        for i, text in enumerate(lines):
+            self._text(MARGIN, y - i * ROW_HEIGHT, text, size=10, bold=True)
+        self._finish_page()
+
+    def close(self):
+        self._summary()
+        kids = b' '.join(b'%d 0 R' % number for number in self._page_objs)
+        self._write_object(PAGES_OBJ, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            kids, len(self._page_objs)))
+        self._write_object(CATALOG_OBJ, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_OBJ)
+
+        xref_offset = self._offset
+        size = self._next_obj
+        entries = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for number in range(1, size):
+            entries.append(b'%010d 00000 n \n' % self._offsets[number])
+        self._write(b''.join(entries))
+        self._write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            size, CATALOG_OBJ, xref_offset))
+
+
+def write_transactions_pdf(write, vendor, transactions):
+    """Render ``transactions`` (Transaction records) as a report through ``write``."""
+    report = TransactionReportPDF(write, vendor)
+    for t in transactions:
+        report.add_row(t.id, t.amount, t.points_earned, t.points_redeemed, t.timestamp)
+    report.close()
+    return report
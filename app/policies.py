@@ -0,0 +1,141 @@
+"""Vendor reward policies and their per-worker cache.
+
+Policies live at ``vendor_policies/{vendor_id}`` and only change at
+registration, so checkout reads them from a bounded LRU/TTL cache and falls
+back to one direct document get on a miss.
+"""
+from app.cache import LocalCache
+
+POLICIES_COLLECTION = 'vendor_policies'
+
+POLICY_CACHE_SIZE = 4096
+POLICY_CACHE_TTL = 600  # seconds
+
+# Reward rules by business size
+POLICY_SETTINGS = {
+    'small': {
+        'threshold': 50,
+        'earn_min': 5,
+        'earn_max': 10,
+        'redeem': 5,
+        'can_redeem': True
+    },
+    'medium': {
+        'threshold': 100,
+        'earn_min': 10,
+        'earn_max': 15,
+        'redeem': 10,
+        'can_redeem': True
+    },
+    'large': {
+        'threshold': 200,
+        'earn_min': 15,
+        'earn_max': 20,
+        'redeem': 15,
+        'can_redeem': True
+    }
+}
+
+MIGRATION_BATCH_SIZE = 250  # each re-keyed policy is a set plus a delete
+
+_cache = LocalCache(maxsize=POLICY_CACHE_SIZE, ttl=POLICY_CACHE_TTL)
+
+
+def build_policy(vendor_id, vendor_type):
+    settings = POLICY_SETTINGS[vendor_type]
+    return {
+        'vendor_id': vendor_id,
+        'threshold_amount': settings['threshold'],
+        'earn_percentage_min': settings['earn_min'],
+        'earn_percentage_max': settings['earn_max'],
+        'redeem_percentage': settings['redeem'],
+        'can_redeem': settings['can_redeem']
+    }
+
+
+def policy_ref(db, vendor_id):
+    return db.collection(POLICIES_COLLECTION).document(vendor_id)
+
+
+def get_policy(db, vendor_id):
+    """Return the vendor's policy dict, or None if it has none."""
+    policy = _cache.get(vendor_id)
+    if policy is not None:
+        return policy
+
+    snapshot = policy_ref(db, vendor_id).get()
+    if not snapshot.exists:
+        return None
+    policy = snapshot.to_dict()
+    _cache.set(vendor_id, policy)
+    return policy
+
+
+def save_policy(db, vendor_id, policy):
+    policy_ref(db, vendor_id).set(policy)
+    _cache.set(vendor_id, policy)
+
+
+def delete_policy(db, vendor_id):
+    policy_ref(db, vendor_id).delete()
+    invalidate(vendor_id)
+
+
+def invalidate(vendor_id=None):
+    """Drop one vendor's cached policy, or every cached policy."""
+    if vendor_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(vendor_id)
+
+
+def warm(db):
+    """Preload up to POLICY_CACHE_SIZE policies; failures only cost cache misses."""
+    try:
+        loaded = 0
+        for doc in db.collection(POLICIES_COLLECTION).limit(POLICY_CACHE_SIZE).stream():
+            policy = doc.to_dict()
+            # Auto-id policies from before the migration are not reachable by vendor id
+            if doc.id == policy.get('vendor_id'):
+                _cache.set(doc.id, policy)
+                loaded += 1
+        return loaded
+    except Exception as e:
+        print(f"Policy cache warm-up failed: {e}")
+        return 0
+
+
+def migrate_policy_ids(db):
+    """Re-key auto-id policy documents to ``vendor_policies/{vendor_id}``.
+
+    If a vendor already has a correctly keyed policy, that one is kept and
+    the auto-id duplicate is removed. Returns the number of documents moved.
+    """
+    collection = db.collection(POLICIES_COLLECTION)
+    stray = [doc for doc in collection.stream() if doc.id != doc.to_dict().get('vendor_id')]
+
+    moved = 0
+    keyed = set()
+    batch = db.batch()
+    pending = 0
+    for doc in stray:
+        policy = doc.to_dict()
+        vendor_id = policy.get('vendor_id')
+        if not vendor_id:
+            continue  # Nothing to key it by; leave it for a human to look at
+        target = collection.document(vendor_id)
+        if vendor_id not in keyed and not target.get().exists:
+            batch.set(target, policy)
+            moved += 1
+        keyed.add(vendor_id)
+        batch.delete(doc.reference)
+        pending += 1
+        if pending == MIGRATION_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    invalidate()
+    return moved
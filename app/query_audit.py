@@ -0,0 +1,317 @@
+"""Query auditing: the shape of every Firestore query the app runs.
+
+With ``URS_QUERY_AUDIT=1``, ``instrument_client`` records each query by its
+shape: the collection, which fields it filters by equality or by range, its
+order, and whether it has a limit or resumes from a cursor. Values are
+dropped, so every vendor's dashboard query is one shape. For each shape it
+keeps how often it ran, the documents it returned, its latency and the
+routes that issued it (``report``).
+
+Two kinds of shape are flagged, and printed the first time a process runs
+one:
+
+* unbounded: no range filter, and either no limit or paged through with a
+  cursor. It reads everything its equality filters match, such as a
+  vendor's whole history.
+* unindexed: it needs a composite index that INDEXES_FILE does not declare.
+  Firestore refuses such a query with FAILED_PRECONDITION.
+
+``manifest`` writes the composite indexes the recorded shapes need in the
+``firestore.indexes.json`` format that ``firebase deploy`` reads.
+``benchmarks/audit_queries.py`` runs the routes on the in-memory backend and
+fails if the committed file misses an index.
+"""
+from collections import namedtuple
+import json
+import os
+import threading
+import time
+
+from app import metrics
+
+ENABLED = os.environ.get('URS_QUERY_AUDIT') == '1'
+INDEXES_FILE = os.environ.get('URS_FIRESTORE_INDEXES', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'firestore.indexes.json'))
+
+EQUALITY_OPS = ('==', 'in', 'array_contains', 'array_contains_any')
+ARRAY_OPS = ('array_contains', 'array_contains_any')
+
+# Field filter operators as the Firestore API names them
+_API_OPS = {
+    'EQUAL': '==', 'NOT_EQUAL': '!=', 'LESS_THAN': '<', 'LESS_THAN_OR_EQUAL': '<=',
+    'GREATER_THAN': '>', 'GREATER_THAN_OR_EQUAL': '>=', 'IN': 'in', 'NOT_IN': 'not-in',
+    'ARRAY_CONTAINS': 'array_contains', 'ARRAY_CONTAINS_ANY': 'array_contains_any',
+}
+
+# ``equalities`` and ``ranges`` are sorted ``(field, op)`` pairs and
+# ``orders`` the ``(field, 'ASCENDING' | 'DESCENDING')`` pairs of order_by
+QueryShape = namedtuple('QueryShape', 'collection equalities ranges orders limited paged collection_group')
+
+_stats = {}
+_lock = threading.Lock()
+_declared = None
+
+
+def shape(collection, filters, orders=(), limit=None, paged=False, collection_group=False):
+    """The shape of a query on ``collection`` with ``(field, op)`` ``filters``."""
+    filters = sorted(set(filters))
+    orders = list(orders)
+    if orders and orders[-1][0] == '__name__':
+        # The client adds this tie-breaker to cursor queries; every index ends with it
+        orders.pop()
+    return QueryShape(
+        collection=collection,
+        equalities=tuple((field, op) for field, op in filters if op in EQUALITY_OPS),
+        ranges=tuple((field, op) for field, op in filters if op not in EQUALITY_OPS),
+        orders=tuple((field, 'DESCENDING' if direction in ('DESCENDING', 'desc') else 'ASCENDING')
+                     for field, direction in orders),
+        limited=limit is not None,
+        paged=paged,
+        collection_group=collection_group,
+    )
+
+
+def describe(query_shape):
+    parts = [query_shape.collection]
+    filters = query_shape.equalities + query_shape.ranges
+    if filters:
+        parts.append('where ' + ' and '.join(f"{field} {op}" for field, op in filters))
+    if query_shape.orders:
+        parts.append('order by ' + ', '.join(f"{field} {direction.lower()}"
+                                             for field, direction in query_shape.orders))
+    if query_shape.limited:
+        parts.append('limit' + (' + cursor' if query_shape.paged else ''))
+    return ' '.join(parts)
+
+
+def _index_parts(query_shape):
+    equal_fields = []
+    for field, op in query_shape.equalities:
+        entry = (field, 'CONTAINS' if op in ARRAY_OPS else 'ASCENDING')
+        if entry not in equal_fields:
+            equal_fields.append(entry)
+
+    tail = [(field, direction) for field, direction in query_shape.orders
+            if field not in dict(equal_fields)]
+    for field, _ in query_shape.ranges:
+        if field not in dict(tail):
+            tail.append((field, 'ASCENDING'))
+    return equal_fields, tail
+
+
+def index_fields(query_shape):
+    """``[(field, order), ...]`` of the composite index a shape needs, or None.
+
+    Equality fields come first, then the order_by fields, then range fields
+    not already ordered by (Firestore orders by them implicitly). Queries
+    that single-field indexes can serve need none: equality filters only, or
+    everything on one field.
+    """
+    equal_fields, tail = _index_parts(query_shape)
+    if not tail or (not equal_fields and len(tail) == 1):
+        return None
+    return equal_fields + tail
+
+
+def is_unbounded(query_shape):
+    return not query_shape.ranges and (not query_shape.limited or query_shape.paged)
+
+
+def _index_entry(query_shape, fields):
+    return {
+        'collectionGroup': query_shape.collection,
+        'queryScope': 'COLLECTION_GROUP' if query_shape.collection_group else 'COLLECTION',
+        'fields': [{'fieldPath': field, 'arrayConfig': order} if order == 'CONTAINS'
+                   else {'fieldPath': field, 'order': order}
+                   for field, order in fields],
+    }
+
+
+def _entry_fields(entry):
+    return [(field['fieldPath'], field.get('order') or field.get('arrayConfig')) for field in entry['fields']]
+
+
+def declared_indexes():
+    """The composite indexes in INDEXES_FILE; none if it does not exist."""
+    global _declared
+    if _declared is None:
+        try:
+            with open(INDEXES_FILE) as f:
+                _declared = json.load(f).get('indexes', [])
+        except FileNotFoundError:
+            _declared = []
+    return _declared
+
+
+def is_indexed(query_shape, indexes=None):
+    """True if ``query_shape`` needs no composite index or one of ``indexes`` serves it."""
+    fields = index_fields(query_shape)
+    if fields is None:
+        return True
+    target = _index_entry(query_shape, fields)
+    equal_count = len(_index_parts(query_shape)[0])
+    for entry in declared_indexes() if indexes is None else indexes:
+        if (entry['collectionGroup'], entry.get('queryScope', 'COLLECTION')) != \
+                (target['collectionGroup'], target['queryScope']):
+            continue
+        declared = _entry_fields(entry)
+        # Equality fields may be declared in any order
+        if (len(declared) == len(fields)
+                and set(declared[:equal_count]) == set(fields[:equal_count])
+                and declared[equal_count:] == fields[equal_count:]):
+            return True
+    return False
+
+
+def record(query_shape, documents, seconds):
+    """Account one run of a query that returned ``documents``."""
+    route = metrics.current_route()
+    with _lock:
+        stats = _stats.get(query_shape)
+        first = stats is None
+        if first:
+            stats = _stats[query_shape] = {'count': 0, 'documents': 0, 'max_documents': 0,
+                                           'seconds': 0.0, 'max_seconds': 0.0, 'routes': set()}
+        stats['count'] += 1
+        stats['documents'] += documents
+        stats['max_documents'] = max(stats['max_documents'], documents)
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['routes'].add(route)
+    if first:
+        flags = flags_for(query_shape)
+        if flags:
+            print(f"Query audit: {' and '.join(flags)} query {describe(query_shape)} (from {route})")
+
+
+def flags_for(query_shape):
+    flags = []
+    if is_unbounded(query_shape):
+        flags.append('unbounded')
+    if not is_indexed(query_shape):
+        flags.append('unindexed')
+    return flags
+
+
+def report():
+    """Recorded shapes, most documents read first."""
+    with _lock:
+        rows = [dict(stats, shape=query_shape, routes=sorted(stats['routes']))
+                for query_shape, stats in _stats.items()]
+    for row in rows:
+        row['query'] = describe(row['shape'])
+        row['flags'] = flags_for(row['shape'])
+    rows.sort(key=lambda row: row['documents'], reverse=True)
+    return rows
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def manifest(shapes=None, existing=None):
+    """``firestore.indexes.json`` content covering ``shapes`` (default: all recorded).
+
+    Indexes in ``existing`` (default: INDEXES_FILE) are kept, so a run that
+    skips a code path does not drop the index it needs.
+    """
+    if shapes is None:
+        with _lock:
+            shapes = list(_stats)
+    indexes = list(declared_indexes() if existing is None else existing)
+    for query_shape in shapes:
+        fields = index_fields(query_shape)
+        if fields is not None and not is_indexed(query_shape, indexes):
+            indexes.append(_index_entry(query_shape, fields))
+    indexes.sort(key=lambda entry: (entry['collectionGroup'], _entry_fields(entry)))
+    return {'indexes': indexes, 'fieldOverrides': []}
+
+
+def write_manifest(path=None, **kwargs):
+    global _declared
+    content = manifest(**kwargs)
+    with open(path or INDEXES_FILE, 'w') as f:
+        json.dump(content, f, indent=2)
+        f.write('\n')
+    if path is None or path == INDEXES_FILE:
+        _declared = content['indexes']
+    return content
+
+
+# Client hooks
+
+def _observe_memory(collection_path, filters, orders, limit, paged, documents, seconds):
+    collection = collection_path.rsplit('/', 1)[-1]
+    record(shape(collection, filters, orders, limit, paged), documents, seconds)
+
+
+def _filters_from_api(where):
+    if 'composite_filter' in where:
+        filters = []
+        for child in where.composite_filter.filters:
+            filters.extend(_filters_from_api(child))
+        return filters
+    if 'field_filter' in where:
+        return [(where.field_filter.field.field_path, _API_OPS[where.field_filter.op.name])]
+    if 'unary_filter' in where:
+        # IS_NULL / IS_NAN are equalities, IS_NOT_NULL / IS_NOT_NAN ranges
+        op = '!=' if where.unary_filter.op.name.startswith('IS_NOT') else '=='
+        return [(where.unary_filter.field.field_path, op)]
+    return []
+
+
+def shape_from_request(request):
+    """The shape of a RunQuery request's structured query."""
+    query = request['structured_query'] if isinstance(request, dict) else request.structured_query
+    selector = query.from_[0]
+    filters = _filters_from_api(query.where) if 'where' in query else []
+    orders = [(order.field.field_path, order.direction.name) for order in query.order_by]
+    return shape(selector.collection_id, filters, orders,
+                 limit=query.limit if 'limit' in query else None,
+                 paged='start_at' in query,
+                 collection_group=selector.all_descendants)
+
+
+class _AuditedStream:
+    """Count a RunQuery stream's documents and record its shape when it ends."""
+
+    def __init__(self, query_shape, responses, started):
+        self.query_shape = query_shape
+        self.responses = iter(responses)
+        self.started = started
+        self.documents = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            response = next(self.responses)
+        except StopIteration:
+            record(self.query_shape, self.documents, time.perf_counter() - self.started)
+            raise
+        pb = getattr(response, '_pb', response)
+        if pb.HasField('document'):
+            self.documents += 1
+        return response
+
+
+def instrument_client(client):
+    """Audit every query ``client`` runs, if URS_QUERY_AUDIT is set; returns the client."""
+    if not ENABLED:
+        return client
+    if hasattr(client, 'query_observer'):
+        client.query_observer = _observe_memory
+        return client
+    api = client._firestore_api
+    run_query = api.run_query
+
+    def audited_run_query(*args, **kwargs):
+        started = time.perf_counter()
+        responses = run_query(*args, **kwargs)
+        request = kwargs.get('request', args[0] if args else None)
+        return _AuditedStream(shape_from_request(request), responses, started)
+
+    api.run_query = audited_run_query
+    return client
@@ -0,0 +1,136 @@
+"""Atomic checkout for apply_discount.
+
+The wallet change, ledger row, daily rollup and vendor watermark are always
+committed together, so concurrent tills cannot lose an update and a crash
+cannot leave wallet and ledger out of sync. Wallets are sharded counters
+(``app/wallets.py``): a sale that only adds points writes a random shard,
+and one that redeems points takes them from the shards holding them. Two
+paths, both atomic:
+
+* When the till holds a recent customer snapshot (from the check screen) the
+  writes go out as one batch. Any points taken carry ``last_update_time``
+  preconditions on the documents they come from: a single round trip with
+  no reads.
+* Otherwise, or if the snapshot turns out to be stale, the wallet is read
+  inside a Firestore transaction. Contended transactions are retried with
+  jittered exponential backoff.
+"""
+import random
+import time
+
+from app import customers, rollups, wallets, watermarks
+from app.models import Transaction
+
+# firebase_admin and google.api_core are imported where they are used, which
+# keeps the Firestore client libraries off the worker boot path
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.05  # seconds
+BACKOFF_MAX = 1.0
+
+
+class CustomerNotFound(Exception):
+    """The customer document no longer exists."""
+
+
+class RedemptionContention(Exception):
+    """The customer's wallet stayed contended through every retry."""
+
+
+def compute_redemption(wallet_balance, bill_amount, policy):
+    """Apply the vendor policy to a bill; returns (discount, final_bill, points_earned)."""
+    discount = min(wallet_balance, bill_amount) if policy['can_redeem'] else 0
+    final_bill = bill_amount - discount
+    points_earned = (final_bill * policy['earn_percentage_max']) / 100
+    return discount, final_bill, points_earned
+
+
+def _write_sale(writer, db, customer_id, wallet, vendor_id, bill_amount, policy, preconditions=False):
+    discount, final_bill, points_earned = compute_redemption(wallet.balance, bill_amount, policy)
+
+    # Use the document ID as customer_id
+    transaction_data = Transaction(None, vendor_id, customer_id, bill_amount,
+                                   points_earned, discount).to_firestore()
+
+    # All writes are buffered and sent in the single commit
+    customer_ref = db.collection(customers.CUSTOMERS_COLLECTION).document(customer_id)
+    wallets.apply(writer, db, customer_ref, wallet, points_earned - discount, preconditions)
+    ledger_ref = db.collection('transactions').document()
+    writer.set(ledger_ref, transaction_data)
+    rollups.record_transaction(db, transaction_data, writer=writer)
+    watermarks.bump(db, vendor_id, writer=writer)
+
+    return {
+        'customer_id': customer_id,
+        'amount': bill_amount,
+        'discount': discount,
+        'final_bill': final_bill,
+        'points_earned': points_earned,
+        'wallet_balance': wallet.balance - discount + points_earned,
+        'transaction': transaction_data,
+        'transaction_id': ledger_ref.id,
+    }
+
+
+def _redeem(transaction, db, customer_id, vendor_id, bill_amount, policy):
+    # Reading the wallet through the transaction makes the commit fail if
+    # another till takes points from it before we write
+    customer_ref = db.collection(customers.CUSTOMERS_COLLECTION).document(customer_id)
+    snapshot, wallet = wallets.read(db, customer_ref, transaction=transaction)
+    if not snapshot.exists:
+        raise CustomerNotFound(customer_id)
+    return _write_sale(transaction, db, customer_id, wallet, vendor_id, bill_amount, policy)
+
+
+def run_transaction(db, function, *args, max_attempts=MAX_ATTEMPTS):
+    """Run ``function(transaction, *args)`` in a Firestore transaction.
+
+    Contended commits are retried with jittered exponential backoff;
+    RedemptionContention is raised once ``max_attempts`` have all aborted.
+    """
+    from firebase_admin import firestore
+    from google.api_core import exceptions
+
+    for attempt in range(max_attempts):
+        try:
+            return firestore.transactional(function)(db.transaction(max_attempts=1), *args)
+        except exceptions.Aborted:
+            pass
+        except ValueError as e:
+            # transactional() wraps an aborted commit in ValueError
+            if not isinstance(e.__cause__, exceptions.Aborted):
+                raise
+        if attempt + 1 < max_attempts:
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+    raise RedemptionContention()
+
+
+def _redeem_transactionally(db, customer_id, vendor_id, bill_amount, policy, max_attempts):
+    try:
+        return run_transaction(db, _redeem, db, customer_id, vendor_id, bill_amount, policy,
+                               max_attempts=max_attempts)
+    except RedemptionContention:
+        raise RedemptionContention(customer_id) from None
+
+
+def redeem(db, customer, vendor_id, bill_amount, policy, max_attempts=MAX_ATTEMPTS):
+    """Record a sale for ``customer`` (a customers.CustomerSnapshot) atomically."""
+    from google.api_core import exceptions
+
+    if customer.wallet is not None:
+        batch = db.batch()
+        result = _write_sale(batch, db, customer.id, customer.wallet, vendor_id, bill_amount, policy,
+                             preconditions=True)
+        try:
+            batch.commit()
+        except (exceptions.FailedPrecondition, exceptions.NotFound):
+            # Points were taken from the wallet since the snapshot was read
+            pass
+        else:
+            # The cached snapshot's shard values are out of date now
+            customers.invalidate(customer.data.get('phone', ''))
+            return result
+
+    result = _redeem_transactionally(db, customer.id, vendor_id, bill_amount, policy, max_attempts)
+    customers.invalidate(customer.data.get('phone', ''))
+    return result
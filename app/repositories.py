@@ -0,0 +1,172 @@
+"""Data access for the app's Firestore collections.
+
+Route handlers go through these repositories instead of calling
+``db.collection(...)`` directly. They only rely on the Firestore client API,
+so the same code runs against Cloud Firestore or the in-memory client
+(``URS_BACKEND=memory``, see ``firebase_config.get_db``).
+"""
+from app import customers, ingest, policies, redemption, rollups, vendors, wallets, watermarks
+from app.models import Transaction, Vendor
+from app.pagination import fetch_page
+
+
+class Repository:
+    """Base class; ``db`` is resolved on every use through ``connect``."""
+
+    def __init__(self, connect):
+        self._connect = connect
+
+    @property
+    def db(self):
+        return self._connect()
+
+
+class VendorRepository(Repository):
+    collection_name = vendors.VENDORS_COLLECTION
+
+    def _collection(self):
+        return self.db.collection(self.collection_name)
+
+    def get(self, vendor_id, use_cache=True):
+        """The vendor's profile (no password hash), usually from the worker cache."""
+        return vendors.get_vendor(self.db, vendor_id, use_cache=use_cache)
+
+    def remember(self, vendor):
+        vendors.remember(vendor)
+
+    def find_by_email(self, email):
+        docs = self._collection().where('email', '==', email).limit(1).get()
+        return Vendor.from_snapshot(docs[0]) if docs else None
+
+    def create(self, vendor):
+        """Write a new Vendor record under a generated id; returns the id."""
+        ref = self._collection().document()
+        ref.set(vendor.to_firestore())
+        vendor.id = ref.id
+        return ref.id
+
+    def update_password(self, vendor_id, password_hash):
+        self._collection().document(vendor_id).update({'password': password_hash})
+
+    def delete(self, vendor_id):
+        self._collection().document(vendor_id).delete()
+        vendors.invalidate(vendor_id)
+
+
+class PolicyRepository(Repository):
+    def get(self, vendor_id):
+        return policies.get_policy(self.db, vendor_id)
+
+    def create_for(self, vendor_id, vendor_type):
+        policy = policies.build_policy(vendor_id, vendor_type)
+        policies.save_policy(self.db, vendor_id, policy)
+        return policy
+
+    def delete(self, vendor_id):
+        policies.delete_policy(self.db, vendor_id)
+
+    def warm(self):
+        return policies.warm(self.db)
+
+    def migrate_ids(self):
+        return policies.migrate_policy_ids(self.db)
+
+
+class CustomerRepository(Repository):
+    def find_by_phone(self, phone, use_cache=True):
+        return customers.find_customer(self.db, phone, use_cache=use_cache)
+
+    def build_phone_index(self):
+        return customers.build_phone_index(self.db)
+
+    def migrate_wallets(self):
+        return wallets.migrate(self.db, customers.CUSTOMERS_COLLECTION)
+
+
+class TransactionRepository(Repository):
+    collection_name = 'transactions'
+
+    def query(self, vendor_id, start=None, end=None):
+        """Query for a vendor's transactions with ``start <= timestamp < end``."""
+        query = self.db.collection(self.collection_name).where('vendor_id', '==', vendor_id)
+        # Filter in the query so history outside the range is never read
+        if start:
+            query = query.where('timestamp', '>=', start)
+        if end:
+            query = query.where('timestamp', '<', end)
+        return query
+
+    def in_range(self, vendor_id, start=None, end=None):
+        for snapshot in self.query(vendor_id, start, end).stream():
+            yield Transaction.from_snapshot(snapshot)
+
+    def page(self, vendor_id, start=None, end=None, limit=50, cursor=None):
+        """One page of a vendor's transactions, newest first.
+
+        ``cursor`` is the id of the last transaction of the previous page.
+        Returns ``(records, next_cursor)``; raises ValueError for a cursor
+        that is not one of this vendor's transactions.
+        """
+        cursor_doc = None
+        if cursor:
+            cursor_doc = self.db.collection(self.collection_name).document(cursor).get()
+            if not cursor_doc.exists or cursor_doc.to_dict().get('vendor_id') != vendor_id:
+                raise ValueError('Invalid cursor')
+        docs, last_doc = fetch_page(self.query(vendor_id, start, end), 'timestamp', limit,
+                                    cursor_doc, direction='DESCENDING')
+        return [Transaction.from_snapshot(doc) for doc in docs], last_doc.id if last_doc else None
+
+    def latest(self, vendor_id):
+        docs = self.query(vendor_id)\
+                   .order_by('timestamp', direction='DESCENDING')\
+                   .limit(1).get()
+        return Transaction.from_snapshot(docs[0]) if docs else None
+
+    def record_sale(self, customer, vendor_id, bill_amount, policy):
+        return redemption.redeem(self.db, customer, vendor_id, bill_amount, policy)
+
+    def record_sales(self, vendor_id, items, policy):
+        """Record a till's batch of sales; see app/ingest.py."""
+        return ingest.record_sales(self.db, vendor_id, items, policy)
+
+
+class RollupRepository(Repository):
+    def load(self, vendor_id, days):
+        return rollups.load_rollups(self.db, vendor_id, days)
+
+    def backfill(self, vendor_id=None):
+        return rollups.backfill(self.db, vendor_id)
+
+
+class WatermarkRepository(Repository):
+    def current(self, vendor_id):
+        return watermarks.current(self.db, vendor_id)
+
+    def bump(self, vendor_id):
+        watermarks.bump(self.db, vendor_id)
+
+    def migrate(self):
+        return watermarks.migrate(self.db)
+
+
+class Repositories:
+    """All repositories, bound to one client or to a function returning one.
+
+    Passing ``connect`` (e.g. ``firebase_config.get_db``) defers creating the
+    client to the first query, so importing the app opens no connection.
+    """
+
+    def __init__(self, db=None, connect=None):
+        if connect is None:
+            connect = lambda: db
+        self._connect = connect
+        self.vendors = VendorRepository(connect)
+        self.policies = PolicyRepository(connect)
+        self.customers = CustomerRepository(connect)
+        self.transactions = TransactionRepository(connect)
+        self.rollups = RollupRepository(connect)
+        self.watermarks = WatermarkRepository(connect)
+
+    @property
+    def db(self):
+        return self._connect()
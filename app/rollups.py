@@ -0,0 +1,260 @@
+"""Per-vendor, per-day transaction rollups.
+
+Documents in ``vendor_daily_rollups`` summarise one vendor's sales for one
+UTC day, so analytics reads a document per day instead of every raw
+transaction in the window. A busy vendor's day is a sharded counter
+(``app/counters.py``): each sale adds to one of VENDOR_SHARDS documents,
+``{vendor_id}_{date}`` or ``{vendor_id}_{date}_{n}``, and readers merge the
+shards of each day. Only shards that were written exist, so a quiet day is
+still one document.
+"""
+from datetime import datetime, timedelta
+import hashlib
+import math
+
+from app import counters, watermarks
+from app.models import Transaction
+from app.pagination import paginate
+
+# firebase_admin is imported where it is used, which keeps the Firestore
+# client libraries off the worker boot path
+
+ROLLUPS_COLLECTION = 'vendor_daily_rollups'
+
+# Distinct customers are tracked with a linear-counting sketch: each customer
+# id hashes to one of SKETCH_BUCKETS buckets and a rollup stores the set of
+# buckets it has seen. Sets from several days merge with a plain union.
+SKETCH_BUCKETS = 4096
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def day_key(value):
+    return value.strftime('%Y-%m-%d')
+
+
+def rollup_id(vendor_id, day):
+    return f"{vendor_id}_{day_key(day)}"
+
+
+def rollup_ref(db, vendor_id, day, shard=0):
+    return db.collection(ROLLUPS_COLLECTION).document(counters.shard_id(rollup_id(vendor_id, day), shard))
+
+
+def random_rollup_ref(db, vendor_id, day):
+    return rollup_ref(db, vendor_id, day, counters.random_shard(counters.VENDOR_SHARDS))
+
+
+def customer_bucket(customer_id):
+    digest = hashlib.blake2b(str(customer_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % SKETCH_BUCKETS
+
+
+def new_sketch():
+    """An empty in-memory sketch: one bit per bucket, a fixed 512 bytes.
+
+    Aggregations that hold many vendor-days at once (seeding, backfills)
+    keep their memory bounded however many transactions they fold in.
+    """
+    return bytearray(SKETCH_BUCKETS // 8)
+
+
+def sketch_add(sketch, bucket):
+    sketch[bucket >> 3] |= 1 << (bucket & 7)
+
+
+def sketch_buckets(sketch):
+    """The sorted bucket numbers set in ``sketch``, as rollups store them."""
+    return [index * 8 + bit for index, byte in enumerate(sketch) if byte
+            for bit in range(8) if byte >> bit & 1]
+
+
+def estimate_distinct(buckets):
+    """Linear-counting estimate of distinct customers behind a bucket set."""
+    occupied = len(buckets)
+    if occupied == 0:
+        return 0
+    empty = SKETCH_BUCKETS - occupied
+    if empty <= 0:
+        # Saturated sketch; this is the largest count it can still tell apart
+        empty = 1
+    return int(round(SKETCH_BUCKETS * math.log(SKETCH_BUCKETS / empty)))
+
+
+def rollup_update(transaction_data):
+    """Field transforms that fold one transaction into its daily rollup."""
+    return _rollup_update(_totals([transaction_data]))
+
+
+def add_to_daily(daily, t):
+    """Fold transaction document ``t`` into ``daily``, totals keyed by rollup id.
+
+    Live writes, backfills and seeding all build rollups through here, so
+    they cannot drift apart. Returns the totals ``t`` was added to.
+    """
+    key = rollup_id(t['vendor_id'], t['timestamp'])
+    totals = daily.get(key)
+    if totals is None:
+        totals = daily[key] = {
+            'vendor_id': t['vendor_id'],
+            'date': day_key(t['timestamp']),
+            'sales': 0,
+            'transaction_count': 0,
+            'points_earned': 0,
+            'points_redeemed': 0,
+            'hourly': {},
+            'customer_buckets': new_sketch(),
+        }
+    hour = t['timestamp'].strftime('%H')
+    totals['sales'] += t['amount']
+    totals['transaction_count'] += 1
+    totals['points_earned'] += t.get('points_earned', 0)
+    totals['points_redeemed'] += t.get('points_redeemed', 0)
+    totals['hourly'][hour] = totals['hourly'].get(hour, 0) + 1
+    sketch_add(totals['customer_buckets'], customer_bucket(t['customer_id']))
+    return totals
+
+
+def rollup_document(totals):
+    """The whole rollup document for ``totals``, for writes that replace a day."""
+    from firebase_admin import firestore
+
+    return dict(totals, customer_buckets=sketch_buckets(totals['customer_buckets']),
+                updated_at=firestore.SERVER_TIMESTAMP)
+
+
+def _totals(transactions):
+    # Sums for transactions that share a vendor and a day
+    daily = {}
+    for t in transactions:
+        totals = add_to_daily(daily, t)
+    return totals
+
+
+def _rollup_update(totals):
+    from firebase_admin import firestore
+
+    return {
+        'vendor_id': totals['vendor_id'],
+        'date': totals['date'],
+        'sales': firestore.Increment(totals['sales']),
+        'transaction_count': firestore.Increment(totals['transaction_count']),
+        'points_earned': firestore.Increment(totals['points_earned']),
+        'points_redeemed': firestore.Increment(totals['points_redeemed']),
+        'hourly': {hour: firestore.Increment(count) for hour, count in totals['hourly'].items()},
+        'customer_buckets': firestore.ArrayUnion(sketch_buckets(totals['customer_buckets'])),
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    }
+
+
+def record_transaction(db, transaction_data, writer=None):
+    """Add a transaction to its daily rollup.
+
+    ``writer`` may be a batch or transaction so the rollup lands in the same
+    commit as the ledger row; without one the update is written directly.
+    """
+    ref = random_rollup_ref(db, transaction_data['vendor_id'], transaction_data['timestamp'])
+    update = rollup_update(transaction_data)
+    if writer is None:
+        ref.set(update, merge=True)
+    else:
+        writer.set(ref, update, merge=True)
+
+
+def record_transactions(db, transactions, writer):
+    """Add several transactions to their rollups with one write per vendor and day."""
+    groups = {}
+    for t in transactions:
+        groups.setdefault((t['vendor_id'], day_key(t['timestamp'])), []).append(t)
+    for group in groups.values():
+        writer.set(random_rollup_ref(db, group[0]['vendor_id'], group[0]['timestamp']),
+                   _rollup_update(_totals(group)), merge=True)
+    return len(groups)
+
+
+def window_days(start_date, end_date):
+    days = []
+    current = datetime(start_date.year, start_date.month, start_date.day)
+    while current.date() <= end_date.date():
+        days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def load_rollups(db, vendor_id, days):
+    """Fetch the rollups for ``days`` (ascending), keyed by day.
+
+    A range query over ``date`` reads only the days that had sales, in pages
+    resumed with ``start_after``.
+    """
+    if not days:
+        return {}
+    query = db.collection(ROLLUPS_COLLECTION)\
+              .where('vendor_id', '==', vendor_id)\
+              .where('date', '>=', day_key(days[0]))\
+              .where('date', '<=', day_key(days[-1]))
+    rollups = {}
+    for snapshot in paginate(query, order_field='date'):
+        data = snapshot.to_dict()
+        day = rollups.get(data['date'])
+        rollups[data['date']] = data if day is None else merge(day, data)
+    return rollups
+
+
+def merge(rollup, shard):
+    """Add one shard of a day to the rollup assembled so far."""
+    merged = dict(rollup)
+    for field in ('sales', 'transaction_count', 'points_earned', 'points_redeemed'):
+        merged[field] = rollup.get(field, 0) + shard.get(field, 0)
+    hourly = dict(rollup.get('hourly', {}))
+    for hour, count in shard.get('hourly', {}).items():
+        hourly[hour] = hourly.get(hour, 0) + count
+    merged['hourly'] = hourly
+    merged['customer_buckets'] = sorted(set(rollup.get('customer_buckets', [])) |
+                                        set(shard.get('customer_buckets', [])))
+    return merged
+
+
+def backfill(db, vendor_id=None):
+    """Rebuild rollups from the raw ``transactions`` collection.
+
+    Existing rollups for the days that have transactions are overwritten,
+    each day as a single shard (the other shards of the day are deleted).
+    Returns the number of rollup documents written.
+    """
+    query = db.collection('transactions')
+    if vendor_id:
+        query = query.where('vendor_id', '==', vendor_id)
+
+    aggregates = {}
+    for doc in query.stream():
+        add_to_daily(aggregates, Transaction.from_snapshot(doc).to_firestore())
+
+    collection = db.collection(ROLLUPS_COLLECTION)
+    batch = db.batch()
+    pending = 0
+    # Other shards of the rebuilt days would be counted twice
+    shards = collection.where('vendor_id', '==', vendor_id) if vendor_id else collection
+    stale = [doc.reference for doc in shards.stream()
+             if doc.id not in aggregates and f"{doc.get('vendor_id')}_{doc.get('date')}" in aggregates]
+
+    writes = [(collection.document(key), rollup) for key, rollup in aggregates.items()]
+    writes += [(ref, None) for ref in stale]
+    for ref, rollup in writes:
+        if rollup is None:
+            batch.delete(ref)
+        else:
+            batch.set(ref, rollup_document(rollup))
+        pending += 1
+        if pending == BACKFILL_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    # Cached analytics for these vendors are stale now
+    for vendor in {rollup['vendor_id'] for rollup in aggregates.values()}:
+        watermarks.bump(db, vendor)
+
+    return len(aggregates)
@@ -1,18 +1,20 @@
-from flask import render_template, request, jsonify, session, redirect, url_for, flash, make_response
-from firebase_config import db
-from app import app
-import pandas as pd
-from io import StringIO, BytesIO
-import pdfkit
-from datetime import datetime, timedelta
-import csv
+from flask import render_template, request, jsonify, session, redirect, url_for, flash, make_response, Response, stream_with_context, send_file
+from app import analytics, app, events, exports, http_cache, ingest, metrics, passwords, redemption, repos, rollups
+from app.cache import LocalCache
+from app.concurrency import gather
+from app.models import Vendor
+from datetime import datetime, timedelta, timezone
 import os
 from pathlib import Path
-import bcrypt
 
-# # Configure wkhtmltopdf path
-# WKHTMLTOPDF_PATH = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'
-# config = pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
+# Today's dashboard totals per vendor, dropped whenever the vendor records a sale
+DASHBOARD_CACHE_TTL = 30  # seconds
+DASHBOARD_CACHE_SIZE = 1024
+dashboard_cache = LocalCache(maxsize=DASHBOARD_CACHE_SIZE, ttl=DASHBOARD_CACHE_TTL)
+
+# Rows per /api/transactions page
+TRANSACTIONS_PAGE_SIZE = 50
+MAX_TRANSACTIONS_PAGE_SIZE = 500
 
 @app.route('/')
 def index():
@@ -26,25 +28,22 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
 
-        # Query Firestore for vendor
-        vendors_ref = db.collection('vendors')
-        vendor_docs = vendors_ref.where('email', '==', email).stream()
-
-        # Check if vendor exists
-        vendor = None
-        for doc in vendor_docs:
-            vendor = doc.to_dict()
-            vendor['id'] = doc.id  # Add the document ID to the vendor dictionary
-            break  # Exit loop after finding the first match
+        # Look up the vendor (the record carries its document ID)
+        vendor = repos.vendors.find_by_email(email)
 
-        if not vendor:
-            return render_template('login.html', error="Invalid credentials")
-
-        hashed_password = vendor['password']
-
-        # Verify the password using bcrypt
-        if bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8')):
-            session['vendor_id'] = vendor['id']  # Use the document ID
+        # Unknown emails are checked against a dummy hash so they take as long
+        try:
+            valid, new_hash = passwords.verify(password, vendor.password if vendor else None)
+        except passwords.PasswordBusy:
+            return render_template('login.html', error="Too many sign-ins right now, please try again"), 503
+
+        if valid:
+            if new_hash:
+                # Plaintext or outdated cost: store a hash at the current cost
+                repos.vendors.update_password(vendor.id, new_hash)
+            session['vendor_id'] = vendor.id  # Use the document ID
+            # The next pages need the profile; this worker has it already
+            repos.vendors.remember(vendor)
             return redirect(url_for('dashboard'))
         else:
             return render_template('login.html', error="Invalid credentials")
@@ -82,8 +81,9 @@ def confirm_registration():
         flash('Welcome to URS! You can now start using the system.', 'success')
         return redirect(url_for('dashboard'))
     else:
-        # Delete the vendor if they decline
-        db.collection('vendors').document(vendor_id).delete()
+        # Delete the vendor and its policy if they decline
+        repos.vendors.delete(vendor_id)
+        repos.policies.delete(vendor_id)
         flash('Registration cancelled. Feel free to register again when ready.', 'info')
         return redirect(url_for('register'))
 
@@ -99,60 +99,23 @@ def register():
             return render_template('register.html', error="All fields are required")
         
         # Check if vendor already exists
-        vendors_ref = db.collection('vendors')
-        if vendors_ref.where('email', '==', email).get():
+        if repos.vendors.find_by_email(email):
             return render_template('register.html', error="Email already registered")
         
         try:
             # Create new vendor
-            vendor_data = {
-                'name': name,
-                'email': email,
-                'password': password,  # Hash passwords in production
-                'vendor_type': vendor_type
-            }
-            vendor_ref = vendors_ref.document()
-            vendor_ref.set(vendor_data)
-            
-            # Create vendor type policy based on business size
-            policy_settings = {
-                'small': {
-                    'threshold': 50,
-                    'earn_min': 5,
-                    'earn_max': 10,
-                    'redeem': 5,
-                    'can_redeem': True
-                },
-                'medium': {
-                    'threshold': 100,
-                    'earn_min': 10,
-                    'earn_max': 15,
-                    'redeem': 10,
-                    'can_redeem': True
-                },
-                'large': {
-                    'threshold': 200,
-                    'earn_min': 15,
-                    'earn_max': 20,
-                    'redeem': 15,
-                    'can_redeem': True
-                }
-            }
+            vendor = Vendor(None, name, email, vendor_type,
+                            password=passwords.hash_password(password))
+            vendor_id = repos.vendors.create(vendor)
             
-            settings = policy_settings[vendor_type]
-            vendor_policy = {
-                'vendor_id': vendor_ref.id,
-                'threshold_amount': settings['threshold'],
-                'earn_percentage_min': settings['earn_min'],
-                'earn_percentage_max': settings['earn_max'],
-                'redeem_percentage': settings['redeem'],
-                'can_redeem': settings['can_redeem']
-            }
-            db.collection('vendor_policies').document().set(vendor_policy)
+            # Create vendor type policy based on business size, keyed by vendor id
+            repos.policies.create_for(vendor_id, vendor_type)
             
-            session['temp_vendor_id'] = vendor_ref.id
+            session['temp_vendor_id'] = vendor_id
             return redirect(url_for('business_model'))
             
+        except passwords.PasswordBusy:
+            return render_template('register.html', error="Too many sign-ups right now, please try again"), 503
         except Exception as e:
             return render_template('register.html', error=f"Registration failed: {str(e)}")
     
@@ -163,123 +126,146 @@ def dashboard():
     if 'vendor_id' not in session:
         return redirect(url_for('login'))
 
-    vendor_ref = db.collection('vendors').document(session['vendor_id'])
-    vendor = vendor_ref.get().to_dict()
+    vendor_id = session['vendor_id']
+    # The vendor profile (usually cached) and today's totals are independent reads
+    vendor, metrics = gather(lambda: repos.vendors.get(vendor_id),
+                             lambda: today_metrics(vendor_id))
     if not vendor:
         return redirect(url_for('logout'))
 
+    return render_template('dashboard.html',
+                         vendor=vendor,
+                         **metrics)
+
+
+def today_metrics(vendor_id):
     # Get today's data
     today = datetime.utcnow().date()
+    cached = dashboard_cache.get(vendor_id)
+    if cached and cached[0] == today:
+        return cached[1]
+
     today_start = datetime(today.year, today.month, today.day)  # Convert to datetime
-    today_end = today_start + timedelta(days=1)
 
-    # Query Firestore for today's transactions
-    transactions_ref = db.collection('transactions')
-    today_transactions = transactions_ref.where('vendor_id', '==', vendor_ref.id)\
-                                         .where('timestamp', '>=', today_start)\
-                                         .where('timestamp', '<', today_end)\
-                                         .stream()
+    # The vendor's running totals for today: the day's rollup shards, merged,
+    # rather than every transaction of the day
+    rollup = repos.rollups.load(vendor_id, [today_start]).get(rollups.day_key(today_start), {})
+    metrics = {
+        'total_sales': rollup.get('sales', 0),
+        'total_points_issued': rollup.get('points_earned', 0),
+        'total_points_redeemed': rollup.get('points_redeemed', 0)
+    }
 
-    # Calculate metrics
-    total_sales = sum(t.to_dict()['amount'] for t in today_transactions)
-    total_points_issued = sum(t.to_dict()['points_earned'] for t in today_transactions)
-    total_points_redeemed = sum(t.to_dict()['points_redeemed'] for t in today_transactions)
-
-    return render_template('dashboard.html',
-                         vendor=vendor,
-                         total_sales=total_sales,
-                         total_points_issued=total_points_issued,
-                         total_points_redeemed=total_points_redeemed)
+    dashboard_cache.set(vendor_id, (today, metrics))
+    return metrics
 
 
 @app.route('/api/transactions')
 def get_transactions():
     if 'vendor_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
-    
-    days = int(request.args.get('days', 7))
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    transactions_ref = db.collection('transactions')
-    transactions = transactions_ref.where('vendor_id', '==', session['vendor_id']).where('timestamp', '>=', start_date).stream()
-    
-    return jsonify([{
-        'id': t.id,
-        'amount': t.to_dict()['amount'],
-        'points_earned': t.to_dict()['points_earned'],
-        'points_redeemed': t.to_dict()['points_redeemed'],
-        'timestamp': t.to_dict()['timestamp'].isoformat()
-    } for t in transactions])
+
+    try:
+        start_date, end_date = date_range_args(default_days=7)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        limit = int_arg('limit', TRANSACTIONS_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not 1 <= limit <= MAX_TRANSACTIONS_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_TRANSACTIONS_PAGE_SIZE}'}), 400
+
+    # Unchanged since the client's copy: answer from the watermark alone
+    vendor_id = session['vendor_id']
+    etag = http_cache.api_etag(vendor_id, repos.watermarks.current(vendor_id))
+    if http_cache.is_fresh(etag):
+        return http_cache.not_modified(etag)
+
+    try:
+        transactions, next_cursor = repos.transactions.page(
+            vendor_id, start_date, end_date, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return http_cache.tag(jsonify({
+        'transactions': [{
+            'id': t.id,
+            'amount': t.amount,
+            'points_earned': t.points_earned,
+            'points_redeemed': t.points_redeemed,
+            # Records hold naive UTC; keep the offset so browsers don't read local time
+            'timestamp': t.timestamp.replace(tzinfo=timezone.utc).isoformat()
+        } for t in transactions],
+        'next_cursor': next_cursor
+    }), etag)
 
 @app.route('/api/analytics')
 def get_analytics():
     if 'vendor_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
-    
-    days = request.args.get('days', 7, type=int)
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-    
-    transactions_ref = db.collection('transactions')
-    transactions = list(transactions_ref.where('vendor_id', '==', session['vendor_id']).where('timestamp', '>=', start_date).where('timestamp', '<=', end_date).stream())
-    
-    # Existing analytics processing
-    daily_sales = {}
-    current_date = start_date
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        daily_sales[date_str] = 0
-        current_date += timedelta(days=1)
-    
-    # New analytics data
-    unique_customers = set()
-    customer_activity = {}
-    hourly_distribution = {str(i).zfill(2):0 for i in range(24)}
-    total_earned = 0
-    total_redeemed = 0
-    total_amount = 0
-    
-    for t in transactions:
-        t_dict = t.to_dict()
 
-        # Ensure timestamp is a datetime object
-        if not isinstance(t_dict['timestamp'], datetime):
-            t_dict['timestamp'] = t_dict['timestamp'].replace(tzinfo=None)
-
-        total_amount += t_dict['amount']
+    try:
+        start_date, end_date = date_range_args(default_days=7)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    vendor_id = session['vendor_id']
+    etag = http_cache.api_etag(vendor_id, repos.watermarks.current(vendor_id))
+    if http_cache.is_fresh(etag):
+        return http_cache.not_modified(etag)
+
+    # One pre-aggregated rollup document per day instead of every transaction,
+    # summarized with array operations over the days
+    last_day = end_date - timedelta(days=1) if end_date else datetime.utcnow()
+    window = rollups.window_days(start_date, last_day)
+    daily_rollups = repos.rollups.load(vendor_id, window)
+
+    return http_cache.tag(jsonify(analytics.summarize(window, daily_rollups)), etag)
+
+def parse_date_arg(name):
+    """Read an optional YYYY-MM-DD query parameter; raises ValueError if malformed."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def int_arg(name, default):
+    """Read an optional integer query parameter; raises ValueError if malformed."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a whole number')
 
-        # Daily sales
-        date_str = t_dict['timestamp'].strftime('%Y-%m-%d')
-        daily_sales[date_str] = daily_sales.get(date_str, 0) + t_dict['amount']
-        
-        # Points metrics
-        total_earned += t_dict.get('points_earned', 0)
-        total_redeemed += t_dict.get('points_redeemed', 0)
-        
-        # Unique customers
-        unique_customers.add(t_dict['customer_id'])
-        
-        # Customer activity by date
-        customer_activity[date_str] = customer_activity.get(date_str, 0) + 1
-        
-        # Hourly distribution
-        hour = t_dict['timestamp'].strftime('%H')
-        hourly_distribution[hour] += 1
+def date_range_args(default_days):
+    """Resolve ``start``/``end`` (inclusive days) or ``days`` into a datetime range.
 
-    # Calculate average transaction
-    avg_transaction = total_amount / len(unique_customers) if unique_customers else 0
-    
-    return jsonify({
-        'daily_sales': daily_sales,
-        'points_metrics': {
-            'total_earned': round(total_earned, 2),
-            'total_redeemed': round(total_redeemed, 2)
-        },
-        'unique_customers': len(unique_customers),
-        'customer_activity': customer_activity,
-        'hourly_distribution': hourly_distribution,
-        'avg_transaction': round(avg_transaction,2)
-    })
+    Returns ``(start, end)`` where ``end`` is exclusive, or None for "now".
+    Raises ValueError with a message for the client when the range is invalid.
+    """
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+    except ValueError:
+        raise ValueError('Dates must be formatted as YYYY-MM-DD')
+
+    if start or end:
+        if not (start and end):
+            raise ValueError('start and end must be given together')
+        if start > end:
+            raise ValueError('start must not be after end')
+        if (end - start).days + 1 > analytics.MAX_DAYS:
+            raise ValueError(f'Date range cannot exceed {analytics.MAX_DAYS} days')
+        return start, end + timedelta(days=1)
+
+    days = int_arg('days', default_days)
+    if not 1 <= days <= analytics.MAX_DAYS:
+        raise ValueError(f'days must be between 1 and {analytics.MAX_DAYS}')
+    return datetime.utcnow() - timedelta(days=days), None
 
 @app.route('/api/export')
 def export_transactions():
@@ -287,90 +273,153 @@ def export_transactions():
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        format = request.args.get('format', 'csv')
-        vendor_ref = db.collection('vendors').document(session['vendor_id'])
-        vendor = vendor_ref.get().to_dict()
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD'}), 400
+
+    format = request.args.get('format', 'csv')
+    if format not in exports.FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+
+    try:
+        vendor_id = session['vendor_id']
+        stream = format == 'csv' and request.args.get('stream') == '1'
+        if stream:
+            vendor = repos.vendors.get(vendor_id)
+            watermark = None
+        else:
+            # Fetch the vendor and the data watermark for the artifact cache together
+            vendor, watermark = gather(lambda: repos.vendors.get(vendor_id),
+                                       lambda: exports.data_watermark(repos, vendor_id))
         
         if not vendor:
             return jsonify({'error': 'Vendor not found'}), 404
-            
-        transactions_ref = db.collection('transactions')
-        transactions = transactions_ref.where('vendor_id', '==', session['vendor_id']).stream()
-        
-        if format == 'csv':
-            return export_csv(transactions)
-        elif format == 'pdf':
-            return export_pdf(vendor, transactions)
-        else:
-            return jsonify({'error': 'Invalid format'}), 400
-            
+
+        # Direct CSV download for clients that want the bytes in this request
+        if stream:
+            query = exports.transactions_query(repos, vendor_id, start, end)
+            return export_csv(query)
+
+        job = exports.submit_export(repos, vendor_id, format, start, end, watermark=watermark)
+        return jsonify(export_job_status(job)), 202
+
+    except exports.ExportQueueFull:
+        return jsonify({'error': 'Too many exports in progress, try again shortly'}), 503
     except Exception as e:
         app.logger.error(f"Export error: {str(e)}")
         return jsonify({'error': f'Export failed: {str(e)}'}), 500
 
-def export_csv(transactions):
-    try:
-        si = StringIO()
-        writer = csv.writer(si)
-        writer.writerow(['Transaction ID', 'Amount (INR)', 'Points Earned', 'Points Redeemed', 'Timestamp'])
-        
-        for t in transactions:
-            t_dict = t.to_dict()
-            writer.writerow([
-                t.id,
-                f"{t_dict['amount']:.2f}",
-                t_dict['points_earned'],
-                t_dict['points_redeemed'],
-                t_dict['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        output = si.getvalue()
-        si.close()
-        
-        response = make_response(output)
-        response.headers["Content-Disposition"] = f"attachment; filename=transactions_{datetime.now().strftime('%Y%m%d')}.csv"
-        response.headers["Content-type"] = "text/csv; charset=utf-8"
-        return response
-        
-    except Exception as e:
-        raise Exception(f"CSV generation failed: {str(e)}")
+@app.route('/metrics')
+def prometheus_metrics():
+    # Per-vendor series are not public; set URS_METRICS_TOKEN to require it
+    token = os.environ.get('URS_METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def listeners_busy():
+    # Every stream slot of this worker is taken; the dashboard asks again
+    # after Retry-After, without reloading its data each time
+    response = jsonify({'error': 'Live updates are busy, falling back to polling'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(events.LISTENER_RETRY_AFTER)
+    return response
+
+@app.route('/api/events')
+def event_stream():
+    if 'vendor_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    if not events.acquire_listener():
+        return listeners_busy()
+    # Server-Sent Events; EventSource resends the last id when it reconnects
+    stream = events.sse_stream(session['vendor_id'], request.headers.get('Last-Event-ID'))
+    response = Response(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Runs when the stream ends or the client goes away
+    response.call_on_close(events.release_listener)
+    return response
+
+@app.route('/api/events/poll')
+def poll_events():
+    if 'vendor_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    # Long-polling fallback for clients that cannot keep a stream open
+    # The first request (no ``after``) only returns the cursor to wait from
+    vendor_id = session['vendor_id']
+    last_id = request.args.get('after')
+    if not last_id:
+        return jsonify({'events': [], 'last_id': events.hub.latest_id(vendor_id), 'resync': False})
 
-def export_pdf(vendor, transactions):
+    if not events.acquire_listener():
+        return listeners_busy()
     try:
-        if not os.path.exists(WKHTMLTOPDF_PATH):
-            raise Exception("wkhtmltopdf not found. Please install it first.")
-            
-        html_content = render_template(
-            'export_pdf.html',
-            vendor=vendor,
-            transactions=transactions,
-            datetime=datetime
-        )
-        
-        options = {
-            'page-size': 'A4',
-            'margin-top': '0.75in',
-            'margin-right': '0.75in',
-            'margin-bottom': '0.75in',
-            'margin-left': '0.75in',
-            'encoding': 'UTF-8',
-            'no-outline': None
-        }
-        
-        pdf = pdfkit.from_string(
-            html_content, 
-            False, 
-            options=options,
-            configuration=config
-        )
-        
-        response = make_response(pdf)
-        response.headers["Content-Disposition"] = f"attachment; filename=transactions_{datetime.now().strftime('%Y%m%d')}.pdf"
-        response.headers["Content-Type"] = "application/pdf"
-        return response
-        
-    except Exception as e:
-        raise Exception(f"PDF generation failed: {str(e)}")
+        found, resync = events.hub.events_after(vendor_id, last_id, events.LONG_POLL_TIMEOUT)
+    finally:
+        events.release_listener()
+    if resync:
+        found = []
+    return jsonify({
+        'events': [{'id': e['id'], 'type': e['type'], 'data': e['data']} for e in found],
+        'last_id': found[-1]['id'] if found else events.hub.latest_id(vendor_id) if resync else last_id,
+        'resync': resync
+    })
+
+def export_job_status(job):
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'format': job['format'],
+        'error': job['error'],
+        'status_url': url_for('export_status', job_id=job['id']),
+        'download_url': url_for('export_download', job_id=job['id']) if job['status'] == 'done' else None
+    }
+
+def vendor_export_job(job_id):
+    job = exports.get_job(job_id)
+    if not job or job['vendor_id'] != session['vendor_id']:
+        return None
+    return job
+
+@app.route('/api/export/<job_id>')
+def export_status(job_id):
+    if 'vendor_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    job = vendor_export_job(job_id)
+    if not job:
+        return jsonify({'error': 'Export not found'}), 404
+    return jsonify(export_job_status(job))
+
+@app.route('/api/export/<job_id>/download')
+def export_download(job_id):
+    if 'vendor_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    job = vendor_export_job(job_id)
+    if not job:
+        return jsonify({'error': 'Export not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Export is not ready', 'status': job['status']}), 409
+
+    path = exports.artifact_path(job)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Export has expired'}), 410
+
+    return send_file(path,
+                     mimetype=exports.FORMATS[job['format']],
+                     as_attachment=True,
+                     download_name=f"transactions_{datetime.now().strftime('%Y%m%d')}.{job['format']}")
+
+def export_csv(query):
+    # Stream the body with chunked transfer; memory stays at one page of rows
+    response = Response(stream_with_context(exports.csv_chunks(query)), mimetype='text/csv')
+    response.headers["Content-Disposition"] = f"attachment; filename=transactions_{datetime.now().strftime('%Y%m%d')}.csv"
+    response.headers["Content-type"] = "text/csv; charset=utf-8"
+    return response
     
 @app.route('/check_customer', methods=['GET', 'POST'])
 def check_customer():
@@ -378,24 +427,26 @@ def check_customer():
         flash('Please log in first.', 'error')
         return redirect(url_for('login'))
 
-    vendor_ref = db.collection('vendors').document(session['vendor_id'])
-    vendor = vendor_ref.get().to_dict()
+    vendor_id = session['vendor_id']
+    phone = request.form['phone'] if request.method == 'POST' else None
+    # Look the customer up alongside the vendor check (a cache hit after
+    # sign-in); the snapshot is cached for the checkout that usually follows
+    # within seconds
+    vendor, customer = gather(
+        lambda: repos.vendors.get(vendor_id),
+        lambda: repos.customers.find_by_phone(phone, use_cache=False) if phone is not None else None)
     if not vendor:
         flash('Invalid vendor.', 'error')
         return redirect(url_for('logout'))
 
     customer_info = None
     if request.method == 'POST':
-        phone = request.form['phone']
-        customers_ref = db.collection('customers')
-        customer = customers_ref.where('phone', '==', phone).get()
-        
         if customer:
-            customer = customer[0].to_dict()
             customer_info = {
-                'name': customer['name'],
-                'phone': customer['phone'],
-                'wallet_balance': customer['wallet_balance']
+                'name': customer.data['name'],
+                'phone': customer.data['phone'],
+                # The sum of the wallet's shards, read with the customer
+                'wallet_balance': customer.balance
             }
         else:
             flash("Customer not found.", 'warning')
@@ -410,65 +461,81 @@ def apply_discount():
         return redirect(url_for('login'))
 
     try:
-        vendor_ref = db.collection('vendors').document(session['vendor_id'])
+        vendor_id = session['vendor_id']
         phone = request.form.get('phone')
         bill_amount = float(request.form.get('bill_amount', 0))
 
-        # Get customer document
-        customers_ref = db.collection('customers')
-        customer_docs = customers_ref.where('phone', '==', phone).limit(1).get()
+        # The vendor policy and the customer snapshot are usually both in
+        # this worker's caches (the customer from check_customer a moment
+        # ago); on a miss the two reads go out together
+        policy, customer = gather(lambda: repos.policies.get(vendor_id),
+                                  lambda: repos.customers.find_by_phone(phone))
         
-        if not customer_docs:
-            flash('Customer not found', 'error')
+        if not policy:
+            flash('Vendor policy not found', 'error')
             return redirect(url_for('check_customer'))
 
-        # Get first customer doc and its ID
-        customer_doc = customer_docs[0]
-        customer_data = customer_doc.to_dict()
-        customer_id = customer_doc.id  # Get the document ID to use as customer_id
+        if not customer:
+            flash('Customer not found', 'error')
+            return redirect(url_for('check_customer'))
 
-        # Get vendor policy
-        policies_ref = db.collection('vendor_policies')
-        policy_docs = policies_ref.where('vendor_id', '==', vendor_ref.id).limit(1).get()
-        
-        if not policy_docs:
-            flash('Vendor policy not found', 'error')
+        # Update the wallet and write the ledger row and rollup in one
+        # atomic commit
+        try:
+            result = repos.transactions.record_sale(customer, vendor_id, bill_amount, policy)
+        except redemption.CustomerNotFound:
+            flash('Customer not found', 'error')
+            return redirect(url_for('check_customer'))
+        except redemption.RedemptionContention:
+            flash('This customer is being served at another till. Please try again.', 'error')
             return redirect(url_for('check_customer'))
 
-        policy = policy_docs[0].to_dict()
+        dashboard_cache.pop(vendor_id)
+        # Push the sale to this vendor's open dashboards
+        events.publish_sale(vendor_id, result)
 
-        # Calculate points and discounts
-        wallet_balance = float(customer_data.get('wallet_balance', 0))
-        discount = min(wallet_balance, bill_amount) if policy['can_redeem'] else 0
-        final_bill = bill_amount - discount
-        points_earned = (final_bill * policy['earn_percentage_max']) / 100
+        flash(f"""Transaction successful!
+        Amount: ₹{result['amount']:.2f}
+        Discount Applied: ₹{result['discount']:.2f}
+        Final Bill: ₹{result['final_bill']:.2f}
+        Points Earned: {result['points_earned']:.0f}""", 'success')
 
-        # Create transaction
-        transaction_data = {
-            'vendor_id': vendor_ref.id,
-            'customer_id': customer_id,  # Use the document ID as customer_id
-            'amount': bill_amount,
-            'points_earned': points_earned,
-            'points_redeemed': discount,
-            'timestamp': datetime.utcnow()
-        }
+        return redirect(url_for('check_customer'))
 
-        # Update customer wallet balance
-        new_balance = wallet_balance - discount + points_earned
-        customer_doc.reference.update({'wallet_balance': new_balance})
+    except Exception:
+        app.logger.exception("Checkout failed")
+        flash(f"Error processing transaction. Please try again.", 'error')
+        return redirect(url_for('check_customer'))
 
-        # Save transaction
-        db.collection('transactions').add(transaction_data)
+@app.route('/api/sales/batch', methods=['POST'])
+def ingest_sales():
+    """Record a till's buffered sales; see app/ingest.py for the format."""
+    if 'vendor_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
 
-        flash(f"""Transaction successful!
-        Amount: ₹{bill_amount:.2f}
-        Discount Applied: ₹{discount:.2f}
-        Final Bill: ₹{final_bill:.2f}
-        Points Earned: {points_earned:.0f}""", 'success')
+    payload = request.get_json(silent=True)
+    sales = payload.get('sales') if isinstance(payload, dict) else None
+    if not isinstance(sales, list) or not sales:
+        return jsonify({'error': 'Send a JSON object with a non-empty "sales" list'}), 400
+    if len(sales) > ingest.MAX_SALES:
+        return jsonify({'error': f'At most {ingest.MAX_SALES} sales per request'}), 413
 
-        return redirect(url_for('check_customer'))
+    vendor_id = session['vendor_id']
+    policy = repos.policies.get(vendor_id)
+    if not policy:
+        return jsonify({'error': 'Vendor policy not found'}), 404
 
+    try:
+        results = repos.transactions.record_sales(vendor_id, sales, policy)
     except Exception as e:
-        print(f"Error details: {str(e)}")  # Debug log
-        flash(f"Error processing transaction. Please try again.", 'error')
-        return redirect(url_for('check_customer'))
\ No newline at end of file
+        app.logger.error(f"Sale ingestion error: {str(e)}")
+        return jsonify({'error': 'Sale ingestion failed, retry the batch'}), 500
+
+    counts = {status: 0 for status in ('created', 'duplicate', 'rejected', 'failed')}
+    for result in results:
+        counts[result['status']] += 1
+    if counts['created']:
+        dashboard_cache.pop(vendor_id)
+        # Open dashboards reload once rather than replaying every sale
+        events.publish_resync(vendor_id)
+    return jsonify({'results': results, **counts})
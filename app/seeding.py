@@ -0,0 +1,212 @@
+"""Synthetic vendors, customers and transactions at production scale.
+
+``seed`` generates a reproducible dataset (same ``seed``, same data) and
+writes it through ``app.bulk.BulkLoader``:
+
+* vendors of every size, all sharing one password, with their policies;
+* customers with phone index entries, where a few regulars make most of the
+  purchases (Zipf-like frequency, exponent CUSTOMER_SKEW);
+* transactions spread over the last ``days`` days, busier on weekends and at
+  lunch and in the evening (shop-local time, UTC_OFFSET_HOURS ahead of UTC),
+  with amounts drawn around each vendor size's typical bill;
+* the daily rollups and watermarks those transactions imply, so analytics
+  work without a backfill. Wallet balances are each customer's points earned
+  minus points redeemed.
+
+Transactions are generated in chunks of CHUNK_SIZE with numpy and never held
+in memory all at once. Rollups are summed in memory per vendor-day, each
+with a fixed-size customer sketch (``rollups.new_sketch``), so memory grows
+with vendors times days and not with the number of transactions. Document ids are deterministic hashes, so repeated
+runs overwrite rather than duplicate and writes do not hotspot on
+sequential keys.
+"""
+from datetime import datetime, timedelta
+import hashlib
+import time
+
+from app import customers, policies, rollups, wallets, watermarks
+from app.bulk import BulkLoader
+from app.models import Customer, Transaction, Vendor
+
+CHUNK_SIZE = 50000
+
+VENDOR_TYPE_SHARES = {'small': 0.6, 'medium': 0.3, 'large': 0.1}
+# Relative sales volume and typical bill (INR) by vendor size
+VENDOR_TYPE_VOLUME = {'small': 1.0, 'medium': 2.5, 'large': 6.0}
+VENDOR_TYPE_BILL = {'small': 150.0, 'medium': 400.0, 'large': 1200.0}
+BILL_SPREAD = 0.6  # sigma of the log-normal bill amount
+
+CUSTOMER_SKEW = 1.1
+REDEEM_SHARE = 0.15  # share of sales that redeem points
+
+UTC_OFFSET_HOURS = 5.5
+# Share of a day's sales in each local hour, 00:00 to 23:00
+HOURLY_PROFILE = [0, 0, 0, 0, 0, 0, 1, 2, 4, 6, 7, 8,
+                  10, 10, 8, 6, 6, 7, 9, 10, 9, 6, 3, 1]
+WEEKDAY_PROFILE = [1.0, 0.9, 0.9, 1.0, 1.1, 1.4, 1.3]  # Monday first
+
+SEEDED_COLLECTIONS = ['vendors', policies.POLICIES_COLLECTION, customers.CUSTOMERS_COLLECTION,
+                      customers.PHONE_INDEX_COLLECTION, 'transactions', rollups.ROLLUPS_COLLECTION,
+                      watermarks.WATERMARKS_COLLECTION]
+
+
+def doc_id(kind, index, seed=1):
+    return hashlib.blake2b(f'{kind}-{seed}-{index}'.encode('utf-8'), digest_size=10).hexdigest()
+
+
+def vendor_email(index):
+    return f'vendor{index}@example.com'
+
+
+def customer_phone(index):
+    return f'9{index:09d}'
+
+
+def _cdf(weights):
+    import numpy as np
+
+    cdf = np.cumsum(np.asarray(weights, dtype=float))
+    return cdf / cdf[-1]
+
+
+def _pick(rng, cdf, size):
+    import numpy as np
+
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1)
+
+
+def _vendor_types(vendor_count):
+    # Deterministic mix, spread out so small runs still get every size
+    types = []
+    for i in range(vendor_count):
+        position = (i * 0.618034) % 1
+        if position < VENDOR_TYPE_SHARES['small']:
+            types.append('small')
+        elif position < VENDOR_TYPE_SHARES['small'] + VENDOR_TYPE_SHARES['medium']:
+            types.append('medium')
+        else:
+            types.append('large')
+    return types
+
+
+def clear(db, collections=SEEDED_COLLECTIONS, page_size=2000, **loader_options):
+    """Delete every document in ``collections``; returns documents deleted."""
+    deleted = 0
+    with BulkLoader(db, **loader_options) as loader:
+        for name in collections:
+            while True:
+                docs = list(db.collection(name).limit(page_size).stream())
+                if not docs:
+                    break
+                for doc in docs:
+                    loader.delete(doc.reference)
+                    if name == customers.CUSTOMERS_COLLECTION:
+                        # Subcollections outlive their parent document
+                        for shard in wallets.shard_refs(doc.reference):
+                            loader.delete(shard)
+                # The next page query must not see documents still being deleted
+                loader.flush()
+                deleted += len(docs)
+    return deleted
+
+
+def seed(db, vendors=20, customer_count=5000, transactions=100000, days=90, password='test123',
+         seed=1, progress=print, **loader_options):
+    """Generate and write a dataset; returns a summary dict.
+
+    ``loader_options`` (``batch_size``, ``parallelism``,
+    ``max_writes_per_second``) are passed to BulkLoader.
+    """
+    import numpy as np
+    from firebase_admin import firestore
+    from app import passwords
+
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+
+    vendor_ids = [doc_id('vendor', i, seed) for i in range(vendors)]
+    vendor_types = _vendor_types(vendors)
+    vendor_cdf = _cdf([VENDOR_TYPE_VOLUME[t] * rng.lognormal(0, 0.5) for t in vendor_types])
+    vendor_bill = np.log([VENDOR_TYPE_BILL[t] for t in vendor_types])
+    vendor_earn = np.array([policies.POLICY_SETTINGS[t]['earn_max'] for t in vendor_types], dtype=float)
+
+    customer_ids = [doc_id('customer', i, seed) for i in range(customer_count)]
+    # Rank r is chosen with weight 1 / r^CUSTOMER_SKEW; ranks map to customers at random
+    customer_cdf = _cdf(1 / np.arange(1, customer_count + 1) ** CUSTOMER_SKEW)
+    customer_by_rank = rng.permutation(customer_count)
+    earned = np.zeros(customer_count)
+    redeemed = np.zeros(customer_count)
+
+    # Days run from ``days`` ago to yesterday, so no sale is in the future
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = today - timedelta(days=days)
+    day_cdf = _cdf([WEEKDAY_PROFILE[(first_day + timedelta(days=d)).weekday()] for d in range(days)])
+    hour_cdf = _cdf(HOURLY_PROFILE)
+    first_local_epoch = (first_day - datetime(1970, 1, 1)).total_seconds() - UTC_OFFSET_HOURS * 3600
+
+    daily = {}
+    with BulkLoader(db, **loader_options) as loader:
+        transactions_ref = db.collection('transactions')
+        for chunk_start in range(0, transactions, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, transactions - chunk_start)
+            v = _pick(rng, vendor_cdf, size)
+            c = customer_by_rank[_pick(rng, customer_cdf, size)]
+            epochs = (first_local_epoch + _pick(rng, day_cdf, size) * 86400
+                      + _pick(rng, hour_cdf, size) * 3600 + rng.integers(0, 3600, size))
+            amount = np.round(np.exp(vendor_bill[v] + rng.normal(0, BILL_SPREAD, size)), 2)
+            points_redeemed = np.where(rng.random(size) < REDEEM_SHARE,
+                                       np.round(amount * rng.uniform(0.05, 0.3, size), 2), 0.0)
+            points_earned = np.round((amount - points_redeemed) * vendor_earn[v] / 100, 2)
+            earned += np.bincount(c, weights=points_earned, minlength=customer_count)
+            redeemed += np.bincount(c, weights=points_redeemed, minlength=customer_count)
+
+            # Plain Python values from here on, one row at a time
+            rows = zip(v.tolist(), c.tolist(), epochs.tolist(), amount.tolist(),
+                       points_earned.tolist(), points_redeemed.tolist())
+            for i, (vi, ci, epoch, amt, pe, pr) in enumerate(rows, start=chunk_start):
+                row = Transaction(None, vendor_ids[vi], customer_ids[ci], amt, pe, pr,
+                                  datetime.utcfromtimestamp(epoch)).to_firestore()
+                loader.set(transactions_ref.document(doc_id('txn', i, seed)), row)
+                rollups.add_to_daily(daily, row)
+
+            progress(f"transactions: {chunk_start + size}/{transactions}")
+
+        rollups_ref = db.collection(rollups.ROLLUPS_COLLECTION)
+        for key, totals in daily.items():
+            loader.set(rollups_ref.document(key), rollups.rollup_document(totals))
+        progress(f"rollups: {len(daily)}")
+
+        balances = np.maximum(np.round(earned - redeemed, 2), 0)
+        customers_ref = db.collection(customers.CUSTOMERS_COLLECTION)
+        for i, customer_id in enumerate(customer_ids):
+            phone = customer_phone(i)
+            record = Customer(customer_id, f'Customer {i}', f'customer{i}@example.com', phone, 0.0)
+            loader.set(customers_ref.document(customer_id), record.to_firestore())
+            # Balances go in the first wallet shard; the legacy field stays 0
+            loader.set(wallets.shard_refs(customers_ref.document(customer_id))[0], {'balance': float(balances[i])})
+            loader.set(customers.phone_index_ref(db, phone), {'customer_id': customer_id})
+        progress(f"customers: {customer_count}")
+
+        # Every vendor shares one password, so it is hashed once
+        password_hash = passwords.hash_password(password)
+        vendors_ref = db.collection('vendors')
+        for i, (vendor_id, vendor_type) in enumerate(zip(vendor_ids, vendor_types)):
+            record = Vendor(vendor_id, f'Vendor {i}', vendor_email(i), vendor_type, password=password_hash)
+            loader.set(vendors_ref.document(vendor_id), record.to_firestore())
+            loader.set(policies.policy_ref(db, vendor_id), policies.build_policy(vendor_id, vendor_type))
+            # Bumped, not reset, so no client's old ETag can match again
+            loader.set(watermarks.watermark_ref(db, vendor_id),
+                       {'vendor_id': vendor_id, 'version': firestore.Increment(1),
+                        'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+        progress(f"vendors: {vendors}")
+
+    return {
+        'vendor_ids': vendor_ids,
+        'vendor_types': vendor_types,
+        'customers': customer_count,
+        'transactions': transactions,
+        'rollups': len(daily),
+        'writes': loader.written,
+        'seconds': time.perf_counter() - started,
+    }
+
@@ -23,13 +23,16 @@ function switchTab(tabName) {
     activeBtn.classList.remove('border-transparent', 'text-gray-500');
 }
 
+// Query string of the analytics window currently on screen
+let analyticsQuery = '';
+
 // Initialize charts
-async function initializeCharts() {
+async function initializeCharts(query = analyticsQuery) {
+    analyticsQuery = query;
     try {
-        const response = await fetch('/api/analytics');
-        if (!response.ok) throw new Error('Failed to fetch analytics');
-        
+        const response = await fetch(`/api/analytics${query}`);
         const analytics = await response.json();
+        if (!response.ok) throw new Error(analytics.error || 'Failed to fetch analytics');
         
         // Update summary cards
         document.getElementById('totalSales').textContent = 
@@ -158,38 +161,60 @@ async function initializeCharts() {
     }
 }
 
-// Fetch and display transactions
-async function loadTransactions() {
+// Render one row of the transactions table
+function transactionRow(t) {
+    // Format the timestamp properly
+    const timestamp = new Date(t.timestamp);
+    const formattedDate = timestamp.toLocaleDateString('en-IN', {
+        day: 'numeric',
+        month: 'numeric',
+        year: 'numeric'
+    });
+    const formattedTime = timestamp.toLocaleTimeString('en-IN', {
+        hour: '2-digit',
+        minute: '2-digit',
+        second: '2-digit',
+        hour12: true
+    });
+
+    // Cells are filled with textContent so event data is never parsed as HTML
+    const row = document.createElement('tr');
+    row.className = 'hover:bg-gray-50';
+    const cells = [t.id, `₹${Number(t.amount).toFixed(2)}`, t.points_earned, t.points_redeemed,
+                   `${formattedDate}, ${formattedTime}`];
+    cells.forEach(value => {
+        const cell = document.createElement('td');
+        cell.className = 'px-6 py-4 whitespace-nowrap';
+        cell.textContent = String(value);
+        row.appendChild(cell);
+    });
+    return row;
+}
+
+// Transactions table paging state
+const TRANSACTION_RANGE_DAYS = { today: 1, week: 7, month: 30 };
+let transactionsCursor = null;
+
+// Fetch and display transactions, one page at a time
+async function loadTransactions(append = false) {
     try {
-        const response = await fetch('/api/transactions');
-        const transactions = await response.json();
-        
-        const tableBody = document.getElementById('transactionsTable');
-        tableBody.innerHTML = transactions.map(t => {
-            // Format the timestamp properly
-            const timestamp = new Date(t.timestamp);
-            const formattedDate = timestamp.toLocaleDateString('en-IN', {
-                day: 'numeric',
-                month: 'numeric',
-                year: 'numeric'
-            });
-            const formattedTime = timestamp.toLocaleTimeString('en-IN', {
-                hour: '2-digit',
-                minute: '2-digit',
-                second: '2-digit',
-                hour12: true
-            });
+        const range = document.getElementById('dateRange');
+        const params = new URLSearchParams({ days: TRANSACTION_RANGE_DAYS[range ? range.value : 'week'] || 7 });
+        if (append && transactionsCursor) params.set('cursor', transactionsCursor);
 
-            return `
-                <tr class="hover:bg-gray-50">
-                    <td class="px-6 py-4 whitespace-nowrap">${t.id}</td>
-                    <td class="px-6 py-4 whitespace-nowrap">₹${t.amount.toFixed(2)}</td>
-                    <td class="px-6 py-4 whitespace-nowrap">${t.points_earned}</td>
-                    <td class="px-6 py-4 whitespace-nowrap">${t.points_redeemed}</td>
-                    <td class="px-6 py-4 whitespace-nowrap">${formattedDate}, ${formattedTime}</td>
-                </tr>
-            `;
-        }).join('');
+        const response = await fetch(`/api/transactions?${params}`);
+        const page = await response.json();
+        if (!response.ok) throw new Error(page.error || 'Failed to fetch transactions');
+        transactionsCursor = page.next_cursor;
+        document.getElementById('loadMoreTransactions').classList.toggle('hidden', !transactionsCursor);
+
+        const tableBody = document.getElementById('transactionsTable');
+        const rows = page.transactions.map(transactionRow);
+        if (append) {
+            tableBody.append(...rows);
+        } else {
+            tableBody.replaceChildren(...rows);
+        }
     } catch (error) {
         console.error('Error loading transactions:', error);
     }
@@ -205,6 +230,7 @@ function setupDateRangeSelector() {
             <button onclick="updateDateRange(7)" class="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600">Last 7 Days</button>
             <button onclick="updateDateRange(30)" class="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600">Last 30 Days</button>
             <button onclick="updateDateRange(90)" class="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600">Last 90 Days</button>
+            <button onclick="updateDateRange(365)" class="px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600">Last 365 Days</button>
             <div class="flex items-center space-x-2">
                 <input type="date" id="startDate" class="border rounded px-2 py-1">
                 <span>to</span>
@@ -220,9 +246,7 @@ function setupDateRangeSelector() {
 // Update date range
 async function updateDateRange(days) {
     try {
-        const response = await fetch(`/api/analytics?days=${days}`);
-        const analytics = await response.json();
-        initializeCharts();
+        await initializeCharts(`?days=${days}`);
         loadTransactions();
     } catch (error) {
         console.error('Error updating date range:', error);
@@ -240,32 +264,30 @@ async function updateCustomDateRange() {
     }
 
     try {
-        const response = await fetch(`/api/analytics?start=${startDate}&end=${endDate}`);
-        const analytics = await response.json();
-        initializeCharts();
+        await initializeCharts(`?start=${startDate}&end=${endDate}`);
         loadTransactions();
     } catch (error) {
         console.error('Error updating custom date range:', error);
     }
 }
 
-function exportTransactions(format) {
-    window.location.href = `/api/export?format=${format}`;
-}
-
 // Export transactions
+// The server builds the file in the background; poll the job until it is ready
 async function exportTransactions(format) {
     try {
         const response = await fetch(`/api/export?format=${format}`);
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `transactions_${new Date().toISOString().split('T')[0]}.${format}`;
-        document.body.appendChild(a);
-        a.click();
-        window.URL.revokeObjectURL(url);
-        document.body.removeChild(a);
+        let job = await response.json();
+        if (!response.ok) throw new Error(job.error || 'Failed to start export');
+
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const statusResponse = await fetch(job.status_url);
+            job = await statusResponse.json();
+            if (!statusResponse.ok) throw new Error(job.error || 'Failed to check export');
+        }
+
+        if (job.status !== 'done') throw new Error(job.error || 'Export failed');
+        window.location.href = job.download_url;
     } catch (error) {
         console.error('Error exporting transactions:', error);
     }
@@ -275,17 +297,110 @@ async function exportTransactions(format) {
 document.addEventListener('DOMContentLoaded', () => {
     initializeCharts();
     loadTransactions();
+    document.getElementById('dateRange').addEventListener('change', () => loadTransactions());
     
     // Set Check Customer as default tab
     switchTab('check-customer');
     
-    // Refresh data every 5 minutes
-    setInterval(() => {
-        initializeCharts();
-        loadTransactions();
-    }, 300000);
+    // The server pushes new sales; nothing is fetched while the shop is idle
+    subscribeToSales();
 });
 
+// Live updates
+// Sales arrive over Server-Sent Events, or long polling where EventSource is
+// unavailable. A "resync" means events may have been missed, or a till synced
+// a batch of sales, so reload. When the server has no room for another
+// listener it answers 503; the dashboard asks again after Retry-After and only
+// reloads its data every QUEUED_RELOAD_INTERVAL while it waits.
+const CHART_REFRESH_DELAY = 30000;
+const QUEUED_RELOAD_INTERVAL = 300000;
+let chartRefreshTimer = null;
+
+function addToCard(id, amount, prefix = '') {
+    const card = document.getElementById(id);
+    const current = parseFloat(card.textContent.replace(/[^0-9.-]/g, '')) || 0;
+    const total = current + amount;
+    card.textContent = prefix ? `${prefix}${total.toFixed(2)}` : String(Math.round(total * 100) / 100);
+}
+
+function applySale(sale) {
+    // Cards only track today when the window ends today
+    if (!analyticsQuery.includes('end=')) {
+        addToCard('totalSales', sale.amount, '₹');
+        addToCard('pointsIssued', sale.points_earned);
+        addToCard('pointsRedeemed', sale.points_redeemed);
+    }
+    document.getElementById('transactionsTable').prepend(transactionRow(sale));
+
+    // Charts are redrawn from the server at most once per delay
+    if (!chartRefreshTimer) {
+        chartRefreshTimer = setTimeout(() => {
+            chartRefreshTimer = null;
+            initializeCharts();
+        }, CHART_REFRESH_DELAY);
+    }
+}
+
+function resyncDashboard() {
+    initializeCharts();
+    loadTransactions();
+}
+
+function subscribeToSales() {
+    if (!window.EventSource) {
+        pollForSales();
+        return;
+    }
+    const source = new EventSource('/api/events');
+    source.addEventListener('sale', event => applySale(JSON.parse(event.data)));
+    source.addEventListener('resync', resyncDashboard);
+    source.onerror = () => {
+        // The browser reconnects by itself unless the server refused the stream
+        if (source.readyState === EventSource.CLOSED) pollForSales();
+    };
+}
+
+// Spread retries out so refused dashboards do not come back in step
+function jittered(ms) {
+    return ms * (1 + Math.random() / 2);
+}
+
+async function pollForSales() {
+    let after = null;
+    let missedSales = false;
+    let nextReload = Date.now() + jittered(QUEUED_RELOAD_INTERVAL);
+    while (true) {
+        try {
+            const response = await fetch(after ? `/api/events/poll?after=${after}` : '/api/events/poll');
+            if (response.status === 503) {
+                // No live-update slot free on the server: wait for one, keeping
+                // our cursor so the server can replay what we missed
+                const wait = (parseInt(response.headers.get('Retry-After'), 10) || 60) * 1000;
+                await new Promise(resolve => setTimeout(resolve, jittered(wait)));
+                if (Date.now() >= nextReload) {
+                    resyncDashboard();
+                    nextReload = Date.now() + jittered(QUEUED_RELOAD_INTERVAL);
+                }
+                // Without a cursor there is nothing to replay from
+                if (!after) missedSales = true;
+                continue;
+            }
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error || 'Failed to poll events');
+            if (missedSales || result.resync || result.events.some(event => event.type === 'resync')) {
+                missedSales = false;
+                resyncDashboard();
+            } else {
+                result.events.filter(event => event.type === 'sale').forEach(event => applySale(event.data));
+            }
+            after = result.last_id;
+        } catch (error) {
+            console.error('Error polling for sales:', error);
+            await new Promise(resolve => setTimeout(resolve, 5000));
+        }
+    }
+}
+
 function switchTab(tabName) {
     // Hide all tab contents
     document.querySelectorAll('.tab-content').forEach(tab => {
@@ -0,0 +1,59 @@
+"""Vendor profiles and their per-worker cache.
+
+Every authenticated page checks that the signed-in vendor still exists and
+shows its name, but a profile only changes at registration. Profiles are
+kept in a bounded LRU/TTL cache, seeded at login, so the common request does
+not read ``vendors/{vendor_id}`` at all. Cached copies carry no password
+hash; sign-in always reads the document itself.
+
+Each worker has its own cache. A vendor deleted on another worker stays
+visible here for at most VENDOR_CACHE_TTL seconds.
+"""
+import os
+
+from app.cache import LocalCache
+from app.models import Vendor
+
+VENDORS_COLLECTION = 'vendors'
+
+VENDOR_CACHE_SIZE = 4096
+VENDOR_CACHE_TTL = int(os.environ.get('URS_VENDOR_CACHE_TTL', 300))  # seconds
+
+_cache = LocalCache(maxsize=VENDOR_CACHE_SIZE, ttl=VENDOR_CACHE_TTL)
+
+
+def vendor_ref(db, vendor_id):
+    return db.collection(VENDORS_COLLECTION).document(vendor_id)
+
+
+def profile(vendor):
+    """A copy of ``vendor`` without its password hash, safe to share."""
+    return Vendor(vendor.id, vendor.name, vendor.email, vendor.vendor_type, vendor.subscription_status)
+
+
+def get_vendor(db, vendor_id, use_cache=True):
+    """Return the vendor's profile, or None if there is no such vendor."""
+    if use_cache:
+        cached = _cache.get(vendor_id)
+        if cached is not None:
+            return cached
+
+    vendor = Vendor.from_snapshot(vendor_ref(db, vendor_id).get())
+    if vendor is None:
+        return None
+    vendor = profile(vendor)
+    _cache.set(vendor_id, vendor)
+    return vendor
+
+
+def remember(vendor):
+    """Cache the profile of a vendor we just read, e.g. at sign-in."""
+    _cache.set(vendor.id, profile(vendor))
+
+
+def invalidate(vendor_id=None):
+    """Drop one vendor's cached profile, or every cached profile."""
+    if vendor_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(vendor_id)
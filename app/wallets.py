@@ -0,0 +1,144 @@
+"""Customer wallets as sharded counters.
+
+A wallet is the sum of the ``balance`` fields of
+``customers/{id}/wallet_shards/{0..WALLET_SHARDS-1}``, plus whatever is still
+in the customer document's own ``wallet_balance`` field from before sharding
+(the "legacy" part). Every sale changes the wallet by points earned minus
+points redeemed, as one write:
+
+* a net credit is added to a random shard, so tills selling to the same
+  customer at once do not fight over one document;
+* a net debit is taken from the legacy part first and then from the
+  fullest shards (``counters.plan_debit``), guarded by the transaction or by
+  update-time preconditions on exactly the documents it takes from.
+
+``migrate`` moves the remaining legacy balances into shard 0.
+"""
+from app import counters
+
+SHARDS_COLLECTION = 'wallet_shards'
+LEGACY = 'legacy'  # the customer document's own field, in WalletSnapshot keys
+
+MIGRATION_PAGE_SIZE = 250  # customers per commit; each is an update and a set
+
+
+class WalletSnapshot:
+    """A wallet's parts as read: value and update time per document."""
+
+    def __init__(self, values, update_times):
+        self.values = values
+        self.update_times = update_times
+
+    @property
+    def balance(self):
+        return sum(self.values.values())
+
+
+def shard_refs(customer_ref):
+    return [customer_ref.collection(SHARDS_COLLECTION).document(str(index))
+            for index in range(counters.WALLET_SHARDS)]
+
+
+def from_snapshots(customer_snapshot, shard_snapshots):
+    values = {}
+    update_times = {}
+    if customer_snapshot.exists:
+        values[LEGACY] = float(customer_snapshot.to_dict().get('wallet_balance') or 0)
+        update_times[LEGACY] = customer_snapshot.update_time
+    for index, snapshot in enumerate(shard_snapshots):
+        if snapshot.exists:
+            values[index] = float(snapshot.to_dict().get('balance') or 0)
+            update_times[index] = snapshot.update_time
+    return WalletSnapshot(values, update_times)
+
+
+def refs_for(customer_ref):
+    """The documents to read for a customer and their wallet."""
+    return [customer_ref] + shard_refs(customer_ref)
+
+
+def from_results(snapshots_by_path, customer_ref):
+    """``(customer snapshot, WalletSnapshot)`` from batched-get results keyed by path."""
+    customer_snapshot = snapshots_by_path[customer_ref.path]
+    shard_snapshots = [snapshots_by_path[ref.path] for ref in shard_refs(customer_ref)]
+    return customer_snapshot, from_snapshots(customer_snapshot, shard_snapshots)
+
+
+def read(db, customer_ref, transaction=None):
+    """Read a customer and their wallet in one round trip; returns (snapshot, WalletSnapshot)."""
+    refs = refs_for(customer_ref)
+    if transaction is not None:
+        snapshots = db.get_all(refs, transaction=transaction)
+    else:
+        snapshots = db.get_all(refs)
+    # Results may come back in any order
+    return from_results({snapshot.reference.path: snapshot for snapshot in snapshots}, customer_ref)
+
+
+def apply(writer, db, customer_ref, wallet, amount, preconditions=False):
+    """Add ``amount`` (negative to debit) to a wallet read as ``wallet``.
+
+    With ``preconditions`` every document a debit takes from must still have
+    the update time it was read at, so the commit fails rather than
+    overspending if another till changed it. Credits need no guard.
+    """
+    if amount > counters.EPSILON:
+        shard = shard_refs(customer_ref)[counters.random_shard(counters.WALLET_SHARDS)]
+        counters.increment(writer, shard, {'balance': amount})
+    elif amount < -counters.EPSILON:
+        from firebase_admin import firestore
+
+        refs = shard_refs(customer_ref)
+        for key, take in counters.plan_debit(wallet.values, -amount):
+            ref, field = (customer_ref, 'wallet_balance') if key == LEGACY else (refs[key], 'balance')
+            update = {field: firestore.Increment(-take)}
+            if preconditions:
+                writer.update(ref, update, option=db.write_option(last_update_time=wallet.update_times[key]))
+            else:
+                writer.update(ref, update)
+
+
+def migrate(db, customers_collection='customers'):
+    """Move every legacy ``wallet_balance`` into the customer's shard 0.
+
+    Customers are moved MIGRATION_PAGE_SIZE to a commit, each update guarded
+    by a precondition. If a sale changes one of them meanwhile the page
+    fails, and its customers are moved one at a time in transactions instead.
+    Returns the number of wallets moved.
+    """
+    from google.api_core import exceptions
+    from app import redemption
+
+    def commit(page):
+        batch = db.batch()
+        for snapshot in page:
+            batch.update(snapshot.reference, {'wallet_balance': 0},
+                         option=db.write_option(last_update_time=snapshot.update_time))
+            counters.increment(batch, shard_refs(snapshot.reference)[0],
+                               {'balance': float(snapshot.to_dict()['wallet_balance'])})
+        try:
+            batch.commit()
+        except (exceptions.FailedPrecondition, exceptions.NotFound):
+            for snapshot in page:
+                redemption.run_transaction(db, _migrate_one, db, snapshot.reference)
+
+    moved = 0
+    page = []
+    for snapshot in db.collection(customers_collection).where('wallet_balance', '>', 0).stream():
+        page.append(snapshot)
+        if len(page) == MIGRATION_PAGE_SIZE:
+            commit(page)
+            moved += len(page)
+            page = []
+    if page:
+        commit(page)
+        moved += len(page)
+    return moved
+
+
+def _migrate_one(transaction, db, customer_ref):
+    snapshot = customer_ref.get(transaction=transaction)
+    balance = float(snapshot.to_dict().get('wallet_balance') or 0) if snapshot.exists else 0
+    if balance:
+        transaction.update(customer_ref, {'wallet_balance': 0})
+        counters.increment(transaction, shard_refs(customer_ref)[0], {'balance': balance})
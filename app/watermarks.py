@@ -0,0 +1,53 @@
+"""Per-vendor change watermarks.
+
+A vendor's watermark is a ``version`` counter that goes up in the same
+commit as every write that changes what the vendor's analytics or
+transaction APIs return. Conditional GETs compare it against the client's
+ETag instead of re-reading transactions or rollups.
+
+Every sale bumps it, so it is a sharded counter (``app/counters.py``): the
+version is the sum over ``vendor_watermarks/{vendor_id}`` and its sibling
+shards ``{vendor_id}_{n}``, found with one query on ``vendor_id``. A quiet
+vendor has a single shard, and the check stays a single document read.
+
+Anything else that writes transactions or rollups (seeding scripts, backfills)
+must bump the vendor's watermark too, or clients keep their cached copies.
+"""
+from app import counters
+
+WATERMARKS_COLLECTION = 'vendor_watermarks'
+
+
+def watermark_ref(db, vendor_id, shard=0):
+    return db.collection(WATERMARKS_COLLECTION).document(counters.shard_id(vendor_id, shard))
+
+
+def bump(db, vendor_id, writer=None):
+    """Advance the vendor's watermark; ``writer`` may be a batch or transaction."""
+    from firebase_admin import firestore
+
+    # vendor_id is what current() finds the shards by
+    update = {'vendor_id': vendor_id, 'version': firestore.Increment(1), 'updated_at': firestore.SERVER_TIMESTAMP}
+    ref = watermark_ref(db, vendor_id, counters.random_shard(counters.VENDOR_SHARDS))
+    if writer is None:
+        ref.set(update, merge=True)
+    else:
+        writer.set(ref, update, merge=True)
+
+
+def current(db, vendor_id):
+    """The vendor's watermark version; 0 before its first recorded change."""
+    # A vendor never has more than VENDOR_SHARDS watermark documents
+    shards = db.collection(WATERMARKS_COLLECTION).where('vendor_id', '==', vendor_id)\
+               .limit(counters.VENDOR_SHARDS).get()
+    return sum(int(shard.to_dict().get('version', 0)) for shard in shards)
+
+
+def migrate(db):
+    """Add ``vendor_id`` to watermarks written before sharding; returns documents updated."""
+    updated = 0
+    for doc in db.collection(WATERMARKS_COLLECTION).stream():
+        if 'vendor_id' not in doc.to_dict():
+            doc.reference.update({'vendor_id': doc.id})
+            updated += 1
+    return updated
@@ -0,0 +1,139 @@
+"""Audit the Firestore queries the app runs and check they are indexed.
+
+Usage: python benchmarks/audit_queries.py [--vendors N] [--customers N]
+       [--transactions N] [--write] [--strict]
+
+Seeds the in-memory store, then runs every route and maintenance command
+that queries Firestore (sign-in, dashboard, the transactions and analytics
+APIs with and without date ranges and cursors, checkout, batch sync, queued
+and streamed exports, rollup backfill, counter migration) with
+``URS_QUERY_AUDIT=1``. It prints each query shape with how often it ran, the
+documents it returned, its latency and the routes that issued it.
+
+Exits 1 if a query needs a composite index that ``firestore.indexes.json``
+does not declare; ``--write`` adds the missing ones to the file instead.
+Unbounded queries are listed as warnings, or fail the run with ``--strict``
+unless they are in ALLOWED_UNBOUNDED.
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ['URS_BACKEND'] = 'memory'
+os.environ['URS_QUERY_AUDIT'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, customers, query_audit, repos, seeding  # noqa: E402
+
+PASSWORD = 'test123'
+
+# Unbounded shapes that only ever read a few documents, or only run in
+# maintenance commands
+ALLOWED_UNBOUNDED = {
+    'transactions where vendor_id ==': 'backfill-rollups rebuilds from the whole history',
+    'vendor_daily_rollups where vendor_id ==': 'backfill-rollups deletes stale shards',
+    'transactions': 'backfill-rollups without --vendor-id',
+    'vendor_daily_rollups': 'backfill-rollups without --vendor-id',
+    'vendor_watermarks': 'migrate-counters',
+}
+
+
+def exercise(client, email, phones):
+    """Run every query-issuing route once as the vendor with ``email``."""
+    def check(response, *expected):
+        body = response.get_data()
+        response.close()
+        if response.status_code not in expected:
+            raise SystemExit(f"{response.request.method} {response.request.path}: "
+                             f"{response.status_code} {body[:200]!r}")
+        return body
+
+    check(client.post('/login', data={'email': email, 'password': PASSWORD}), 302)
+    check(client.get('/dashboard'), 200)
+
+    today = datetime.utcnow().date()
+    week_ago = (today - timedelta(days=7)).isoformat()
+    for path in ('/api/analytics', '/api/analytics?days=30',
+                 f'/api/analytics?start={week_ago}&end={today.isoformat()}'):
+        check(client.get(path), 200)
+    page = json.loads(check(client.get('/api/transactions?days=30&limit=5'), 200))
+    if page.get('next_cursor'):
+        check(client.get(f"/api/transactions?days=30&limit=5&cursor={page['next_cursor']}"), 200)
+    check(client.get(f'/api/transactions?start={week_ago}&end={today.isoformat()}'), 200)
+
+    check(client.post('/check_customer', data={'phone': phones[0]}), 200)
+    check(client.post('/apply_discount', data={'phone': phones[0], 'bill_amount': '250'}), 302)
+    check(client.post('/api/sales/batch', json={'sales': [
+        {'idempotency_key': f'audit-{index}', 'phone': phone, 'bill_amount': 120 + index}
+        for index, phone in enumerate(phones)]}), 200)
+
+    for query in ('format=csv', f'format=csv&start={week_ago}&end={today.isoformat()}'):
+        job = json.loads(check(client.get(f'/api/export?{query}'), 202))
+        while job['status'] in ('queued', 'running'):
+            time.sleep(0.02)
+            job = json.loads(check(client.get(job['status_url']), 200))
+        check(client.get(job['download_url']), 200)
+    check(client.get('/api/export?format=csv&stream=1'), 200)
+    check(client.get('/logout'), 302)
+
+
+def print_report(rows):
+    print(f"{'flags':<20} {'runs':>5} {'docs':>7} {'max':>6} {'avg ms':>7}  query (routes)")
+    for row in rows:
+        flags = ','.join(row['flags']) or '-'
+        average = row['seconds'] / row['count'] * 1000
+        print(f"{flags:<20} {row['count']:>5} {row['documents']:>7} {row['max_documents']:>6} "
+              f"{average:>7.2f}  {row['query']} ({', '.join(row['routes'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vendors', type=int, default=4)
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=8000)
+    parser.add_argument('--write', action='store_true', help='add missing indexes to firestore.indexes.json')
+    parser.add_argument('--strict', action='store_true', help='fail on unbounded queries too')
+    args = parser.parse_args()
+
+    summary = seeding.seed(repos.db, args.vendors, args.customers, args.transactions,
+                           password=PASSWORD, progress=lambda message: None)
+    customers._cache.clear()
+    query_audit.reset()
+
+    phones = [seeding.customer_phone(index) for index in range(min(3, args.customers))]
+    client = app.test_client()
+    exercise(client, seeding.vendor_email(0), phones)
+
+    runner = app.test_cli_runner()
+    for command in (['backfill-rollups', '--vendor-id', summary['vendor_ids'][0]],
+                    ['backfill-rollups'], ['migrate-counters']):
+        result = runner.invoke(args=command)
+        if result.exit_code:
+            raise SystemExit(f"flask {' '.join(command)} failed:\n{result.output}")
+
+    if args.write:
+        content = query_audit.write_manifest()
+        print(f"Wrote {len(content['indexes'])} composite indexes to {query_audit.INDEXES_FILE}")
+
+    rows = query_audit.report()
+    print_report(rows)
+
+    unindexed = [row for row in rows if 'unindexed' in row['flags']]
+    unbounded = [row for row in rows
+                 if 'unbounded' in row['flags'] and row['query'] not in ALLOWED_UNBOUNDED]
+    for row in unindexed:
+        print(f"MISSING INDEX: {row['query']} needs "
+              f"{', '.join(f'{field} {order}' for field, order in query_audit.index_fields(row['shape']))}")
+    for row in unbounded:
+        print(f"{'UNBOUNDED' if args.strict else 'warning: unbounded'}: {row['query']} "
+              f"read {row['documents']} documents in {row['count']} runs ({', '.join(row['routes'])})")
+    if unindexed:
+        print("Run with --write to add the missing indexes to firestore.indexes.json")
+    sys.exit(1 if unindexed or (args.strict and unbounded) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Analytics for long windows: per-transaction loop vs vectorized rollup summary.
+
+Usage: python benchmarks/bench_analytics.py [--per-day N] [--days 30 90 365]
+
+Seeds one vendor with ``--per-day`` transactions for each of the last 365
+days in the in-memory store, backfills its daily rollups, then times the
+analytics for each window two ways:
+
+* loop: the original ``get_analytics`` body, which streamed every
+  transaction and bucketed it with two ``strftime`` calls per row;
+* vectorized: ``repos.rollups.load`` plus ``analytics.summarize``.
+
+Reports wall time and documents read per request.
+"""
+from datetime import datetime, timedelta
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ['URS_BACKEND'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import analytics, repos, rollups
+
+VENDOR_ID = 'bench-vendor'
+
+
+def seed(db, per_day, customers):
+    now = datetime.utcnow()
+    batch = db.batch()
+    for i in range(per_day * analytics.MAX_DAYS):
+        amount = round(random.uniform(20, 2000), 2)
+        batch.set(db.collection('transactions').document(), {
+            'vendor_id': VENDOR_ID,
+            'customer_id': f'customer{random.randrange(customers):06d}',
+            'amount': amount,
+            'points_earned': round(amount * 0.15, 2),
+            'points_redeemed': random.choice([0, 0, round(amount * 0.05, 2)]),
+            'timestamp': now - timedelta(seconds=random.uniform(0, analytics.MAX_DAYS * 86400)),
+        })
+        if (i + 1) % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    repos.rollups.backfill(VENDOR_ID)
+
+
+def loop_analytics(db, days):
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+    transactions = list(db.collection('transactions').where('vendor_id', '==', VENDOR_ID)
+                        .where('timestamp', '>=', start_date).where('timestamp', '<=', end_date).stream())
+
+    daily_sales = {}
+    current_date = start_date
+    while current_date <= end_date:
+        daily_sales[current_date.strftime('%Y-%m-%d')] = 0
+        current_date += timedelta(days=1)
+    unique_customers = set()
+    customer_activity = {}
+    hourly_distribution = {str(i).zfill(2): 0 for i in range(24)}
+    total_earned = total_redeemed = total_amount = 0
+    for t in transactions:
+        t_dict = t.to_dict()
+        total_amount += t_dict['amount']
+        date_str = t_dict['timestamp'].strftime('%Y-%m-%d')
+        daily_sales[date_str] = daily_sales.get(date_str, 0) + t_dict['amount']
+        total_earned += t_dict.get('points_earned', 0)
+        total_redeemed += t_dict.get('points_redeemed', 0)
+        unique_customers.add(t_dict['customer_id'])
+        customer_activity[date_str] = customer_activity.get(date_str, 0) + 1
+        hourly_distribution[t_dict['timestamp'].strftime('%H')] += 1
+    return len(unique_customers)
+
+
+def vectorized_analytics(db, days):
+    end_date = datetime.utcnow()
+    window = rollups.window_days(end_date - timedelta(days=days), end_date)
+    return analytics.summarize(window, repos.rollups.load(VENDOR_ID, window))['unique_customers']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-day', type=int, default=200, help='transactions per day')
+    parser.add_argument('--customers', type=int, default=3000)
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 90, 365])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(1)
+    db = repos.db
+    seed(db, args.per_day, args.customers)
+
+    print(f"{'days':>5}  {'engine':<11} {'ms/request':>11} {'docs read':>10} {'unique customers':>17}")
+    for days in args.days:
+        for label, fn in (('loop', loop_analytics), ('vectorized', vectorized_analytics)):
+            db.reset_stats()
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                unique = fn(db, days)
+            elapsed = (time.perf_counter() - started) / args.repeat
+            reads = db.stats['reads'] / args.repeat
+            print(f"{days:>5}  {label:<11} {elapsed * 1000:>11.1f} {reads:>10.0f} {unique:>17}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Checkout throughput under per-document write limits, with and without sharded counters.
+
+Usage: python benchmarks/bench_counters.py [--tills N] [--sales N] [--shards N] [--doc-rate N]
+
+Firestore sustains about one write per second on a single document; more
+than that queues and then aborts. The in-memory store has no such limit, so
+this script adds one: each document accepts at most ``--doc-rate`` writes
+per second (scaled up from 1/s so runs stay short), and a commit waits for
+the slowest document it touches.
+
+Two rushes run with 1 shard (the old layout) and with ``--shards``:
+
+* promotion: ``--tills`` tills of one vendor, each serving its own
+  customers. Every sale writes the vendor's daily rollup and watermark,
+  which sharding spreads out.
+* shared customer: tills of different vendors all serving one customer
+  whose purchases only earn points (no redemption), so every sale credits
+  the same wallet.
+
+A third rush, shared customer with redemption, shows the limit of sharding:
+a sale that takes points must read and lock the shards it takes them from,
+so those sales still queue behind each other.
+
+For each it reports sales/s, p50/p95 checkout latency, checkouts that gave
+up under contention, and the most commits (failed attempts included) that
+touched any one document. It also checks that every wallet equals its
+ledger.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+
+os.environ['URS_BACKEND'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import counters, customers, redemption, wallets  # noqa: E402
+from app.firestore_memory import MemoryClient  # noqa: E402
+
+POLICY = {
+    'threshold_amount': 100,
+    'earn_percentage_min': 10,
+    'earn_percentage_max': 15,
+    'redeem_percentage': 10,
+    'can_redeem': True,
+}
+
+
+class DocumentRateLimit:
+    """Wraps a store's ``apply`` so each document takes at most ``rate`` writes per second."""
+
+    def __init__(self, store, rate):
+        self.store = store
+        self.interval = 1.0 / rate
+        self.next_free = {}
+        self.writes = {}
+        self.lock = threading.Lock()
+        self._apply = store.apply
+        store.apply = self.apply
+
+    def apply(self, writes, expected_versions=None):
+        with self.lock:
+            now = time.monotonic()
+            paths = {path for _, path, _, _, _ in writes}
+            start = max([now] + [self.next_free.get(path, 0) for path in paths])
+            for path in paths:
+                self.next_free[path] = start + self.interval
+                self.writes[path] = self.writes.get(path, 0) + 1
+        if start > now:
+            time.sleep(start - now)
+        return self._apply(writes, expected_versions)
+
+
+def setup(db, customer_count, opening_balance):
+    for i in range(customer_count):
+        ref = db.collection(customers.CUSTOMERS_COLLECTION).document(f'customer-{i}')
+        phone = f'9{i:09d}'
+        ref.set({'name': f'Customer {i}', 'email': f'c{i}@example.com', 'phone': phone,
+                 'wallet_balance': opening_balance})
+        customers.phone_index_ref(db, phone).set({'customer_id': ref.id})
+
+
+def run(name, shards, args, vendors, customer_count, can_redeem):
+    counters.VENDOR_SHARDS = counters.WALLET_SHARDS = shards
+    db = MemoryClient(latency=args.latency)
+    opening = 1000.0 if can_redeem else 0.0
+    setup(db, customer_count, opening)
+    customers._cache.clear()
+    limit = DocumentRateLimit(db._store, args.doc_rate)
+    policy = dict(POLICY, can_redeem=can_redeem)
+    timings = []
+    gave_up = 0
+    lock = threading.Lock()
+
+    def till(index):
+        nonlocal gave_up
+        vendor_id = f'vendor-{index % vendors}'
+        for sale in range(args.sales):
+            phone = f'9{(index * args.sales + sale) % customer_count:09d}'
+            started = time.perf_counter()
+            try:
+                # A till's check screen read, then the checkout
+                customer = customers.find_customer(db, phone, use_cache=False)
+                redemption.redeem(db, customer, vendor_id, 40.0 + sale % 5 * 20, dict(policy, vendor_id=vendor_id))
+            except redemption.RedemptionContention:
+                with lock:
+                    gave_up += 1
+                continue
+            with lock:
+                timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.tills) as pool:
+        list(pool.map(till, range(args.tills)))
+    elapsed = time.perf_counter() - started
+
+    # Every wallet must equal its opening balance replayed through the ledger
+    replay = {}
+    for doc in db.collection('transactions').stream():
+        t = doc.to_dict()
+        replay[t['customer_id']] = replay.get(t['customer_id'], opening) + t['points_earned'] - t['points_redeemed']
+    consistent = all(
+        math.isclose(wallets.read(db, db.collection(customers.CUSTOMERS_COLLECTION).document(customer_id))[1].balance,
+                     expected, abs_tol=1e-6)
+        for customer_id, expected in replay.items())
+
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1000 if timings else 0
+    p95 = timings[int(len(timings) * 0.95)] * 1000 if timings else 0
+    path, writes = max(limit.writes.items(), key=lambda item: item[1])
+    # Name the hottest document by its collections, e.g. customers/*/wallet_shards
+    hottest = '/*/'.join(path.split('/')[0::2])
+    print(f"{name:<28} shards={shards:<3} sales/s={len(timings) / elapsed:>7.1f} p50={p50:>7.1f}ms "
+          f"p95={p95:>7.1f}ms gave_up={gave_up:<4} hottest={writes:>4} commits ({hottest}) "
+          f"{'consistent' if consistent else 'WALLET MISMATCH'}")
+    return consistent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tills', type=int, default=16)
+    parser.add_argument('--sales', type=int, default=10, help='checkouts per till')
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--doc-rate', type=float, default=50, help='writes per second one document accepts')
+    parser.add_argument('--latency', type=float, default=0.002, help='simulated seconds per round trip')
+    args = parser.parse_args()
+
+    ok = True
+    for shards in (1, args.shards):
+        ok &= run('promotion (one vendor)', shards, args, 1, args.tills * args.sales, True)
+    for shards in (1, args.shards):
+        ok &= run('shared customer, earn only', shards, args, args.tills, 1, False)
+    for shards in (1, args.shards):
+        ok &= run('shared customer, redeeming', shards, args, args.tills, 1, True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Latency of handlers with independent reads, sequential vs fanned out.
+
+Usage: python benchmarks/bench_fanout.py [--latency SECONDS] [--requests N]
+
+Runs the real handlers against the in-memory store with ``--latency``
+injected on every Firestore round trip, once with ``app.concurrency.gather``
+running calls one after another (the old behaviour) and once concurrently.
+Worker caches are cleared before every request, so each request pays for
+all of its reads.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+os.environ['URS_BACKEND'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, concurrency, customers, policies, repos, routes
+
+VENDOR_ID = 'bench-vendor'
+PHONE = '9876543210'
+
+
+def seed(db):
+    db.collection('vendors').document(VENDOR_ID).set({
+        'name': 'Bench', 'email': 'bench@example.com', 'password': 'x', 'vendor_type': 'medium'})
+    db.collection('vendor_policies').document(VENDOR_ID).set(policies.build_policy(VENDOR_ID, 'medium'))
+    db.collection('customers').document('bench-customer').set({
+        'name': 'Customer', 'email': 'c@example.com', 'phone': PHONE, 'wallet_balance': 100.0})
+    customers.build_phone_index(db)
+
+
+def cold_caches():
+    policies.invalidate()
+    customers.invalidate(PHONE)
+    routes.dashboard_cache.clear()
+
+
+def scenarios(client):
+    return [
+        ('check_customer', lambda: client.post('/check_customer', data={'phone': PHONE})),
+        ('apply_discount', lambda: client.post('/apply_discount', data={'phone': PHONE, 'bill_amount': '10'})),
+        ('dashboard', lambda: client.get('/dashboard')),
+        ('export job submit', lambda: client.get('/api/export?format=csv')),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per round trip')
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    db = repos.db
+    seed(db)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['vendor_id'] = VENDOR_ID
+    client.get('/login')
+    for thread in threading.enumerate():
+        if thread.name == 'policy-warm':
+            thread.join()
+    db.latency = args.latency
+
+    print(f"{args.latency * 1000:.0f} ms per round trip, cold worker caches")
+    print(f"{'handler':<20} {'sequential ms':>14} {'fan-out ms':>11} {'round trips':>12}")
+    for name, request in scenarios(client):
+        medians = []
+        for workers in (0, concurrency.FANOUT_WORKERS):
+            concurrency.FANOUT_WORKERS = workers
+            timings = []
+            db.reset_stats()
+            for _ in range(args.requests):
+                cold_caches()
+                started = time.perf_counter()
+                response = request()
+                response.get_data()
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    raise SystemExit(f"{name}: HTTP {response.status_code}")
+            medians.append(statistics.median(timings))
+        trips = db.stats['round_trips'] / args.requests
+        print(f"{name:<20} {medians[0]:>14.1f} {medians[1]:>11.1f} {trips:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""Load test: concurrent vendors running a mix of dashboard and till traffic.
+
+Usage: python benchmarks/bench_load.py [--users N] [--duration S] [--mix NAME=WEIGHT ...]
+       [--serve [--workers N]] [--json PATH] [--compare PATH]
+
+Seeds the in-memory store with ``app/seeding.py`` and runs ``--users``
+simulated vendors concurrently for ``--duration`` seconds. Each user logs in
+once and then repeatedly picks a scenario by weight:
+
+* login: a fresh sign-in;
+* dashboard: reload /dashboard;
+* analytics: poll /api/analytics and /api/transactions, sending back the
+  ETags from the last poll as a browser would;
+* checkout: /check_customer and /apply_discount for a customer drawn with
+  the same skew as the seeded data;
+* export: queue a CSV export, poll it and download the file.
+
+By default the app runs in this process through Flask's test client. With
+``--serve`` the harness starts gunicorn as render.yaml does (gthread,
+``--workers``) on a local port, with the seeded store loaded before the fork
+(``benchmarks/load_app.py``). Each worker then has its own copy of the store.
+
+For every scenario it reports throughput, p50/p95/p99 latency, errors, and
+Firestore document reads and writes per run. The Firestore counts are the
+differences in ``/metrics`` over the run, summed over each scenario's
+routes; export builds run in the background, so their reads are counted
+under ``export``. Everything runs offline. Users' choices are drawn from
+``--seed``, so the same arguments replay the same workload. ``--json``
+saves the results and ``--compare`` prints the change from a saved run.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['URS_BACKEND'] = 'memory'
+# Fixed cost so numbers compare across machines, and a private metrics dir
+os.environ.setdefault('URS_BCRYPT_ROUNDS', '10')
+os.environ.setdefault('URS_METRICS_DIR', tempfile.mkdtemp(prefix='urs-load-metrics-'))
+sys.path.insert(0, ROOT)
+
+SCENARIO_ROUTES = {
+    'login': ['/login'],
+    'dashboard': ['/dashboard'],
+    'analytics': ['/api/analytics', '/api/transactions'],
+    'checkout': ['/check_customer', '/apply_discount'],
+    'export': ['/api/export', '/api/export/<job_id>', '/api/export/<job_id>/download', 'background'],
+}
+DEFAULT_MIX = {'login': 5, 'dashboard': 20, 'analytics': 40, 'checkout': 30, 'export': 5}
+PASSWORD = 'test123'
+
+
+class TestClientSession:
+    """One user's cookies on the in-process app."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.client.open(path, method=method, data=data, headers=headers)
+        body = response.get_data()
+        status, response_headers = response.status_code, response.headers
+        # Closing runs the metrics hooks, as a real server would
+        response.close()
+        return status, response_headers, body
+
+
+class HttpSession:
+    """One user's cookies on a gunicorn server."""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.session.request(method, self.base_url + path, data=data, headers=headers,
+                                        allow_redirects=False)
+        return response.status_code, response.headers, response.content
+
+
+class User:
+    def __init__(self, index, session, summary, customer_count, rng):
+        self.index = index
+        self.session = session
+        self.email = summary['emails'][index % len(summary['emails'])]
+        self.customer_count = customer_count
+        self.rng = rng
+        self.etags = {}
+
+    def login(self):
+        status, _, _ = self.session.request('POST', '/login', {'email': self.email, 'password': PASSWORD})
+        return [status]
+
+    def dashboard(self):
+        return [self.session.request('GET', '/dashboard')[0]]
+
+    def analytics(self):
+        statuses = []
+        for path in ('/api/analytics?days=30', '/api/transactions?days=7'):
+            headers = {'If-None-Match': self.etags[path]} if path in self.etags else None
+            status, response_headers, _ = self.session.request('GET', path, headers=headers)
+            if response_headers.get('ETag'):
+                self.etags[path] = response_headers['ETag']
+            statuses.append(status)
+        return statuses
+
+    def checkout(self):
+        from app import seeding
+
+        # Regulars come back far more often, as in the seeded data
+        phone = seeding.customer_phone(int(self.customer_count * self.rng.random() ** 3))
+        statuses = [self.session.request('POST', '/check_customer', {'phone': phone})[0]]
+        amount = f"{self.rng.uniform(50, 2000):.2f}"
+        statuses.append(self.session.request('POST', '/apply_discount', {'phone': phone, 'bill_amount': amount})[0])
+        return statuses
+
+    def export(self):
+        status, _, body = self.session.request('GET', '/api/export?format=csv')
+        statuses = [status]
+        if status >= 400:
+            return statuses
+        job = json.loads(body)
+        while job['status'] in ('queued', 'running'):
+            time.sleep(0.05)
+            status, _, body = self.session.request('GET', job['status_url'])
+            statuses.append(status)
+            job = json.loads(body)
+        if job['status'] == 'done':
+            statuses.append(self.session.request('GET', job['download_url'])[0])
+        else:
+            statuses.append(500)
+        return statuses
+
+
+def is_error(status):
+    # 302 is a login or checkout redirect and 304 a revalidated poll
+    return status >= 400
+
+
+def firestore_ops(fetch_metrics):
+    """Reads and writes per route label from a /metrics scrape."""
+    ops = {}
+    pattern = re.compile(r'^urs_firestore_documents_(read|written)_total\{route="([^"]*)",vendor="[^"]*"\} (\S+)$')
+    for line in fetch_metrics().splitlines():
+        match = pattern.match(line)
+        if match:
+            kind, route, value = match.groups()
+            counts = ops.setdefault(route, {'read': 0.0, 'written': 0.0})
+            counts[kind] += float(value)
+    return ops
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(make_session, summary, args, mix):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = {name: {'timings': [], 'errors': 0} for name in names}
+    lock = threading.Lock()
+    deadline = None
+    ready = threading.Barrier(args.users + 1)
+
+    def user_loop(index):
+        nonlocal deadline
+        rng = random.Random(args.seed * 100003 + index)
+        user = User(index, make_session(), summary, args.customers, rng)
+        user.login()
+        ready.wait()
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            statuses = getattr(user, name)()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                results[name]['timings'].append(elapsed)
+                results[name]['errors'] += sum(1 for status in statuses if is_error(status))
+            if args.think:
+                time.sleep(rng.expovariate(1 / args.think))
+
+    threads = [threading.Thread(target=user_loop, args=(i,), daemon=True) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    deadline = time.perf_counter() + 3600
+    ready.wait()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, 'benchmarks')]),
+               URS_LOAD_VENDORS=str(args.vendors), URS_LOAD_CUSTOMERS=str(args.customers),
+               URS_LOAD_TRANSACTIONS=str(args.transactions), URS_LOAD_SEED=str(args.seed))
+    command = ['gunicorn', '--preload', '--worker-class', 'gthread', '--threads', '24',
+               '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+               'load_app:app']
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+
+    import requests
+    for _ in range(600):
+        if server.poll() is not None:
+            raise SystemExit('gunicorn exited during startup')
+        try:
+            requests.get(base_url + '/login', timeout=1)
+            return server, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('gunicorn did not start')
+
+
+def scrape_workers(base_url, workers):
+    """/metrics once every worker has saved its latest counts.
+
+    Workers save a snapshot on the first request after SNAPSHOT_INTERVAL, so
+    wait that long and then touch each of them before scraping.
+    """
+    import requests
+    from app import metrics
+
+    time.sleep(metrics.SNAPSHOT_INTERVAL + 0.5)
+    for _ in range(workers * 8):
+        requests.get(base_url + '/login', timeout=10)
+    return requests.get(base_url + '/metrics', timeout=10).text
+
+
+def report(results, elapsed, before, after):
+    rows = {}
+    for name, result in results.items():
+        timings = result['timings']
+        runs = len(timings)
+        reads = sum(after.get(r, {}).get('read', 0) - before.get(r, {}).get('read', 0)
+                    for r in SCENARIO_ROUTES[name])
+        writes = sum(after.get(r, {}).get('written', 0) - before.get(r, {}).get('written', 0)
+                     for r in SCENARIO_ROUTES[name])
+        rows[name] = {
+            'runs': runs,
+            'per_second': runs / elapsed,
+            'p50': percentile(timings, 50) if runs else 0.0,
+            'p95': percentile(timings, 95) if runs else 0.0,
+            'p99': percentile(timings, 99) if runs else 0.0,
+            'errors': result['errors'],
+            'reads': reads / runs if runs else 0.0,
+            'writes': writes / runs if runs else 0.0,
+        }
+    return rows
+
+
+def print_rows(rows, elapsed):
+    print(f"{'scenario':<10} {'runs':>6} {'runs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'reads/run':>10} {'writes/run':>11}")
+    for name, row in rows.items():
+        print(f"{name:<10} {row['runs']:>6} {row['per_second']:>8.1f} {row['p50']:>8.1f} {row['p95']:>8.1f} "
+              f"{row['p99']:>8.1f} {row['errors']:>7} {row['reads']:>10.1f} {row['writes']:>11.1f}")
+    total = sum(row['runs'] for row in rows.values())
+    print(f"{'total':<10} {total:>6} {total / elapsed:>8.1f}")
+
+
+def print_comparison(rows, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['scenarios']
+    print(f"\nchange from {baseline_path}:")
+    print(f"{'scenario':<10} {'runs/s':>9} {'p95':>9} {'p99':>9} {'reads/run':>10}")
+    for name, row in rows.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+
+        def change(key):
+            return f"{(row[key] - old[key]) / old[key] * 100:+.0f}%" if old[key] else 'n/a'
+        print(f"{name:<10} {change('per_second'):>9} {change('p95'):>9} {change('p99'):>9} {change('reads'):>10}")
+
+
+def parse_mix(values):
+    mix = dict(DEFAULT_MIX)
+    for value in values or []:
+        name, _, weight = value.partition('=')
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20, help='concurrent simulated vendors')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of measured load')
+    parser.add_argument('--think', type=float, default=0, help='mean seconds between a user\'s scenarios')
+    parser.add_argument('--mix', nargs='*', metavar='NAME=WEIGHT', help='override scenario weights')
+    parser.add_argument('--vendors', type=int, default=50)
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--transactions', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve', action='store_true', help='run the app under a local gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers with --serve')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file from an earlier run')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    from app import seeding
+
+    server = None
+    if args.serve:
+        server, base_url = start_server(args)
+        make_session = lambda: HttpSession(base_url)
+        fetch_metrics = lambda: scrape_workers(base_url, args.workers)
+    else:
+        from app import app, repos
+        started = time.perf_counter()
+        seeding.seed(repos.db, args.vendors, args.customers, args.transactions, seed=args.seed,
+                     progress=lambda message: None)
+        print(f"Seeded {args.vendors} vendors, {args.customers} customers, "
+              f"{args.transactions} transactions in {time.perf_counter() - started:.1f}s")
+        make_session = lambda: TestClientSession(app)
+        fetch_metrics = lambda: app.test_client().get('/metrics').get_data(as_text=True)
+
+    summary = {'emails': [seeding.vendor_email(i) for i in range(args.vendors)]}
+    try:
+        before = firestore_ops(fetch_metrics)
+        results, elapsed = run(make_session, summary, args, mix)
+        if not args.serve:
+            from app import metrics
+            metrics.write_snapshot()
+        after = firestore_ops(fetch_metrics)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    target = f"gunicorn x{args.workers}" if args.serve else 'test client'
+    print(f"{args.users} users for {elapsed:.1f}s against {target}\n")
+    rows = report(results, elapsed, before, after)
+    print_rows(rows, elapsed)
+
+    if args.compare:
+        print_comparison(rows, args.compare)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'elapsed': elapsed, 'scenarios': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Concurrent login throughput, and what a login burst does to other routes.
+
+Usage: python benchmarks/bench_login.py [--threads N] [--logins N] [--rounds N]
+
+Seeds vendors in the in-memory store and runs ``--logins`` logins from
+``--threads`` threads. Meanwhile one more thread keeps requesting
+``/api/transactions``. The run happens twice: once hashing inline on the
+request threads (the old behaviour), once on the bounded pool in
+``app/passwords.py``. Logins refused with 503 because the pool queue was
+full are counted separately.
+
+``--rounds`` pins the bcrypt cost; by default it is calibrated on this
+machine. Half of the vendors start with plaintext passwords, and the first
+login of each rehashes it.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+os.environ['URS_BACKEND'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, passwords, policies, repos
+
+PASSWORD = 'bench-password'
+
+
+def seed(db, vendor_count):
+    password_hash = passwords._hash(PASSWORD)
+    for i in range(vendor_count):
+        vendor_id = f'vendor{i:04d}'
+        db.collection('vendors').document(vendor_id).set({
+            'name': f'Vendor {i}',
+            'email': f'vendor{i}@example.com',
+            # Odd vendors still have the pre-hashing plaintext password
+            'password': PASSWORD if i % 2 else password_hash,
+            'vendor_type': 'small'
+        })
+        db.collection('vendor_policies').document(vendor_id).set(policies.build_policy(vendor_id, 'small'))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(thread_count, login_count, vendor_count):
+    login_times = []
+    bystander_times = []
+    statuses = {}
+    lock = threading.Lock()
+    remaining = iter(range(login_count))
+    done = threading.Event()
+
+    def login_worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                i = next(remaining, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            response = client.post('/login', data={'email': f'vendor{i % vendor_count}@example.com',
+                                                   'password': PASSWORD})
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                login_times.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    def bystander():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['vendor_id'] = 'vendor0000'
+        while not done.is_set():
+            started = time.perf_counter()
+            client.get('/api/transactions?days=7').get_data()
+            bystander_times.append((time.perf_counter() - started) * 1000)
+
+    watcher = threading.Thread(target=bystander)
+    watcher.start()
+    threads = [threading.Thread(target=login_worker) for _ in range(thread_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    watcher.join()
+
+    accepted = statuses.get(302, 0)
+    return {
+        'logins/s': accepted / elapsed,
+        'login p50': percentile(login_times, 50),
+        'login p95': percentile(login_times, 95),
+        'busy (503)': statuses.get(503, 0),
+        'other p50': percentile(bystander_times, 50),
+        'other p99': percentile(bystander_times, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16, help='concurrent login threads (gthread threads)')
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--vendors', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=None, help='bcrypt cost (default: calibrated)')
+    args = parser.parse_args()
+
+    if args.rounds:
+        passwords.ROUNDS = args.rounds
+    print(f"bcrypt cost {passwords.rounds()}, {os.cpu_count()} CPUs, "
+          f"pool of {passwords.HASH_WORKERS} with {passwords.MAX_PENDING} pending max")
+
+    db = repos.db
+    seed(db, args.vendors)
+    app.test_client().get('/login')
+
+    pool_workers = passwords.HASH_WORKERS
+    print(f"{'mode':<8} {'logins/s':>9} {'login p50':>10} {'login p95':>10} {'busy':>6} "
+          f"{'other p50':>10} {'other p99':>10}   (ms)")
+    for mode, workers in (('inline', 0), ('pool', pool_workers)):
+        passwords.HASH_WORKERS = workers
+        passwords._reset_pool()
+        db.reset_stats()
+        result = run(args.threads, args.logins, args.vendors)
+        print(f"{mode:<8} {result['logins/s']:>9.1f} {result['login p50']:>10.1f} {result['login p95']:>10.1f} "
+              f"{result['busy (503)']:>6} {result['other p50']:>10.1f} {result['other p99']:>10.1f}")
+
+    plaintext = sum(1 for doc in db.collection('vendors').stream()
+                    if not passwords.is_hashed(doc.to_dict()['password']))
+    print(f"vendors still on plaintext passwords after the runs: {plaintext}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Memory and time per 100k transactions: snapshot dicts vs Transaction records.
+
+Usage: python benchmarks/bench_models.py [count]   (default: 100000)
+
+Builds real Firestore ``DocumentSnapshot`` objects (timestamps as
+``DatetimeWithNanoseconds``, as the client returns them) and compares:
+
+* before: the old route code, which kept ``to_dict()`` results and called
+  ``to_dict()`` once per field (``get_transactions`` did it four times per
+  document);
+* after: one ``Transaction.from_snapshot`` per document.
+
+Reports the time to deserialize, the Python heap retained by the loaded rows
+(tracemalloc), and the time of a daily/hourly aggregation loop over them.
+"""
+from datetime import datetime, timedelta, timezone
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Importing app.* runs the app package; the in-memory backend needs no credentials
+os.environ.setdefault('URS_BACKEND', 'memory')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1.document import DocumentReference, DocumentSnapshot
+
+from app.models import Transaction
+
+
+def make_snapshots(count):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    snapshots = []
+    for i in range(count):
+        amount = round(random.uniform(20, 2000), 2)
+        stamp = start + timedelta(seconds=311 * i)
+        data = {
+            'vendor_id': 'bench-vendor',
+            'customer_id': f'customer{random.randrange(5000):06d}',
+            'amount': amount,
+            'points_earned': round(amount * 0.15, 2),
+            'points_redeemed': 0,
+            'timestamp': DatetimeWithNanoseconds(stamp.year, stamp.month, stamp.day, stamp.hour,
+                                                 stamp.minute, stamp.second, tzinfo=timezone.utc),
+        }
+        ref = DocumentReference('transactions', f'txn{i:017d}')
+        snapshots.append(DocumentSnapshot(ref, data, True, None, None, None))
+    return snapshots
+
+
+def load_dicts(snapshots):
+    rows = []
+    for t in snapshots:
+        # As get_transactions did: one to_dict() per field read
+        rows.append({
+            'id': t.id,
+            'amount': t.to_dict()['amount'],
+            'points_earned': t.to_dict()['points_earned'],
+            'points_redeemed': t.to_dict()['points_redeemed'],
+            'timestamp': t.to_dict()['timestamp'],
+            'customer_id': t.to_dict()['customer_id'],
+        })
+    return rows
+
+
+def load_records(snapshots):
+    return [Transaction.from_snapshot(t) for t in snapshots]
+
+
+def aggregate_dicts(rows):
+    daily, hourly = {}, {}
+    for t in rows:
+        day = t['timestamp'].strftime('%Y-%m-%d')
+        hour = t['timestamp'].strftime('%H')
+        daily[day] = daily.get(day, 0) + t['amount']
+        hourly[hour] = hourly.get(hour, 0) + 1
+    return daily, hourly
+
+
+def aggregate_records(rows):
+    daily, hourly = {}, {}
+    for t in rows:
+        day = t.timestamp.date()
+        daily[day] = daily.get(day, 0) + t.amount
+        hourly[t.timestamp.hour] = hourly.get(t.timestamp.hour, 0) + 1
+    return daily, hourly
+
+
+def measure(snapshots, load, aggregate):
+    # Timed without tracemalloc, which slows allocation-heavy code
+    gc.collect()
+    started = time.perf_counter()
+    rows = load(snapshots)
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    aggregate(rows)
+    aggregate_seconds = time.perf_counter() - started
+
+    del rows
+    gc.collect()
+    tracemalloc.start()
+    rows = load(snapshots)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return load_seconds, retained, aggregate_seconds
+
+
+def main(count):
+    random.seed(1)
+    snapshots = make_snapshots(count)
+    print(f"{count} transactions")
+    print(f"{'rows':<28} {'load s':>8} {'retained MiB':>13} {'bytes/row':>10} {'aggregate s':>12}")
+    for label, load, aggregate in (('before: to_dict() dicts', load_dicts, aggregate_dicts),
+                                   ('after: Transaction records', load_records, aggregate_records)):
+        load_seconds, retained, aggregate_seconds = measure(snapshots, load, aggregate)
+        print(f"{label:<28} {load_seconds:>8.2f} {retained / 2**20:>13.1f} "
+              f"{retained / count:>10.0f} {aggregate_seconds:>12.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
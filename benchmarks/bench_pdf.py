@@ -0,0 +1,97 @@
+"""Compare the streaming PDF writer with the old HTML -> wkhtmltopdf path.
+
+Usage: python benchmarks/bench_pdf.py [rows ...]   (default: 1000 10000 100000)
+
+Reports wall time, peak Python heap (tracemalloc) and output size. The HTML
+path needs the ``wkhtmltopdf`` binary on PATH; without it only the template
+render is timed.
+"""
+from datetime import datetime, timedelta
+import os
+import random
+import shutil
+import sys
+import time
+import tracemalloc
+
+# Importing app.* runs the app package; the in-memory backend needs no credentials
+os.environ.setdefault('URS_BACKEND', 'memory')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment, FileSystemLoader
+
+from app.models import Vendor
+from app.pdf import TransactionReportPDF
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'templates')
+VENDOR = Vendor('bench-vendor', 'Benchmark Vendor', 'bench@example.com', 'medium')
+
+
+def generate_rows(count):
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        amount = round(random.uniform(20, 2000), 2)
+        yield {
+            'id': f'txn{i:017d}',
+            'amount': amount,
+            'points_earned': round(amount * 0.15, 2),
+            'points_redeemed': round(random.choice([0, 0, amount * 0.1]), 2),
+            'timestamp': start + timedelta(seconds=37 * i),
+        }
+
+
+class CountingSink:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def streaming_pdf(count):
+    sink = CountingSink()
+    report = TransactionReportPDF(sink.write, VENDOR)
+    for row in generate_rows(count):
+        report.add_row(row['id'], row['amount'], row['points_earned'],
+                       row['points_redeemed'], row['timestamp'])
+    report.close()
+    return sink.size
+
+
+def html_pdf(count, wkhtmltopdf):
+    env = Environment(loader=FileSystemLoader(TEMPLATES))
+    # The template needs every row up front, so the whole list is materialized
+    html = env.get_template('export_pdf.html').render(
+        vendor=VENDOR, transactions=list(generate_rows(count)), datetime=datetime)
+    if not wkhtmltopdf:
+        return len(html.encode('utf-8'))
+    import pdfkit
+    pdf = pdfkit.from_string(html, False, options={'page-size': 'A4', 'encoding': 'UTF-8', 'quiet': ''},
+                             configuration=pdfkit.configuration(wkhtmltopdf=wkhtmltopdf))
+    return len(pdf)
+
+
+def main(counts):
+    wkhtmltopdf = shutil.which('wkhtmltopdf')
+    html_label = 'html+wkhtmltopdf' if wkhtmltopdf else 'html render only (wkhtmltopdf not found)'
+    print(f"{'rows':>8}  {'renderer':<42} {'seconds':>9} {'peak MiB':>9} {'KiB out':>9}")
+    for count in counts:
+        random.seed(count)
+        for label, fn in (('streaming pdf', lambda: streaming_pdf(count)),
+                          (html_label, lambda: html_pdf(count, wkhtmltopdf))):
+            elapsed, peak, size = measure(fn)
+            print(f"{count:>8}  {label:<42} {elapsed:>9.2f} {peak / 2**20:>9.1f} {size / 1024:>9.0f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,112 @@
+"""Hammer one customer's wallet from many threads against the in-memory store.
+
+Usage: python benchmarks/bench_redemption_concurrency.py [--threads N] [--sales N] [--latency SECONDS]
+
+Runs the transactional checkout (app.redemption) and the old read-modify-write
+flow side by side. For each it checks that the final wallet balance equals
+the opening balance replayed through the ledger. The script exits non-zero
+if the transactional path loses an update or leaves an orphaned ledger row.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import math
+import os
+import sys
+import time
+
+# Importing app.* runs the app package; the in-memory backend needs no credentials
+os.environ.setdefault('URS_BACKEND', 'memory')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import customers, redemption, wallets
+from app.firestore_memory import MemoryClient
+
+PHONE = '9876543210'
+OPENING_BALANCE = 500.0
+POLICY = {
+    'vendor_id': 'bench-vendor',
+    'threshold_amount': 100,
+    'earn_percentage_min': 10,
+    'earn_percentage_max': 15,
+    'redeem_percentage': 10,
+    'can_redeem': True
+}
+
+
+def seed(db):
+    db.collection('customers').document('bench-customer').set({
+        'name': 'Bench Customer',
+        'email': 'bench@example.com',
+        'phone': PHONE,
+        'wallet_balance': OPENING_BALANCE
+    })
+
+
+def legacy_checkout(db, bill_amount):
+    # The pre-transaction flow: query, compute client-side, then two writes
+    customer_doc = db.collection('customers').where('phone', '==', PHONE).limit(1).get()[0]
+    wallet_balance = float(customer_doc.to_dict().get('wallet_balance', 0))
+    discount, final_bill, points_earned = redemption.compute_redemption(wallet_balance, bill_amount, POLICY)
+    customer_doc.reference.update({'wallet_balance': wallet_balance - discount + points_earned})
+    db.collection('transactions').add({
+        'vendor_id': POLICY['vendor_id'],
+        'customer_id': customer_doc.id,
+        'amount': bill_amount,
+        'points_earned': points_earned,
+        'points_redeemed': discount,
+        'timestamp': datetime.utcnow()
+    })
+
+
+def atomic_checkout(db, bill_amount):
+    # Mostly served from the shared snapshot cache, like tills after check_customer
+    customer = customers.find_customer(db, PHONE)
+    redemption.redeem(db, customer, POLICY['vendor_id'], bill_amount, POLICY, max_attempts=50)
+
+
+def run(name, checkout, threads, sales, latency):
+    db = MemoryClient(latency=latency)
+    seed(db)
+    customers.invalidate(PHONE)
+    bills = [50.0 + (i % 7) * 25 for i in range(threads * sales)]
+    failures = 0
+
+    def worker(bill):
+        nonlocal failures
+        try:
+            checkout(db, bill)
+        except redemption.RedemptionContention:
+            failures += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, bills))
+    elapsed = time.perf_counter() - started
+
+    ledger = [doc.to_dict() for doc in db.collection('transactions').stream()]
+    expected = OPENING_BALANCE + sum(t['points_earned'] - t['points_redeemed'] for t in ledger)
+    # The legacy field plus every wallet shard
+    actual = wallets.read(db, db.collection('customers').document('bench-customer'))[1].balance
+    consistent = math.isclose(expected, actual, abs_tol=1e-6)
+
+    print(f"{name:<18} checkouts={len(bills):<5} committed={len(ledger):<5} gave_up={failures:<4} "
+          f"wallet={actual:>10.2f} ledger_replay={expected:>10.2f} "
+          f"{'consistent' if consistent else 'LOST UPDATES'}  {len(bills) / elapsed:>7.1f} checkouts/s")
+    return consistent and len(ledger) + failures == len(bills)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--sales', type=int, default=25, help='checkouts per thread')
+    parser.add_argument('--latency', type=float, default=0.001, help='simulated seconds per round trip')
+    args = parser.parse_args()
+
+    run('read-modify-write', legacy_checkout, args.threads, args.sales, args.latency)
+    ok = run('transactional', atomic_checkout, args.threads, args.sales, args.latency)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
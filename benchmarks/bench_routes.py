@@ -0,0 +1,211 @@
+"""Benchmark the hot routes against a seeded in-memory store.
+
+Usage: python benchmarks/bench_routes.py [--vendors N] [--customers N]
+       [--transactions N] [--days N] [--requests N] [--latency SECONDS]
+
+Runs the real Flask app with ``URS_BACKEND=memory`` through its test client
+and reports latency percentiles and Firestore round trips, document reads
+and writes per request for each route. No network access is needed.
+``--latency`` adds a simulated delay to every Firestore round trip.
+"""
+from datetime import datetime, timedelta
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+os.environ['URS_BACKEND'] = 'memory'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+from app import app, passwords, repos, routes
+from app import customers, policies
+
+PASSWORD = 'bench-password'
+
+
+def seed(db, vendor_count, customer_count, transaction_count, days, bcrypt_rounds):
+    """Write a synthetic dataset straight into the store; returns vendor ids and phones."""
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds)).decode('utf-8')
+    batch = db.batch()
+    pending = 0
+
+    def add(ref, data):
+        nonlocal batch, pending
+        batch.set(ref, data)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    vendor_ids = []
+    for i in range(vendor_count):
+        vendor_id = f'vendor{i:04d}'
+        vendor_type = ('small', 'medium', 'large')[i % 3]
+        add(db.collection('vendors').document(vendor_id), {
+            'name': f'Vendor {i}',
+            'email': f'vendor{i}@example.com',
+            'password': password_hash,
+            'vendor_type': vendor_type
+        })
+        add(db.collection('vendor_policies').document(vendor_id), policies.build_policy(vendor_id, vendor_type))
+        vendor_ids.append(vendor_id)
+
+    phones = []
+    for i in range(customer_count):
+        customer_id = f'customer{i:07d}'
+        phone = f'9{i:09d}'
+        add(db.collection('customers').document(customer_id), {
+            'name': f'Customer {i}',
+            'email': f'customer{i}@example.com',
+            'phone': phone,
+            'wallet_balance': round(random.uniform(0, 500), 2)
+        })
+        add(db.collection(customers.PHONE_INDEX_COLLECTION).document(phone), {'customer_id': customer_id})
+        phones.append(phone)
+
+    now = datetime.utcnow()
+    for i in range(transaction_count):
+        amount = round(random.uniform(20, 2000), 2)
+        add(db.collection('transactions').document(f'txn{i:09d}'), {
+            'vendor_id': random.choice(vendor_ids),
+            'customer_id': f'customer{random.randrange(customer_count):07d}',
+            'amount': amount,
+            'points_earned': round(amount * 0.15, 2),
+            'points_redeemed': 0,
+            'timestamp': now - timedelta(seconds=random.uniform(0, days * 86400))
+        })
+
+    if pending:
+        batch.commit()
+    repos.rollups.backfill()
+    return vendor_ids, phones
+
+
+def logged_in_client(vendor_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['vendor_id'] = vendor_id
+    return client
+
+
+def scenarios(vendor_ids, phones):
+    def login(i):
+        client = app.test_client()
+        return [client.post('/login', data={'email': f'vendor{i % len(vendor_ids)}@example.com',
+                                            'password': PASSWORD})]
+
+    def dashboard(i):
+        return [logged_in_client(vendor_ids[i % len(vendor_ids)]).get('/dashboard')]
+
+    def dashboard_cold(i):
+        routes.dashboard_cache.clear()
+        return dashboard(i)
+
+    def analytics(i):
+        return [logged_in_client(vendor_ids[i % len(vendor_ids)]).get('/api/analytics?days=30')]
+
+    def analytics_year(i):
+        return [logged_in_client(vendor_ids[i % len(vendor_ids)]).get('/api/analytics?days=365')]
+
+    def transactions(i):
+        return [logged_in_client(vendor_ids[i % len(vendor_ids)]).get('/api/transactions?days=7')]
+
+    def checkout(i):
+        client = logged_in_client(vendor_ids[i % len(vendor_ids)])
+        phone = random.choice(phones)
+        return [client.post('/check_customer', data={'phone': phone}),
+                client.post('/apply_discount', data={'phone': phone, 'bill_amount': '250'})]
+
+    def export_stream(i):
+        return [logged_in_client(vendor_ids[i % len(vendor_ids)]).get('/api/export?format=csv&stream=1')]
+
+    def revalidate(url):
+        # A dashboard refetching with no new sales sends the ETag it already has
+        etags = {vendor_id: logged_in_client(vendor_id).get(url).headers['ETag'] for vendor_id in vendor_ids}
+
+        def scenario(i):
+            vendor_id = vendor_ids[i % len(vendor_ids)]
+            return [logged_in_client(vendor_id).get(url, headers={'If-None-Match': etags[vendor_id]})]
+        return scenario
+
+    def export_job(i):
+        return [logged_in_client(vendor_ids[i % len(vendor_ids)]).get('/api/export?format=csv')]
+
+    return [
+        ('login', login),
+        ('dashboard', dashboard),
+        ('dashboard (cold cache)', dashboard_cold),
+        ('analytics 30d', analytics),
+        ('analytics 365d', analytics_year),
+        ('transactions 7d', transactions),
+        ('analytics 365d (304)', revalidate('/api/analytics?days=365')),
+        ('transactions 7d (304)', revalidate('/api/transactions?days=7')),
+        ('check + apply_discount', checkout),
+        ('export csv (streamed)', export_stream),
+        ('export csv (job submit)', export_job),
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vendors', type=int, default=10)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--transactions', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=90, help='spread transactions over this many days')
+    parser.add_argument('--requests', type=int, default=30, help='requests per scenario')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per round trip')
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Logins should not rehash the seeded passwords
+    passwords.ROUNDS = args.bcrypt_rounds
+    db = repos.db
+    started = time.perf_counter()
+    vendor_ids, phones = seed(db, args.vendors, args.customers, args.transactions, args.days, args.bcrypt_rounds)
+    print(f"Seeded {args.vendors} vendors, {args.customers} customers, {args.transactions} transactions "
+          f"in {time.perf_counter() - started:.1f}s\n")
+    db.latency = args.latency
+
+    print(f"{'scenario':<26} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'trips/req':>10} "
+          f"{'reads/req':>10} {'writes/req':>11}")
+    # The worker's first request starts the policy cache warm-up; let it finish
+    app.test_client().get('/login')
+    for thread in threading.enumerate():
+        if thread.name == 'policy-warm':
+            thread.join()
+
+    for name, scenario in scenarios(vendor_ids, phones):
+        # One untimed request first, so lazy imports are not counted
+        for response in scenario(args.requests):
+            response.get_data()
+        timings = []
+        db.reset_stats()
+        for i in range(args.requests):
+            request_started = time.perf_counter()
+            for response in scenario(i):
+                response.get_data()
+                if response.status_code >= 400:
+                    raise SystemExit(f"{name}: HTTP {response.status_code}")
+            timings.append((time.perf_counter() - request_started) * 1000)
+        stats = db.stats
+        print(f"{name:<26} {statistics.median(timings):>8.1f} {percentile(timings, 95):>8.1f} "
+              f"{max(timings):>8.1f} {stats['round_trips'] / args.requests:>10.1f} "
+              f"{stats['reads'] / args.requests:>10.1f} {stats['writes'] / args.requests:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Cold-start benchmark: import time and time to first request.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--root PATH]
+
+Each run starts a fresh interpreter with ``URS_BACKEND=memory`` and times:
+
+* import: ``import index`` (what a gunicorn worker does at boot);
+* first page: the first ``GET /login``, which needs no Firestore;
+* first data request: the first logged-in ``/dashboard``, which creates the
+  client;
+* first analytics: the first ``/api/analytics?days=30``.
+
+It also lists which heavy modules were loaded by the import alone. ``--root``
+points at another checkout, e.g. an older revision extracted with
+``git archive``, to compare before and after.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'bcrypt', 'pdfkit', 'grpc', 'google.cloud.firestore', 'firebase_admin']
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+
+app = index.app
+db = sys.modules['firebase_config'].get_db
+client = app.test_client()
+client.get('/login')
+first_page = time.perf_counter()
+
+vendor_ref = db().collection('vendors').document('bench-vendor')
+vendor_ref.set({'name': 'Bench', 'email': 'bench@example.com', 'password': 'x', 'vendor_type': 'small'})
+with client.session_transaction() as session:
+    session['vendor_id'] = 'bench-vendor'
+before_data = time.perf_counter()
+client.get('/dashboard')
+first_data = time.perf_counter()
+client.get('/api/analytics?days=30')
+first_analytics = time.perf_counter()
+
+print(json.dumps({
+    'import': imported - started,
+    'first page': first_page - imported,
+    'first data request': first_data - before_data,
+    'first analytics': first_analytics - first_data,
+    'loaded': loaded,
+}))
+'''
+
+
+def run_once(root):
+    env = dict(os.environ, URS_BACKEND='memory', PYTHONPATH=root)
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + CHILD
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--root', default=ROOT, help='app checkout to measure')
+    args = parser.parse_args()
+
+    results = [run_once(os.path.abspath(args.root)) for _ in range(args.runs)]
+    print(f"{args.runs} fresh interpreters, median of each phase")
+    for phase in ('import', 'first page', 'first data request', 'first analytics'):
+        print(f"  {phase:<20} {statistics.median(r[phase] for r in results) * 1000:>8.1f} ms")
+    print(f"  heavy modules loaded by import: {', '.join(results[0]['loaded']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""gunicorn entry point for ``bench_load.py --serve``.
+
+Loaded with ``--preload``: the in-memory store is seeded once in the master,
+and every worker starts from a copy of it after the fork.
+"""
+import os
+
+os.environ['URS_BACKEND'] = 'memory'
+
+from index import app  # noqa: E402
+from app import repos, seeding  # noqa: E402
+
+seeding.seed(repos.db,
+             int(os.environ.get('URS_LOAD_VENDORS', 50)),
+             int(os.environ.get('URS_LOAD_CUSTOMERS', 20000)),
+             int(os.environ.get('URS_LOAD_TRANSACTIONS', 200000)),
+             seed=int(os.environ.get('URS_LOAD_SEED', 1)),
+             progress=lambda message: None)
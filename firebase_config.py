@@ -1,19 +1,26 @@
 import os
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
+import sys
+import threading
 import atexit
 
+# The Firestore client is created on first use in each process, never at
+# import time: a gRPC channel opened before gunicorn forks its workers is not
+# safe to use in the children, so every worker builds its own after fork.
 _db = None
+_db_pid = None
+_db_lock = threading.Lock()
 
 def initialize_firebase():
-    global _db
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     try:
         if not firebase_admin._apps:
             # Check for environment variable first (production)
             # If not found, fall back to local file (development)
             cred_json = os.environ.get("FIREBASE_CREDENTIALS")
-            
+
             if cred_json:
                 # Production: load from environment variable
                 cred_dict = json.loads(cred_json)
@@ -24,28 +31,57 @@ def initialize_firebase():
                     raise FileNotFoundError(f"Firebase credentials file not found at {firebase_credentials_path}")
                 with open(firebase_credentials_path, 'r') as file:
                     cred_dict = json.load(file)
-            
+
             cred = credentials.Certificate(cred_dict)
             firebase_admin.initialize_app(cred)
-        
-        _db = firestore.client()
-        return _db
+
+        return firestore.client()
 
     except Exception as e:
         print(f"Firebase initialization error: {e}")
         raise
 
 def get_db():
-    global _db
-    if _db is None:
-        _db = initialize_firebase()
+    global _db, _db_pid
+    if _db is None or _db_pid != os.getpid():
+        with _db_lock:
+            if _db is None or _db_pid != os.getpid():
+                # URS_BACKEND=memory runs the app on an in-process store, e.g. for
+                # benchmarks and local work without credentials
+                if os.environ.get("URS_BACKEND", "firestore") == "memory":
+                    from app.firestore_memory import MemoryClient
+                    _db = MemoryClient()
+                else:
+                    _db = initialize_firebase()
+                # Count every RPC for /metrics, and audit queries if enabled
+                from app import metrics, query_audit
+                metrics.instrument_client(_db)
+                query_audit.instrument_client(_db)
+                _db_pid = os.getpid()
     return _db
 
+def _forget_client():
+    # Runs in a freshly forked child: drop the parent's client, and the
+    # firebase app that caches it, so get_db() builds new ones here
+    global _db, _db_pid
+    if os.environ.get("URS_BACKEND", "firestore") == "memory":
+        # The in-memory store has no channel; the child keeps its copy
+        _db_pid = os.getpid()
+        return
+    if _db is not None and "firebase_admin" in sys.modules:
+        import firebase_admin
+        if firebase_admin._apps:
+            firebase_admin.delete_app(firebase_admin.get_app())
+    _db = None
+    _db_pid = None
+
 def cleanup():
     global _db
-    if _db:
-        firebase_admin.delete_app(firebase_admin.get_app())
-        _db = None
+    if _db is not None and "firebase_admin" in sys.modules:
+        import firebase_admin
+        if firebase_admin._apps:
+            firebase_admin.delete_app(firebase_admin.get_app())
+    _db = None
 
+os.register_at_fork(after_in_child=_forget_client)
 atexit.register(cleanup)
-db = initialize_firebase()
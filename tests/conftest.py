@@ -0,0 +1,15 @@
+"""Run the app against the in-memory Firestore, with scratch directories.
+
+Set before ``app`` is first imported: the package reads these at import.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['URS_BACKEND'] = 'memory'
+_scratch = tempfile.mkdtemp(prefix='urs-tests-')
+for name in ('URS_METRICS_DIR', 'URS_EXPORT_DIR', 'URS_EVENTS_DIR', 'URS_ASSET_DIR'):
+    os.environ.setdefault(name, os.path.join(_scratch, name[4:].lower()))
+sys.path.insert(0, ROOT)
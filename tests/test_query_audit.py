@@ -0,0 +1,36 @@
+"""Every query the routes run must be served by an index in firestore.indexes.json."""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+AUDIT_SCRIPT = os.path.join(ROOT, 'benchmarks', 'audit_queries.py')
+INDEXES_FILE = os.path.join(ROOT, 'firestore.indexes.json')
+
+
+def run_audit(indexes_file):
+    # A fresh interpreter: URS_QUERY_AUDIT is read when app.query_audit is imported
+    env = dict(os.environ, URS_FIRESTORE_INDEXES=indexes_file)
+    return subprocess.run([sys.executable, AUDIT_SCRIPT], env=env, cwd=ROOT,
+                          capture_output=True, text=True, timeout=300)
+
+
+def test_every_query_has_a_declared_index():
+    result = run_audit(INDEXES_FILE)
+    assert 'MISSING INDEX' not in result.stdout, result.stdout
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_audit_fails_on_a_missing_index(tmp_path):
+    with open(INDEXES_FILE) as f:
+        declared = json.load(f)
+    # Drop one index the routes need
+    declared['indexes'] = declared['indexes'][1:]
+    indexes_file = tmp_path / 'firestore.indexes.json'
+    indexes_file.write_text(json.dumps(declared))
+
+    result = run_audit(str(indexes_file))
+    assert result.returncode == 1, result.stdout + result.stderr
+    assert 'MISSING INDEX' in result.stdout
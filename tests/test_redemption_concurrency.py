@@ -0,0 +1,79 @@
+"""Many tills checking out one customer at once must keep wallet and ledger in step."""
+from concurrent.futures import ThreadPoolExecutor
+import math
+
+from app import counters, customers, redemption, wallets
+from app.firestore_memory import MemoryClient
+
+PHONE = '9876543210'
+CUSTOMER_ID = 'test-customer'
+OPENING_BALANCE = 500.0
+POLICY = {
+    'vendor_id': 'test-vendor',
+    'threshold_amount': 100,
+    'earn_percentage_min': 10,
+    'earn_percentage_max': 15,
+    'redeem_percentage': 10,
+    'can_redeem': True
+}
+THREADS = 16
+CHECKOUTS = 400
+
+
+def wallet_parts(store):
+    """The customer's legacy balance and shard balances as committed; call with store.lock held."""
+    customer_path = f'customers/{CUSTOMER_ID}'
+    parts = [float(store.docs.get(customer_path, {}).get('wallet_balance') or 0)]
+    for index in range(counters.WALLET_SHARDS):
+        shard = store.docs.get(f'{customer_path}/{wallets.SHARDS_COLLECTION}/{index}')
+        if shard is not None:
+            parts.append(float(shard.get('balance') or 0))
+    return parts
+
+
+def test_concurrent_checkouts_match_ledger_and_never_overdraw():
+    db = MemoryClient(latency=0.001)
+    db.collection('customers').document(CUSTOMER_ID).set({
+        'name': 'Test Customer',
+        'email': 'test@example.com',
+        'phone': PHONE,
+        'wallet_balance': OPENING_BALANCE
+    })
+    customers.invalidate(PHONE)
+
+    # Check the wallet after every commit, not just at the end
+    store = db._store
+    apply = store.apply
+    committed_wallets = []
+
+    def checked_apply(writes, expected_versions=None):
+        with store.lock:
+            results = apply(writes, expected_versions)
+            committed_wallets.append(wallet_parts(store))
+            return results
+
+    store.apply = checked_apply
+
+    def checkout(bill_amount):
+        # Tills mostly hold the check screen's cached snapshot, which goes stale
+        customer = customers.find_customer(db, PHONE)
+        try:
+            redemption.redeem(db, customer, POLICY['vendor_id'], bill_amount, POLICY, max_attempts=50)
+        except redemption.RedemptionContention:
+            return False
+        return True
+
+    bills = [50.0 + (i % 7) * 25 for i in range(CHECKOUTS)]
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        succeeded = sum(pool.map(checkout, bills))
+
+    ledger = [doc.to_dict() for doc in db.collection('transactions').stream()]
+    assert len(ledger) == succeeded
+    assert sum(t['points_redeemed'] for t in ledger) > 0
+
+    expected = OPENING_BALANCE + sum(t['points_earned'] - t['points_redeemed'] for t in ledger)
+    balance = wallets.read(db, db.collection('customers').document(CUSTOMER_ID))[1].balance
+    assert math.isclose(balance, expected, abs_tol=1e-6)
+
+    overdrawn = [parts for parts in committed_wallets if min(parts) < -1e-9 or sum(parts) < -1e-9]
+    assert not overdrawn